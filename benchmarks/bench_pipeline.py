@@ -0,0 +1,340 @@
+"""
+오프라인 end-to-end 벤치마크.
+
+Azure OpenAI / Qdrant / MariaDB / 네트워크 없이 정책 생성 파이프라인의 지연과 처리량을 측정한다.
+
+- LLM: ScriptedChatModel (지연 시간 설정 가능한 fake 모델)
+  --fake-openai N 이면 같은 모델을 OpenAI 호환 fake 서버 N 개로 띄우고 LLM gateway 를 거쳐 호출
+- MCP: InProcessMCPClient (FastMCP 서버를 메모리 스트림으로 직접 연결)
+- Qdrant: :memory: 모드, MariaDB: FakePolicyRepository
+- OPA: 실제 opa 바이너리 (OPA_BINARY), 기본은 CLI backend
+
+사용 예:
+    python benchmarks/bench_pipeline.py --scenario generate --max-concurrency 8 --requests 32 --output result.json
+    python benchmarks/bench_pipeline.py --scenario opa_check --output new.json --compare result.json
+    python benchmarks/bench_pipeline.py --scenario generate --llm-cache record --llm-cache-dir .llm-cache
+    python benchmarks/bench_pipeline.py --scenario generate --llm-cache replay --llm-cache-dir .llm-cache
+    python benchmarks/bench_pipeline.py --scenario generate --fake-openai 3 --fake-rpm 60 --fake-fail-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ["generate", "test", "opa_check", "opa_test"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the OPA policy pipeline")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append",
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--concurrency", default=None,
+                        help="Comma separated concurrency levels (default: 1,2,4,... up to --max-concurrency)")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=2, help="Warm-up requests per scenario (not measured)")
+    parser.add_argument("--policies", type=int, default=200, help="Synthetic policies in the fake repository")
+    parser.add_argument("--invalid-rate", type=float, default=0.3, help="Share of first drafts that fail opa check")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="Fake LLM latency before the first token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Fake LLM latency between tokens (s)")
+    parser.add_argument("--opa-backend", choices=["cli", "server"], default="cli")
+    parser.add_argument("--result-cache", action="store_true", help="Keep the opa result cache enabled")
+    parser.add_argument("--use-cache", action="store_true", help="Enable the semantic policy cache in generate")
+    parser.add_argument("--candidates", type=int, default=1, help="Hedged candidates per generate request")
+    parser.add_argument("--llm-cache", choices=["off", "readwrite", "record", "replay"], default="off",
+                        help="LLM response cache mode (record once, then replay for a deterministic offline run)")
+    parser.add_argument("--llm-cache-dir", help="Directory for --llm-cache (default: LLM_CACHE_DIR)")
+    parser.add_argument("--fake-openai", type=int, default=0,
+                        help="Serve the fake LLM from N local OpenAI-compatible servers behind the LLM gateway")
+    parser.add_argument("--fake-rpm", type=int, default=0, help="Requests per minute per fake server (0 = unlimited)")
+    parser.add_argument("--fake-tpm", type=int, default=0, help="Tokens per minute per fake server (0 = unlimited)")
+    parser.add_argument("--fake-fail-rate", type=float, default=0.0,
+                        help="Share of fake server streams that disconnect halfway")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative regression threshold for --compare (default 0.10 = 10%%)")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """서비스 모듈 import 전에 설정해야 하는 환경 변수"""
+    os.environ.setdefault("QDRANT_LOCATION", ":memory:")
+    os.environ.setdefault("EMBEDDER", "hashing")
+    if args.use_cache:
+        # 벤치마크는 같은 요청 문장을 반복하므로 hashing 임베딩으로도 semantic cache 를 켬
+        os.environ.setdefault("SEMANTIC_CACHE_ALLOW_LEXICAL", "true")
+    os.environ["OPA_CHECK_BACKEND"] = args.opa_backend
+    if args.llm_cache_dir:
+        os.environ["LLM_CACHE_DIR"] = args.llm_cache_dir
+    if not args.result_cache:
+        os.environ["RESULT_CACHE_SIZE"] = "0"
+        os.environ["RESULT_CACHE_DIR"] = ""
+
+    sys.path.insert(0, os.path.join(ROOT, "mcp-server"))
+    sys.path.insert(0, os.path.join(ROOT, "mcp-client"))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# ===================================
+# 통계
+# ===================================
+def percentile(values: list, pct: float) -> float:
+    """nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(pct / 100 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def summarize(scenario: str, concurrency: int, latencies: list, errors: int, elapsed: float, stages: dict) -> dict:
+    count = len(latencies) + errors
+    ms = [latency * 1000 for latency in latencies]
+
+    # 요청 1건당 평균 구간 시간 (ms)
+    llm = stages.get("llm", 0.0)
+    mcp_client = stages.get("mcp_client", 0.0)
+    mcp_server = stages.get("mcp_server", 0.0)
+    opa = stages.get("opa_subprocess", 0.0)
+    total = sum(latencies)
+    split = {
+        "llm": llm,
+        "mcp_transport": max(mcp_client - mcp_server, 0.0),
+        "opa_subprocess": opa,
+        "server_other": max(mcp_server - opa, 0.0),
+    }
+    split["client_other"] = max(total - sum(split.values()), 0.0)
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": count,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ms, 50), 3),
+            "p95": round(percentile(ms, 95), 3),
+            "p99": round(percentile(ms, 99), 3),
+            "mean": round(sum(ms) / len(ms), 3) if ms else 0.0,
+            "max": round(max(ms), 3) if ms else 0.0,
+        },
+        "split_ms": {stage: round(seconds * 1000 / max(count, 1), 3) for stage, seconds in split.items()},
+    }
+
+# ===================================
+# 시나리오
+# ===================================
+def build_requests(scenario: str, manager, count: int, seed: int, use_cache: bool = False, candidates: int = 1):
+    """scenario 별로 요청 1건을 수행하는 coroutine factory 목록"""
+    from fakes import VALID_POLICY, VALID_TEST_CODE
+
+    subjects = ["관리자", "인사팀 매니저", "일반 사용자", "감사 담당자", "외부 협력사"]
+    actions = ["조회", "수정", "삭제", "승인", "다운로드"]
+    resources = ["급여 명세서", "계약서", "티켓", "보고서", "사원 정보"]
+
+    def generate(i):
+        text = (f"{subjects[(i + seed) % 5]}는 근무시간 중 {resources[(i * 3) % 5]}를 "
+                f"{actions[(i * 7) % 5]}할 수 있는 정책을 만들어줘. (#{i})")
+        return manager.generate_policy(text, use_cache=use_cache, candidates=candidates)
+
+    async def expect_success(result):
+        result = await result
+        ok = result.get("status") == "success" if result and "status" in result else \
+            result and (result.get("success") or result.get("is_valid"))
+        if not ok:
+            raise RuntimeError(f"unsuccessful result: {result}")
+        return result
+
+    factories = {
+        "generate": lambda i: expect_success(generate(i)),
+        "test": lambda i: expect_success(manager.test_policy(VALID_POLICY)),
+        "opa_check": lambda i: expect_success(manager.call_tool(
+            "opa_check", {"rego_code": VALID_POLICY.replace("allow", f"allow_{i}")})),
+        "opa_test": lambda i: manager.call_tool(
+            "opa_test", {"policy_code": VALID_POLICY, "test_code": VALID_TEST_CODE + f"\n# {i}\n"}),
+    }
+    return [lambda i=i: factories[scenario](i) for i in range(count)]
+
+
+async def run_level(scenario: str, manager, concurrency: int, args) -> dict:
+    from fakes import timer
+
+    requests = build_requests(scenario, manager, args.requests, args.seed + concurrency, args.use_cache, args.candidates)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+
+    async def run_one(factory):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await factory()
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(str(e))
+
+    timer.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*[run_one(factory) for factory in requests])
+    elapsed = time.perf_counter() - started
+
+    if errors:
+        print(f"  ! {len(errors)} errors, first: {errors[0][:200]}")
+    return summarize(scenario, concurrency, latencies, len(errors), elapsed, dict(timer.totals))
+
+
+async def run(args) -> dict:
+    import mcp_server as server
+    import service.bundle
+    import service.policy_changes
+    from service.executor import get_executor
+    from service.opa import get_opa_version
+    from mcp_client import MCPClientManager
+    from llm_gateway import build_gateway
+    from fakes import FakePolicyRepository, InProcessMCPClient, ScriptedChatModel, FakeOpenAIServer, timer
+
+    # MariaDB 대신 메모리 repository, opa 프로세스 실행 시간 측정
+    fake_repository = FakePolicyRepository.synthetic(args.policies, args.seed)
+    service.policy_changes.repository = fake_repository
+    service.bundle.repository = fake_repository
+    executor = get_executor()
+    executor.run = timer.wrap("opa_subprocess", executor.run)
+
+    index = await server.get_policy_indexer().sync(full=True)
+    print(f"policy index: {index}")
+
+    def scripted(seed):
+        return ScriptedChatModel(
+            invalid_rate=args.invalid_rate,
+            first_token_latency=args.first_token_latency,
+            token_latency=args.token_latency,
+            seed=seed,
+        )
+
+    # --fake-openai: deployment 마다 rate limit 을 거는 fake 서버 + 실제 HTTP 를 쓰는 LLM gateway
+    # (temperature 0: 스트림이 끊기면 다른 deployment 로 이어 받음)
+    fake_servers = [
+        await FakeOpenAIServer(scripted(args.seed + i), rpm=args.fake_rpm, tpm=args.fake_tpm,
+                               fail_rate=args.fake_fail_rate, seed=args.seed + i).start()
+        for i in range(args.fake_openai)
+    ]
+    if fake_servers:
+        model = build_gateway([
+            {"name": f"fake-{i}", "kind": "openai", "base_url": fake.base_url, "model": "scripted",
+             "rpm": args.fake_rpm, "tpm": args.fake_tpm, "temperature": 0}
+            for i, fake in enumerate(fake_servers)
+        ])
+    else:
+        model = scripted(args.seed)
+    mcp_client = InProcessMCPClient(server.mcp_server)
+    manager = MCPClientManager(mcp_url="in-process", azure_endpoint="", api_key="", azure_deployment="scripted")
+
+    started = time.perf_counter()
+    await manager.initialize(model=model, mcp_client=mcp_client, llm_cache_mode=args.llm_cache)
+    startup = time.perf_counter() - started
+
+    if args.concurrency:
+        levels = [int(level) for level in args.concurrency.split(",")]
+    else:
+        levels, level = [], 1
+        while level < args.max_concurrency:
+            levels.append(level)
+            level *= 2
+        levels.append(args.max_concurrency)
+
+    results = []
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            for factory in build_requests(scenario, manager, args.warmup, args.seed + 10_000, args.use_cache, args.candidates):
+                try:
+                    await factory()
+                except Exception as e:
+                    print(f"  ! warm-up error: {e}")
+
+            for concurrency in levels:
+                summary = await run_level(scenario, manager, concurrency, args)
+                results.append(summary)
+                latency = summary["latency_ms"]
+                print(f"{scenario:<10} c={concurrency:<3} p50={latency['p50']:>9.1f}ms p95={latency['p95']:>9.1f}ms "
+                      f"p99={latency['p99']:>9.1f}ms {summary['throughput_rps']:>8.2f} req/s  split={summary['split_ms']}")
+    finally:
+        await manager.close()
+        await mcp_client.close()
+        for fake in fake_servers:
+            await fake.close()
+
+    llm_gateway = None
+    if fake_servers:
+        llm_gateway = {"deployments": model.stats, "servers": [dict(fake.counts) for fake in fake_servers]}
+        print(f"llm gateway: {llm_gateway}")
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "opa_version": await get_opa_version(),
+            "opa_backend": args.opa_backend,
+            "startup_s": round(startup, 4),
+            "llm_gateway": llm_gateway,
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "results": results,
+    }
+
+# ===================================
+# 결과 비교
+# ===================================
+def compare(current: dict, baseline: dict, threshold: float) -> int:
+    """(scenario, concurrency) 별 p50/p95/p99/throughput 변화. threshold 이상 나빠진 항목 수 반환"""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = 0
+
+    print(f"\n{'scenario':<10} {'c':>3}  {'metric':<10} {'baseline':>12} {'current':>12} {'change':>9}")
+    for result in current["results"]:
+        old = previous.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+
+        metrics = [(f"p{p}", old["latency_ms"][f"p{p}"], result["latency_ms"][f"p{p}"], False) for p in (50, 95, 99)]
+        metrics.append(("rps", old["throughput_rps"], result["throughput_rps"], True))
+        for name, before, after, higher_is_better in metrics:
+            change = (after - before) / before if before else 0.0
+            regressed = (-change if higher_is_better else change) > threshold
+            regressions += regressed
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{result['scenario']:<10} {result['concurrency']:>3}  {name:<10} "
+                  f"{before:>12.2f} {after:>12.2f} {change:>+8.1%}{flag}")
+
+    print(f"\n{regressions} regression(s) over {threshold:.0%}")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+
+    report = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
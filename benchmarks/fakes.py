@@ -0,0 +1,356 @@
+import json
+import time
+import random
+import asyncio
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_mcp_adapters.prompts import load_mcp_prompt
+from mcp import types
+from mcp.shared.memory import create_connected_server_and_client_session
+from pydantic import PrivateAttr
+
+# ===================================
+# 구간별 시간 누적
+# ===================================
+class StageTimer:
+    """벤치마크 구간(llm / mcp_client / mcp_server / opa_subprocess)별 누적 시간(초)"""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, stage: str, seconds: float):
+        self.totals[stage] += seconds
+        self.counts[stage] += 1
+
+    def reset(self):
+        self.totals.clear()
+        self.counts.clear()
+
+    def wrap(self, stage: str, func):
+        """async 함수 실행 시간을 stage 에 누적하는 wrapper"""
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+        return timed
+
+
+timer = StageTimer()
+
+# ===================================
+# Scripted LLM
+# ===================================
+VALID_POLICY = """package bench.authz
+
+import rego.v1
+
+default allow := false
+
+allow if input.user.role == "admin"
+
+allow if {
+    input.user.role == "user"
+    input.resource.owner == input.user.id
+}
+"""
+
+# 파싱 에러가 나는 정책 (repair 루프를 태우기 위함)
+INVALID_POLICY = VALID_POLICY.replace('== "admin"', '== "admin" BAD_TOKEN')
+
+VALID_TEST_CODE = """package bench.authz_test
+
+import rego.v1
+
+import data.bench.authz
+
+test_admin_allowed if authz.allow with input as {"user": {"role": "admin"}}
+
+test_guest_denied if not authz.allow with input as {"user": {"role": "guest"}}
+"""
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    AzureChatOpenAI 대신 사용하는 결정적(seed 고정) fake 채팅 모델.
+
+    - rego 생성 프롬프트: invalid_rate 확률로 문법 오류가 있는 정책, 아니면 올바른 정책
+    - repair 프롬프트("[opa check error]" 포함): 항상 올바른 정책
+    - 테스트 생성 프롬프트: 올바른 테스트 코드
+    - agent 호출에서 tool 결과를 받으면 종료 메시지
+
+    first_token_latency / token_latency 로 실제 모델의 응답 지연을 흉내 내며,
+    응답은 chunk_size 글자 단위 토큰으로 스트리밍한다.
+    """
+
+    invalid_rate: float = 0.3
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+    chunk_size: int = 4
+    seed: int = 0
+    _rng: random.Random = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _respond(self, messages) -> AIMessage:
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(content="done")
+
+        prompt = last.content if isinstance(last.content, str) else str(last.content)
+        if "[Rego code]" in prompt and "[opa check error]" not in prompt and "[opa profile]" not in prompt:
+            # test_rego_gen_prompt → 테스트 코드
+            return AIMessage(content=json.dumps({"rego_code": VALID_TEST_CODE}))
+
+        invalid = "[opa check error]" not in prompt and self._rng.random() < self.invalid_rate
+        return AIMessage(content=json.dumps({"rego_code": INVALID_POLICY if invalid else VALID_POLICY}))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError("ScriptedChatModel is async only")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        message = self._respond(messages)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(message.content) / self.chunk_size)
+        timer.add("llm", time.perf_counter() - started)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        message = self._respond(messages)
+        await asyncio.sleep(self.first_token_latency)
+
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[{
+                "name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0
+            }]))
+        else:
+            for start in range(0, len(message.content), self.chunk_size):
+                if start:
+                    await asyncio.sleep(self.token_latency)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=message.content[start:start + self.chunk_size]))
+
+        timer.add("llm", time.perf_counter() - started)
+
+# ===================================
+# Fake OpenAI 호환 서버 (rate limit 시뮬레이션)
+# ===================================
+class FakeOpenAIServer:
+    """
+    OpenAI 호환 chat completions API 를 흉내 내는 로컬 HTTP 서버 (deployment 1개).
+
+    - POST /v1/chat/completions, /openai/deployments/<name>/chat/completions (stream 포함)
+    - 응답 내용과 지연은 ScriptedChatModel 과 같음
+    - 최근 1분 요청 수가 rpm 을, 토큰 수가 tpm 을 넘으면 429 + Retry-After
+    - fail_rate 확률로 스트림 중간에 연결을 끊음 (mid-stream failover 확인용)
+
+    GatewayChatModel 에 {"kind": "openai", "base_url": server.base_url} deployment 로 연결해서 사용한다.
+    """
+
+    def __init__(self, model: ScriptedChatModel, rpm: int = 0, tpm: int = 0, fail_rate: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self.fail_rate = fail_rate
+        self.host = host
+        self.port = port
+        self.counts = defaultdict(int)
+        self._rng = random.Random(seed)
+        self._requests = deque()  # [시각, 토큰 수]
+        self._server = None
+        self._task = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _retry_after(self, tokens: int):
+        """한도를 넘으면 다시 보낼 수 있을 때까지의 시간(초), 아니면 None"""
+        now = time.monotonic()
+        while self._requests and now - self._requests[0][0] >= 60:
+            self._requests.popleft()
+        used = sum(count for _, count in self._requests)
+        if (self.rpm and len(self._requests) >= self.rpm) or (self.tpm and used + tokens > self.tpm):
+            return max(self._requests[0][0] + 60 - now, 0.1) if self._requests else 1.0
+        self._requests.append((now, tokens))
+        return None
+
+    async def _chat(self, request):
+        from starlette.responses import JSONResponse, StreamingResponse
+
+        body = await request.json()
+        prompt = next((m["content"] for m in reversed(body["messages"]) if m["role"] == "user"), "")
+        prompt_tokens = len(prompt) // 4
+        message = self.model._respond([HumanMessage(content=prompt)])
+        completion_tokens = len(message.content) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+
+        retry_after = self._retry_after(usage["total_tokens"])
+        if retry_after is not None:
+            self.counts["rate_limited"] += 1
+            return JSONResponse({"error": {"code": "429", "message": "Rate limit exceeded"}}, status_code=429,
+                                headers={"Retry-After": str(round(retry_after, 3)),
+                                         "retry-after-ms": str(int(retry_after * 1000))})
+        self.counts["accepted"] += 1
+
+        base = {"id": f"chatcmpl-{self.counts['accepted']}", "created": int(time.time()), "model": body.get("model", "fake")}
+        if not body.get("stream"):
+            started = time.perf_counter()
+            await asyncio.sleep(self.model.first_token_latency
+                                + self.model.token_latency * len(message.content) / self.model.chunk_size)
+            timer.add("llm", time.perf_counter() - started)
+            return JSONResponse({**base, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": message.content}
+            }]})
+
+        fail_at = len(message.content) // 2 if self._rng.random() < self.fail_rate else None
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def events():
+            started = time.perf_counter()
+            await asyncio.sleep(self.model.first_token_latency)
+            size = self.model.chunk_size
+            for start in range(0, len(message.content), size):
+                if fail_at is not None and start >= fail_at:
+                    self.counts["dropped"] += 1
+                    raise ConnectionResetError("simulated mid-stream disconnect")
+                if start:
+                    await asyncio.sleep(self.model.token_latency)
+                delta = {"content": message.content[start:start + size]}
+                yield "data: " + json.dumps({**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": None}
+                ]}) + "\n\n"
+            yield "data: " + json.dumps({**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {}, "finish_reason": "stop"}
+            ]}) + "\n\n"
+            if include_usage:
+                yield "data: " + json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}) + "\n\n"
+            yield "data: [DONE]\n\n"
+            timer.add("llm", time.perf_counter() - started)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def start(self):
+        import uvicorn
+        from starlette.applications import Starlette
+        from starlette.routing import Route
+
+        app = Starlette(routes=[
+            Route("/v1/chat/completions", self._chat, methods=["POST"]),
+            Route("/openai/deployments/{deployment}/chat/completions", self._chat, methods=["POST"]),
+        ])
+        self._server = uvicorn.Server(uvicorn.Config(app, host=self.host, port=self.port, log_level="warning"))
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                self._task.result()
+            await asyncio.sleep(0.01)
+        self.port = self._server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            await self._task
+            self._server = None
+
+# ===================================
+# In-process MCP transport
+# ===================================
+class InProcessMCPClient:
+    """
+    MultiServerMCPClient 대신 사용하는 in-process transport.
+
+    FastMCP 서버를 메모리 스트림으로 연결한 실제 ClientSession 을 사용하므로
+    MCP 직렬화/세션 초기화 비용은 그대로 측정되고, 네트워크만 빠진다.
+    실제 클라이언트처럼 session() 마다 새 세션을 만든다.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+        # 서버 측 tool 처리 시간 (transport 시간과 분리하기 위함)
+        handlers = server._mcp_server.request_handlers
+        handlers[types.CallToolRequest] = timer.wrap("mcp_server", handlers[types.CallToolRequest])
+
+    def _timed(self, session):
+        session.call_tool = timer.wrap("mcp_client", session.call_tool)
+        return session
+
+    @asynccontextmanager
+    async def session(self, server_name: str = "opa_tools"):
+        started = time.perf_counter()
+        async with create_connected_server_and_client_session(self.server) as session:
+            timer.add("mcp_client", time.perf_counter() - started)
+            yield self._timed(session)
+
+    async def get_prompt(self, server_name: str, prompt_name: str, arguments: dict = None):
+        async with self.session(server_name) as session:
+            return await load_mcp_prompt(session, prompt_name, arguments=arguments)
+
+    async def close(self):
+        pass
+
+# ===================================
+# In-memory MariaDB stand-in
+# ===================================
+class FakePolicyRepository:
+    """policy 테이블 조회만 흉내 내는 메모리 repository (policy_index / bundle 이 사용하는 메서드만)"""
+
+    def __init__(self, policies: list):
+        self.policies = {policy["policy_id"]: policy for policy in policies}
+
+    @classmethod
+    def synthetic(cls, count: int, seed: int = 0):
+        rng = random.Random(seed)
+        roles = ["admin", "manager", "user", "auditor", "guest"]
+        actions = ["read", "update", "delete", "approve", "export"]
+        resources = ["invoice", "report", "employee record", "contract", "ticket"]
+        base = datetime(2024, 1, 1)
+        policies = []
+        for policy_id in range(1, count + 1):
+            role, action, resource = rng.choice(roles), rng.choice(actions), rng.choice(resources)
+            policies.append({
+                "policy_id": policy_id,
+                "policy_name": f"{role}_{action}_{resource.replace(' ', '_')}_{policy_id}",
+                "description": f"{role} can {action} {resource} during business hours",
+                "api_id": rng.randint(1, 20),
+                "created_by": f"E{rng.randint(10000, 99999)}",
+                "rego_code": VALID_POLICY.replace("bench.authz", f"bench.p{policy_id}").replace('"admin"', f'"{role}"'),
+                "is_active": True,
+                "updated_at": base + timedelta(minutes=policy_id),
+            })
+        return cls(policies)
+
+    async def get_policy_by_id(self, policy_id: int):
+        return self.policies.get(policy_id)
+
+    async def get_policies_updated_since(self, updated_at=None, policy_id=0, limit=500):
+        rows = sorted(self.policies.values(), key=lambda p: (p["updated_at"], p["policy_id"]))
+        if updated_at is not None:
+            rows = [p for p in rows if (p["updated_at"], p["policy_id"]) > (updated_at, policy_id)]
+        return rows[:limit]
+
+    async def iter_policies(self, active_only: bool = False, batch_size: int = 500):
+        rows = [p for _, p in sorted(self.policies.items()) if p["is_active"] or not active_only]
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
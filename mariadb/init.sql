@@ -61,11 +61,25 @@ CREATE TABLE IF NOT EXISTS policy (
     policy_id INT AUTO_INCREMENT PRIMARY KEY,
     policy_name VARCHAR(100) NOT NULL,
     description TEXT,
+    api_id INT,
+    rego_code TEXT,
+    is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
     created_by VARCHAR(20),
-    FOREIGN KEY (created_by) REFERENCES user(emp_id)
+    FOREIGN KEY (created_by) REFERENCES user(emp_id),
+    FOREIGN KEY (api_id) REFERENCES api(api_id)
 );
 
+-- 기존 DB 에 컬럼 추가 (증분 인덱싱용 updated_at 포함)
+ALTER TABLE policy ADD COLUMN IF NOT EXISTS api_id INT;
+ALTER TABLE policy ADD COLUMN IF NOT EXISTS rego_code TEXT;
+ALTER TABLE policy ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE;
+ALTER TABLE policy ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+-- 초 단위로 만들어진 기존 컬럼은 microsecond 정밀도로 변경 (같은 초에 바뀐 행의 순서 구분)
+ALTER TABLE policy MODIFY COLUMN updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+CREATE INDEX IF NOT EXISTS idx_policy_updated ON policy (updated_at, policy_id);
+
 INSERT INTO policy (policy_name, description, created_by)
 SELECT 'DataAccessPolicy', 'Controls data access permissions based on user roles', 'E003'
 WHERE NOT EXISTS (SELECT 1 FROM policy WHERE policy_name='DataAccessPolicy');
@@ -77,3 +91,45 @@ WHERE NOT EXISTS (SELECT 1 FROM policy WHERE policy_name='ServiceAccessPolicy');
 INSERT INTO policy (policy_name, description, created_by)
 SELECT 'DefaultPolicy', 'Fallback policy for unregistered users', 'E001'
 WHERE NOT EXISTS (SELECT 1 FROM policy WHERE policy_name='DefaultPolicy');
+
+-- ========================================
+-- 5️⃣ policy_benchmark 테이블 (정책 성능 측정 이력)
+-- ========================================
+-- 입력 문서 묶음(corpus). 같은 정책의 다음 버전을 같은 입력으로 측정하기 위해 보관
+CREATE TABLE IF NOT EXISTS policy_benchmark_corpus (
+    corpus_hash CHAR(64) PRIMARY KEY,
+    inputs LONGTEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 측정 1회. policy_id 가 없는 정책(생성 직후 등)은 package 로 이전 버전을 찾음
+CREATE TABLE IF NOT EXISTS policy_benchmark (
+    benchmark_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    policy_id INT,
+    package VARCHAR(255),
+    policy_hash CHAR(64) NOT NULL,
+    corpus_hash CHAR(64) NOT NULL,
+    opa_version VARCHAR(32) NOT NULL,
+    query VARCHAR(255),
+    inputs INT,
+    ns_per_op DOUBLE NOT NULL,
+    allocs_per_op DOUBLE,
+    bytes_per_op DOUBLE,
+    created_at TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3),
+    FOREIGN KEY (policy_id) REFERENCES policy(policy_id) ON DELETE SET NULL,
+    FOREIGN KEY (corpus_hash) REFERENCES policy_benchmark_corpus(corpus_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_benchmark_policy ON policy_benchmark (policy_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_benchmark_package ON policy_benchmark (package, created_at);
+
+-- 측정 1회의 규칙별 평가 시간
+CREATE TABLE IF NOT EXISTS policy_benchmark_rule (
+    benchmark_id BIGINT NOT NULL,
+    rule_name VARCHAR(255) NOT NULL,
+    total_ns BIGINT,
+    mean_ns DOUBLE,
+    p99_ns DOUBLE,
+    num_eval INT,
+    PRIMARY KEY (benchmark_id, rule_name),
+    FOREIGN KEY (benchmark_id) REFERENCES policy_benchmark(benchmark_id) ON DELETE CASCADE
+);
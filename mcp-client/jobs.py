@@ -0,0 +1,213 @@
+import os
+import math
+import time
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from contextlib import asynccontextmanager
+
+from telemetry import trace_id_var, JOBS_SUBMITTED, JOB_QUEUE_DEPTH, JOB_WAIT_SECONDS
+
+# ===================================
+# Job 큐 설정
+# ===================================
+# 동시에 실행할 정책 생성 job 수 (LLM / OPA 동시 호출 상한)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+# 대기열 최대 길이. 가득 차면 429 + Retry-After
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 100))
+# 완료된 job 결과 보관 시간(초)
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", 3600))
+# job 소요 시간 측정값이 없을 때 사용할 기본 예상 시간(초)
+JOB_DEFAULT_DURATION = float(os.getenv("JOB_DEFAULT_DURATION", 20))
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    job_id: str
+    request: str
+    params: dict
+    trace_id: str = "-"
+    status: str = "queued"          # queued | running | succeeded | failed
+    result: dict = None
+    error: str = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "request": self.request,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class Admission:
+    """
+    JobQueue.reserve() 로 잡은 동기 요청 1건의 자리.
+    acquire() 전에는 대기열(_admitting)에, acquire() 후에는 실행 슬롯에 있으며, release() 는 여러 번 불러도 된다
+    """
+
+    def __init__(self, queue: "JobQueue"):
+        self.queue = queue
+        self.state = "waiting"  # waiting | running | released
+
+    async def acquire(self):
+        await self.queue._slots.acquire()
+        self.queue._admitting -= 1
+        self.state = "running"
+
+    def release(self):
+        if self.state == "waiting":
+            self.queue._admitting -= 1
+        elif self.state == "running":
+            self.queue._slots.release()
+        self.state = "released"
+
+
+class JobQueue:
+    """
+    정책 생성 요청을 비동기 job 으로 처리하는 bounded 큐.
+
+    - 고정된 수(workers)의 worker task 가 큐에서 job 을 꺼내 handler 를 실행
+    - 큐가 가득 차면 QueueFullError (Retry-After 는 최근 job 소요 시간으로 추정)
+    - 대기/실행 중인 job 과 요청 텍스트·파라미터가 같으면 새 job 을 만들지 않고 기존 job 을 반환
+    - 완료된 job 은 result_ttl 동안 조회 가능
+    - 동기 엔드포인트는 admit() 으로 worker 와 같은 실행 슬롯을 나눠 쓰고, 대기 수도 같은 상한을 적용
+    """
+
+    def __init__(self, handler, workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE,
+                 result_ttl: float = JOB_RESULT_TTL):
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.jobs = {}
+        self._inflight = {}
+        self._queue = asyncio.Queue(max_queue)
+        self._tasks = []
+        self._avg_duration = JOB_DEFAULT_DURATION
+        self._slots = asyncio.Semaphore(workers)  # job / 동기 요청 공용 동시 실행 슬롯
+        self._admitting = 0                       # admit() 에서 슬롯을 기다리는 동기 요청 수
+
+    @staticmethod
+    def _dedup_key(request: str, params: dict):
+        return " ".join(request.split()), tuple(sorted(params.items()))
+
+    @property
+    def retry_after(self) -> int:
+        """대기열이 한 번 비워질 때까지의 예상 시간(초)"""
+        pending = self._queue.qsize() + self._admitting
+        return max(1, math.ceil(pending / max(self.workers, 1) * self._avg_duration))
+
+    def _ensure_capacity(self):
+        """대기 중인 job + 슬롯을 기다리는 동기 요청이 max_queue 이상이면 QueueFullError"""
+        if self._queue.qsize() + self._admitting >= self.max_queue:
+            JOBS_SUBMITTED.labels("rejected").inc()
+            raise QueueFullError(self.retry_after)
+
+    def submit(self, request: str, **params):
+        """job 등록. (job, deduplicated) 반환"""
+        self._purge()
+        key = self._dedup_key(request, params)
+        existing = self._inflight.get(key)
+        if existing is not None:
+            JOBS_SUBMITTED.labels("deduplicated").inc()
+            return existing, True
+
+        self._ensure_capacity()
+        job = Job(job_id=uuid.uuid4().hex, request=request, params=params, trace_id=trace_id_var.get())
+        self._queue.put_nowait(job)
+
+        self.jobs[job.job_id] = job
+        self._inflight[key] = job
+        JOBS_SUBMITTED.labels("accepted").inc()
+        JOB_QUEUE_DEPTH.set(self._queue.qsize())
+        return job, False
+
+    def reserve(self) -> "Admission":
+        """
+        동기 요청 1건의 자리를 대기열에 바로 잡아 둔다 (슬롯은 Admission.acquire 에서 대기).
+        대기열이 가득 차 있으면 QueueFullError
+        """
+        self._ensure_capacity()
+        self._admitting += 1
+        return Admission(self)
+
+    @asynccontextmanager
+    async def admit(self):
+        """동기 요청(/generate_policy 등)을 job 과 같은 실행 슬롯에서 실행 (슬롯이 빌 때까지 대기)"""
+        admission = self.reserve()
+        try:
+            await admission.acquire()
+            yield
+        finally:
+            admission.release()
+
+    def get(self, job_id: str):
+        self._purge()
+        return self.jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """대기 중인 job 의 큐 내 순서 (0부터). 대기 중이 아니면 None"""
+        if job.status != "queued":
+            return None
+        return sum(1 for other in self.jobs.values() if other.status == "queued" and other.created_at < job.created_at)
+
+    def _purge(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.done and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            JOB_QUEUE_DEPTH.set(self._queue.qsize())
+            token = trace_id_var.set(job.trace_id)
+            await self._slots.acquire()
+            job.status, job.started_at = "running", time.time()
+            JOB_WAIT_SECONDS.observe(job.started_at - job.created_at)
+            try:
+                job.result = await self.handler(job.request, **job.params)
+                job.status = "succeeded"
+            except Exception as e:
+                logger.exception("job %s failed", job.job_id)
+                job.status, job.error = "failed", str(e)
+            finally:
+                self._slots.release()
+                job.finished_at = time.time()
+                # 최근 job 소요 시간의 지수 이동 평균 (Retry-After 추정용)
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * (job.finished_at - job.started_at)
+                self._inflight.pop(self._dedup_key(job.request, job.params), None)
+                trace_id_var.reset(token)
+                self._queue.task_done()
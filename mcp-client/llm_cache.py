@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, message_chunk_to_message, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from telemetry import LLM_CACHE_REQUESTS, LLM_CACHE_BYTES
+
+# ===================================
+# LLM 응답 캐시 설정
+# ===================================
+# off: 사용 안 함 / readwrite: 캐시에 있으면 사용, 없으면 호출 후 저장
+# record: 항상 호출하고 결과 저장(덮어쓰기) / replay: 캐시만 사용, 없으면 LLMCacheMiss (오프라인 재현용)
+# 기본값은 off. 캐시는 검증 결과와 무관하게 응답을 저장하므로, 켜 두면 opa_check 에 실패한 초안과
+# 그 repair 응답까지 재시도할 때마다 그대로 재생된다. 벤치마크 / 테스트 하네스에서만 사용
+LLM_CACHE_MODES = ("off", "readwrite", "record", "replay")
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off")
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mcp_client_llm_cache"))
+# 디스크 사용량 상한. 넘으면 가장 오래 사용하지 않은 응답부터 삭제
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCacheMiss(LookupError):
+    """replay 모드에서 기록되지 않은 요청"""
+
+
+class ResponseStore:
+    """
+    key 별 JSON 파일 하나로 저장하는 디스크 캐시 (<dir>/<key 앞 2자리>/<key>.json).
+
+    - 파일 쓰기는 임시 파일 + os.replace 로 원자적으로 처리
+    - 시작할 때 디렉토리를 훑어 크기 / 마지막 사용 시각(mtime) 인덱스를 만들고,
+      max_bytes 를 넘으면 마지막 사용이 오래된 순으로 삭제 (조회 시 mtime 갱신)
+    """
+
+    def __init__(self, path: str = LLM_CACHE_DIR, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._index = {}  # key -> [size, last_used]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        if not os.path.isdir(self.path):
+            return
+        for shard in os.scandir(self.path):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    self._index[entry.name[:-5]] = [stat.st_size, stat.st_mtime]
+                    self._bytes += stat.st_size
+        LLM_CACHE_BYTES.set(self._bytes)
+
+    @property
+    def stats(self) -> dict:
+        return {"path": self.path, "entries": len(self._index), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def get(self, key: str):
+        if key not in self._index:
+            return None
+        path = self._file(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            logger.warning("dropping unreadable llm cache entry %s: %s", key, e)
+            self._remove(key)
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index[key][1] = time.time()
+        return entry
+
+    def put(self, key: str, entry: dict):
+        path = self._file(key)
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("llm cache write failed: %s", e)
+            return
+
+        with self._lock:
+            previous = self._index.get(key)
+            self._bytes += len(data) - (previous[0] if previous else 0)
+            self._index[key] = [len(data), time.time()]
+        self._evict()
+
+    def _remove(self, key: str):
+        with self._lock:
+            size, _ = self._index.pop(key, (0, 0))
+            self._bytes -= size
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+        LLM_CACHE_BYTES.set(self._bytes)
+
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            LLM_CACHE_BYTES.set(self._bytes)
+            return
+        with self._lock:
+            oldest = sorted(self._index, key=lambda key: self._index[key][1])
+        for key in oldest:
+            if self._bytes <= self.max_bytes:
+                break
+            self._remove(key)
+            LLM_CACHE_REQUESTS.labels("evicted").inc()
+
+
+class CachedChatModel(BaseChatModel):
+    """
+    다른 채팅 모델을 감싸서 응답을 ResponseStore 에 exact-match 로 캐시하는 모델.
+
+    key 는 감싼 모델의 llm string (모델 / deployment / endpoint 등 설정 + temperature 같은 호출 인자 +
+    bind_tools 로 묶인 tool schema) 과 메시지 목록 전체, stop 의 hash 이다.
+    캐시에서 꺼낸 응답은 토큰을 쓰지 않았으므로 usage_metadata 를 0 으로 바꿔서 한 chunk 로 돌려준다.
+    """
+
+    inner: BaseChatModel
+    store: Any
+    mode: str = "readwrite"
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        # 감싼 모델의 tool schema 변환을 그대로 쓰고, 변환된 인자는 이 모델에 묶어서 key 에 포함되게 함
+        bound = self.inner.bind_tools(tools, **kwargs)
+        return self.bind(**getattr(bound, "kwargs", {}))
+
+    def cache_key(self, messages: list, stop=None, **kwargs) -> str:
+        material = json.dumps({
+            "llm": self.inner._get_llm_string(stop=stop, **kwargs),
+            "messages": [message_to_dict(message) for message in messages],
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str):
+        if self.mode not in ("readwrite", "replay"):
+            return None
+        entry = self.store.get(key)
+        if entry is not None:
+            LLM_CACHE_REQUESTS.labels("hit").inc()
+            message = messages_from_dict([entry["message"]])[0]
+            message.usage_metadata = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+            return message
+        if self.mode == "replay":
+            LLM_CACHE_REQUESTS.labels("replay_miss").inc()
+            raise LLMCacheMiss(f"no recorded llm response for key {key}")
+        LLM_CACHE_REQUESTS.labels("miss").inc()
+        return None
+
+    def _save(self, key: str, message):
+        self.store.put(key, {"llm_type": self.inner._llm_type, "created_at": time.time(),
+                             "message": message_to_dict(message)})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self.cache_key(messages, stop, **kwargs)
+        message = self._lookup(key)
+        if message is not None:
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        result = self.inner._generate(messages, stop=stop, **kwargs)
+        self._save(key, result.generations[0].message)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self.cache_key(messages, stop, **kwargs)
+        message = self._lookup(key)
+        if message is not None:
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+        self._save(key, result.generations[0].message)
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self.cache_key(messages, stop, **kwargs)
+        message = self._lookup(key)
+        if message is not None:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=message.content,
+                usage_metadata=message.usage_metadata,
+                tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                    for index, call in enumerate(getattr(message, "tool_calls", None) or [])
+                ],
+            ))
+            return
+
+        full = None
+        async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+            full = chunk.message if full is None else full + chunk.message
+            yield chunk
+        # 스트림이 끝까지 온 응답만 저장 (중간에 취소된 hedged 후보 등은 저장하지 않음)
+        if full is not None:
+            self._save(key, message_chunk_to_message(full))
+
+
+def with_response_cache(model: BaseChatModel, mode: str = LLM_CACHE_MODE, store: ResponseStore = None):
+    """mode 가 off 가 아니면 model 을 CachedChatModel 로 감싸서 반환"""
+    if mode not in LLM_CACHE_MODES:
+        raise ValueError(f"LLM_CACHE_MODE must be one of {LLM_CACHE_MODES}, got {mode!r}")
+    if mode == "off":
+        return model
+    return CachedChatModel(inner=model, store=store or ResponseStore(), mode=mode)
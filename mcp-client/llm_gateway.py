@@ -0,0 +1,376 @@
+import os
+import json
+import time
+import email.utils
+import random
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+import openai
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_openai import AzureChatOpenAI, ChatOpenAI
+
+from telemetry import LLM_GATEWAY_REQUESTS, LLM_GATEWAY_IN_FLIGHT
+
+# ===================================
+# LLM gateway 설정
+# ===================================
+# deployment 목록 (JSON). 비어 있으면 MCPClientManager 에 설정된 deployment 하나만 사용
+#   [{"name": "eastus", "azure_endpoint": "...", "api_key": "...", "azure_deployment": "gpt-4o",
+#     "api_version": "...", "rpm": 600, "tpm": 90000},
+#    {"name": "local", "kind": "openai", "base_url": "http://localhost:9000/v1", "api_key": "x", "model": "gpt-4o",
+#     "temperature": 0}]
+LLM_DEPLOYMENTS = os.getenv("LLM_DEPLOYMENTS", "")
+# 요청 1건을 몇 개의 deployment / 재시도까지 시도할지
+LLM_GATEWAY_MAX_ATTEMPTS = int(os.getenv("LLM_GATEWAY_MAX_ATTEMPTS", 6))
+# 모든 deployment 가 한도 초과 / cooldown 일 때 기다릴 최대 시간(초)
+LLM_GATEWAY_MAX_WAIT = float(os.getenv("LLM_GATEWAY_MAX_WAIT", 60))
+# Retry-After 가 없을 때 deployment cooldown (지수 backoff + jitter)
+LLM_GATEWAY_BACKOFF = float(os.getenv("LLM_GATEWAY_BACKOFF", 1.0))
+LLM_GATEWAY_BACKOFF_MAX = float(os.getenv("LLM_GATEWAY_BACKOFF_MAX", 30))
+# 응답 토큰 수 추정치 (실제 사용량은 응답의 usage 로 보정)
+LLM_GATEWAY_OUTPUT_TOKENS = int(os.getenv("LLM_GATEWAY_OUTPUT_TOKENS", 800))
+
+# rpm / tpm 을 세는 구간(초)
+RATE_WINDOW = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class LLMGatewayUnavailable(RuntimeError):
+    """모든 deployment 가 LLM_GATEWAY_MAX_WAIT 안에 요청을 받을 수 없음"""
+
+
+class LLMStreamDiverged(RuntimeError):
+    """스트림 도중 failover 한 deployment 의 응답이 이미 보낸 내용과 달라서 이어 붙일 수 없음"""
+
+
+@dataclass
+class Deployment:
+    """deployment 1개와 최근 RATE_WINDOW 초 동안의 요청 / 토큰 사용량"""
+
+    name: str
+    model: Any
+    rpm: int = 0  # 0 이면 제한 없음
+    tpm: int = 0
+    in_flight: int = 0
+    cooldown_until: float = 0.0
+    failures: int = 0
+    requests: deque = field(default_factory=deque)  # 요청 시각
+    tokens: deque = field(default_factory=deque)    # [시각, 토큰 수]
+    token_total: int = 0
+
+    def _trim(self, now: float):
+        while self.requests and now - self.requests[0] >= RATE_WINDOW:
+            self.requests.popleft()
+        while self.tokens and now - self.tokens[0][0] >= RATE_WINDOW:
+            self.token_total -= self.tokens.popleft()[1]
+
+    def load(self, now: float) -> tuple:
+        """(rpm / tpm 중 더 많이 쓴 비율, 진행 중 요청 수) - 작을수록 여유"""
+        self._trim(now)
+        usage = max(
+            len(self.requests) / self.rpm if self.rpm else 0.0,
+            self.token_total / self.tpm if self.tpm else 0.0,
+        )
+        return usage, self.in_flight
+
+    def wait_time(self, now: float, tokens: int) -> float:
+        """tokens 짜리 요청을 보낼 수 있을 때까지 남은 시간(초). 0 이면 바로 가능"""
+        self._trim(now)
+        wait = max(self.cooldown_until - now, 0.0)
+        if self.rpm and len(self.requests) >= self.rpm:
+            wait = max(wait, self.requests[0] + RATE_WINDOW - now)
+        if self.tpm and self.tokens and self.token_total + tokens > self.tpm:
+            # 오래된 사용량부터 빠질 때 자리가 나는 시각
+            freed, ready_at = self.token_total + tokens - self.tpm, self.tokens[-1][0] + RATE_WINDOW
+            for at, count in self.tokens:
+                freed -= count
+                if freed <= 0:
+                    ready_at = at + RATE_WINDOW
+                    break
+            wait = max(wait, ready_at - now)
+        return wait
+
+    def reserve(self, now: float, tokens: int) -> list:
+        self.requests.append(now)
+        entry = [now, tokens]
+        self.tokens.append(entry)
+        self.token_total += tokens
+        self.in_flight += 1
+        LLM_GATEWAY_IN_FLIGHT.labels(self.name).set(self.in_flight)
+        return entry
+
+    def settle(self, entry: list, tokens: int = None):
+        """요청 종료. 실제 사용 토큰 수를 알면 예약한 추정치를 보정"""
+        # entry 가 아직 window 안에 있을 때만 (시간순으로 쌓이므로 가장 오래된 항목과 비교)
+        if tokens is not None and self.tokens and entry[0] >= self.tokens[0][0]:
+            self.token_total += tokens - entry[1]
+            entry[1] = tokens
+        self.in_flight -= 1
+        LLM_GATEWAY_IN_FLIGHT.labels(self.name).set(self.in_flight)
+
+    def penalize(self, delay: float):
+        self.failures += 1
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + delay)
+
+    @property
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._trim(now)
+        return {
+            "name": self.name, "rpm": self.rpm, "tpm": self.tpm, "requests": len(self.requests),
+            "tokens": self.token_total, "in_flight": self.in_flight, "failures": self.failures,
+            "cooldown_seconds": round(max(self.cooldown_until - now, 0.0), 3),
+        }
+
+
+def _retry_after(error) -> float:
+    """429 응답의 retry-after-ms / retry-after 헤더(초 또는 HTTP 날짜). 없으면 None"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            if value.replace(".", "", 1).isdigit():
+                return float(value)
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _classify(error):
+    """(다른 deployment 로 재시도할 수 있는지, 429 인지)"""
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return True, True
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, httpx.TransportError)):
+        return True, False
+    return bool(status and status >= 500), False
+
+
+def _estimate_tokens(messages: list) -> int:
+    """입력은 글자 수 / 4, 출력은 LLM_GATEWAY_OUTPUT_TOKENS 로 추정"""
+    chars = sum(len(message.content) if isinstance(message.content, str) else len(json.dumps(message.content))
+                for message in messages)
+    return chars // 4 + LLM_GATEWAY_OUTPUT_TOKENS
+
+
+def _usage_tokens(message):
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class GatewayChatModel(BaseChatModel):
+    """
+    여러 deployment 에 요청을 나눠 보내는 채팅 모델.
+
+    - deployment 별로 최근 1분 요청 수 / 토큰 수를 세고, 한도(rpm / tpm)에 여유가 있는 deployment 중
+      사용률이 가장 낮은(같으면 진행 중 요청이 적은) 곳으로 보냄
+    - 429 이면 Retry-After(없으면 지수 backoff) 에 jitter 를 더한 만큼 그 deployment 를 쉬게 하고,
+      연결 오류 / 5xx 도 backoff 후 다른 deployment 로 다시 보냄
+    - 모든 deployment 가 한도 초과면 가장 먼저 풀리는 시각까지 대기 (최대 LLM_GATEWAY_MAX_WAIT)
+    - 스트리밍 중 끊기면 temperature 가 0 일 때만 다른 deployment 로 다시 요청하고, 이미 보낸 앞부분은
+      건너뛰고 이어서 보냄 (새 응답의 앞부분이 다르면 LLMStreamDiverged). sampling 하는 요청은
+      다시 생성해도 같은 앞부분이 나오지 않으므로, 이미 보낸 내용이 있으면 이어 붙이지 않고 원래 오류를 전달
+
+    deployment 모델은 자체 재시도를 끄고(max_retries=0) gateway 가 재시도를 맡는다.
+    """
+
+    deployments: list
+    max_attempts: int = LLM_GATEWAY_MAX_ATTEMPTS
+    max_wait: float = LLM_GATEWAY_MAX_WAIT
+
+    @property
+    def _llm_type(self) -> str:
+        return "gateway"
+
+    @property
+    def _identifying_params(self) -> dict:
+        # 캐시 key 등에 쓰이므로 API key 같은 설정은 빼고 deployment 이름만
+        return {"deployments": sorted(deployment.name for deployment in self.deployments)}
+
+    @property
+    def stats(self) -> list:
+        return [deployment.stats for deployment in self.deployments]
+
+    def bind_tools(self, tools, **kwargs):
+        # tool schema 변환은 deployment 모델에 맡기고, 변환된 인자만 이 모델에 묶음
+        bound = self.deployments[0].model.bind_tools(tools, **kwargs)
+        return self.bind(**getattr(bound, "kwargs", {}))
+
+    def _pick(self, tokens: int, tried: set, waited: float):
+        """
+        보낼 deployment 선택 + 사용량 예약. 이번 요청에서 실패한 deployment 는 다른 곳이 없을 때만 사용.
+        바로 보낼 곳이 없으면 (None, 기다릴 시간) 반환
+        """
+        now = time.monotonic()
+        candidates = [d for d in self.deployments if d.name not in tried] or self.deployments
+        ready = [d for d in candidates if d.wait_time(now, tokens) <= 0]
+        if ready:
+            deployment = min(ready, key=lambda d: d.load(now))
+            return (deployment, deployment.reserve(now, tokens)), 0.0
+
+        wait = min(d.wait_time(now, tokens) for d in candidates)
+        if waited + wait > self.max_wait:
+            LLM_GATEWAY_REQUESTS.labels("-", "unavailable").inc()
+            raise LLMGatewayUnavailable(f"no deployment available within {self.max_wait}s")
+        return None, wait + random.uniform(0, 0.1)
+
+    async def _acquire(self, tokens: int, tried: set):
+        waited = 0.0
+        while True:
+            picked, wait = self._pick(tokens, tried, waited)
+            if picked:
+                return picked
+            waited += wait
+            await asyncio.sleep(wait)
+
+    def _acquire_sync(self, tokens: int, tried: set):
+        waited = 0.0
+        while True:
+            picked, wait = self._pick(tokens, tried, waited)
+            if picked:
+                return picked
+            waited += wait
+            time.sleep(wait)
+
+    def _failed(self, deployment: Deployment, error: Exception, attempt: int):
+        """실패한 deployment 를 cooldown 시키고, 다른 deployment 로 재시도할 수 없는 오류면 다시 raise"""
+        retryable, rate_limited = _classify(error)
+        if not retryable or attempt + 1 >= self.max_attempts:
+            LLM_GATEWAY_REQUESTS.labels(deployment.name, "error").inc()
+            raise error
+
+        delay = _retry_after(error) if rate_limited else None
+        if delay is None:
+            delay = min(LLM_GATEWAY_BACKOFF * 2 ** deployment.failures, LLM_GATEWAY_BACKOFF_MAX) * random.uniform(0.5, 1.0)
+        else:
+            delay *= random.uniform(1.0, 1.2)
+        deployment.penalize(delay)
+        LLM_GATEWAY_REQUESTS.labels(deployment.name, "rate_limited" if rate_limited else "failover").inc()
+        logger.warning("llm deployment %s failed (%s), cooldown %.2fs, failing over", deployment.name,
+                       type(error).__name__, delay)
+
+    @staticmethod
+    def _deterministic(deployment: Deployment, kwargs: dict) -> bool:
+        """temperature 0 으로 생성하는 요청인지 (다시 생성해도 같은 앞부분이 나올 것으로 기대할 수 있음)"""
+        temperature = kwargs.get("temperature", getattr(deployment.model, "temperature", None))
+        return temperature == 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = _estimate_tokens(messages)
+        tried = set()
+        for attempt in range(self.max_attempts):
+            deployment, entry = self._acquire_sync(tokens, tried)
+            used = None
+            try:
+                result = deployment.model._generate(messages, stop=stop, **kwargs)
+                used = _usage_tokens(result.generations[0].message)
+            except Exception as e:
+                tried.add(deployment.name)
+                self._failed(deployment, e, attempt)
+                continue
+            finally:
+                deployment.settle(entry, used)
+            deployment.failures = 0
+            LLM_GATEWAY_REQUESTS.labels(deployment.name, "ok").inc()
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = _estimate_tokens(messages)
+        tried = set()
+        for attempt in range(self.max_attempts):
+            deployment, entry = await self._acquire(tokens, tried)
+            used = None
+            try:
+                result = await deployment.model._agenerate(messages, stop=stop, **kwargs)
+                used = _usage_tokens(result.generations[0].message)
+            except Exception as e:
+                tried.add(deployment.name)
+                self._failed(deployment, e, attempt)
+                continue
+            finally:
+                deployment.settle(entry, used)
+            deployment.failures = 0
+            LLM_GATEWAY_REQUESTS.labels(deployment.name, "ok").inc()
+            return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = _estimate_tokens(messages)
+        tried = set()
+        emitted = ""         # 호출자에게 이미 보낸 텍스트
+        emitted_tools = False
+        for attempt in range(self.max_attempts):
+            deployment, entry = await self._acquire(tokens, tried)
+            skip, received, used = len(emitted), "", None
+            try:
+                async for chunk in deployment.model._astream(messages, stop=stop, **kwargs):
+                    used = _usage_tokens(chunk.message) or used
+                    text = chunk.message.content if isinstance(chunk.message.content, str) else ""
+                    start = len(received)
+                    received += text
+                    if start < skip:
+                        # failover 후 이미 보낸 구간을 다시 받는 중
+                        if not (emitted.startswith(received) if len(received) <= skip else received.startswith(emitted)):
+                            raise LLMStreamDiverged(f"deployment {deployment.name} returned a different response")
+                        if len(received) <= skip:
+                            continue
+                        chunk = ChatGenerationChunk(message=AIMessageChunk(
+                            content=received[skip:], usage_metadata=chunk.message.usage_metadata
+                        ))
+                    emitted = received
+                    emitted_tools = emitted_tools or bool(getattr(chunk.message, "tool_call_chunks", None))
+                    yield chunk
+            except Exception as e:
+                tried.add(deployment.name)
+                if emitted_tools or (emitted and not self._deterministic(deployment, kwargs)):
+                    # tool call 인자나 sampling 한 응답은 다른 deployment 의 응답과 이어 붙일 수 없음
+                    LLM_GATEWAY_REQUESTS.labels(deployment.name, "error").inc()
+                    raise
+                self._failed(deployment, e, attempt)
+                continue
+            finally:
+                deployment.settle(entry, used)
+            deployment.failures = 0
+            LLM_GATEWAY_REQUESTS.labels(deployment.name, "ok").inc()
+            return
+
+
+def build_deployment(config: dict) -> Deployment:
+    """
+    deployment 설정 1개 → Deployment (kind: "azure"(기본) | "openai"(OpenAI 호환 서버)).
+    temperature 를 주면 모델 기본값으로 사용 (0 이면 스트림 중간 failover 시 이어 붙이기 가능)
+    """
+    common = {"max_retries": 0, "stream_usage": True}
+    if config.get("temperature") is not None:
+        common["temperature"] = float(config["temperature"])
+    if config.get("kind", "azure") == "openai":
+        model = ChatOpenAI(base_url=config["base_url"], api_key=config.get("api_key", "unused"),
+                           model=config.get("model", "gpt-4o"), **common)
+    else:
+        model = AzureChatOpenAI(azure_endpoint=config["azure_endpoint"], api_key=config["api_key"],
+                                azure_deployment=config["azure_deployment"],
+                                api_version=config.get("api_version", "2024-02-15-preview"), **common)
+    name = config.get("name") or config.get("azure_deployment") or config.get("base_url")
+    return Deployment(name=name, model=model, rpm=int(config.get("rpm", 0)), tpm=int(config.get("tpm", 0)))
+
+
+def build_gateway(configs: list = None, default: dict = None) -> GatewayChatModel:
+    """
+    LLM_DEPLOYMENTS (또는 configs) 의 deployment 들로 gateway 생성.
+    설정이 없으면 default deployment 하나로 만든다 (429 재시도 / backoff 는 그대로 적용).
+    """
+    if configs is None:
+        configs = json.loads(LLM_DEPLOYMENTS) if LLM_DEPLOYMENTS.strip() else []
+    if not configs:
+        configs = [default]
+    return GatewayChatModel(deployments=[build_deployment(config) for config in configs])
@@ -1,13 +1,102 @@
 import re
 import json
+import time
+import os
 import asyncio
-from fastapi import FastAPI, HTTPException
-from langchain_openai import AzureChatOpenAI
-from langgraph.prebuilt import create_react_agent
+import hashlib
+import logging
+import tempfile
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.prompts import load_mcp_prompt
+from jobs import JobQueue, QueueFullError
+from session_pool import MCPSessionPool
+from llm_cache import with_response_cache, LLM_CACHE_MODE
+from llm_gateway import build_gateway
+from telemetry import (
+    TRACE_HEADER, trace_id_var, new_trace_id, configure_logging, metrics_response,
+    GENERATION_SECONDS, GENERATION_ATTEMPTS, GENERATION_RETRIES,
+    LLM_SECONDS, LLM_FIRST_TOKEN_SECONDS, TOOL_CALL_SECONDS, record_llm_tokens
+)
+
+configure_logging()
+logger = logging.getLogger("mcp_client")
 
 app = FastAPI(title="MCP OPA Client")
 
+# hedged 생성: 후보 수 상한, 후보별 temperature (후보 수가 더 많으면 순환)
+HEDGE_MAX_CANDIDATES = int(os.getenv("HEDGE_MAX_CANDIDATES", 4))
+HEDGE_TEMPERATURES = [float(t) for t in os.getenv("HEDGE_TEMPERATURES", "0.0,0.5,0.9,0.3").split(",")]
+
+# MCP 서버 prompt 디스크 캐시. 서버의 prompts://version 이 같으면 prompt 를 다시 받지 않음
+PROMPT_CACHE_PATH = os.getenv("PROMPT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "mcp_client_prompts.json"))
+# self.prompts 키 → MCP 서버 prompt 이름
+PROMPT_NAMES = {
+    "base": "base_prompt",
+    "rego_gen": "rego_gen_prompt",
+    "test_rego_gen": "test_rego_gen_prompt",
+    "opa_test": "opa_test_prompt",
+    "rego_repair": "rego_repair_prompt",
+    "rego_optimize": "rego_optimize_prompt",
+}
+
+_FENCE_OPEN_RE = re.compile(r"```(?:\w+)?[ \t]*\n")
+# 여는 fence 줄(```rego + 개행)이 chunk 경계에 걸칠 수 있으므로 이만큼 앞에서부터 다시 찾음
+_FENCE_LOOKBACK = 64
+
+
+# ===============================
+# LLM Stream Rego Extractor
+# ===============================
+class RegoStreamExtractor:
+    """
+    LLM 스트리밍 chunk 를 도착하는 대로 받아서 ```rego ...``` 코드 블록이 닫히는 시점을 찾는 incremental parser.
+
+    응답 전체를 모은 뒤 정규식으로 다시 찾지 않고, 새로 들어온 부분만 검사한다.
+    feed() 가 True 를 반환하면 코드 블록이 끝난 것이므로 남은 스트림(설명 문장 등)을 닫아도 된다.
+    코드 블록이 없는 응답(JSON / 순수 Rego)은 스트림이 끝난 뒤 extract_rego_code 로 처리한다.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.code = None
+        self._body = None  # 여는 fence 다음 위치
+        self._scan = 0
+
+    @property
+    def done(self) -> bool:
+        return self.code is not None
+
+    def feed(self, text: str) -> bool:
+        if self.done:
+            return True
+        self.text += text
+
+        if self._body is None:
+            match = _FENCE_OPEN_RE.search(self.text, self._scan)
+            if not match:
+                self._scan = max(0, len(self.text) - _FENCE_LOOKBACK)
+                return False
+            self._body = self._scan = match.end()
+
+        end = self.text.find("```", self._scan)
+        if end < 0:
+            self._scan = max(self._body, len(self.text) - 2)
+            return False
+        self.code = self.text[self._body:end].strip()
+        return True
+
+    def result(self) -> str:
+        if self.done:
+            return MCPClientManager.unwrap_rego_json(self.code)
+        return MCPClientManager.extract_rego_code(self.text)
+
+
 # ===============================
 # MCP Client Manager Class
 # ===============================
@@ -19,110 +108,506 @@ class MCPClientManager:
         self.azure_deployment = azure_deployment
         self.api_version = "2024-02-15-preview"
 
-        self.agent = None
+        self.model = None
         self.prompts = {}
         self.mcp_client = None
+        self.session_pool = None
+        self.gateway = None
+        self.state = {"initialized": False, "startup_seconds": None, "prompts_version": None, "prompts_cached": False,
+                      "llm_cache_mode": None}
 
     @staticmethod
-    def extract_rego_or_last_json(text: str):
-        # "rego_code"로 시작해서 마지막 "}"까지 매칭하는 정규식
-        # 중간의 중괄호나 개행, 따옴표 등은 모두 허용
-        pattern = r'\{\s*"rego_code".*?"error_message"\s*:\s*".*?"\s*\}'
-        
-        matches = re.findall(pattern, text, flags=re.DOTALL)
-        
-        if not matches:
-            return None
+    def extract_rego_code(text: str):
+        """
+        LLM 응답에서 Rego 코드 추출.
+        {"rego_code": "..."} JSON, ```rego ...``` 코드 블록, 순수 Rego 텍스트 순서로 시도
+        """
+        text = text.strip()
+        fenced = re.search(r"```(?:\w+)?\s*\n(.*?)```", text, flags=re.DOTALL)
+        if fenced:
+            text = fenced.group(1).strip()
+        return MCPClientManager.unwrap_rego_json(text)
+
+    @staticmethod
+    def unwrap_rego_json(text: str):
+        """{"rego_code": "..."} JSON 이면 rego_code 를, 아니면 text 를 그대로 반환"""
+        try:
+            parsed = json.loads(text)
+        except json.JSONDecodeError:
+            return text
 
-        last_json_str = matches[-1]
+        if isinstance(parsed, dict) and isinstance(parsed.get("rego_code"), str):
+            return parsed["rego_code"]
+        return text
 
+    @property
+    def stop_early(self) -> bool:
+        """
+        코드 블록이 끝나면 LLM 스트림을 닫을지.
+        응답 캐시는 끝까지 받은 응답만 저장하므로 LLM_CACHE_MODE 가 off 일 때만 닫는다
+        """
+        return self.state["llm_cache_mode"] == "off"
+
+    async def call_tool(self, name: str, arguments: dict):
+        """
+        LLM 을 거치지 않고 MCP tool 을 직접 호출해서 JSON 결과를 반환
+        """
+        started = time.perf_counter()
+        status = "error"
         try:
-            # JSON 문자열의 내부에 이스케이프된 따옴표나 개행이 있을 수 있으므로
-            # 불필요한 문자들을 안전하게 정리
-            parsed_json = json.loads(last_json_str)
-        except json.JSONDecodeError as e:
-            print(f"[JSON 파싱 오류] {e}")
-            return None
+            # trace_id 는 MCP 요청 _meta 로 서버에 전달 (서버 로그 / metric 과 연결)
+            meta = {"trace_id": trace_id_var.get()}
+            result = await self.session_pool.run(lambda session: session.call_tool(name, arguments, meta=meta))
+            status = "error" if result.isError else "ok"
+        finally:
+            TOOL_CALL_SECONDS.labels(name, status).observe(time.perf_counter() - started)
 
-        # 필드 추출 (없을 경우 None)
-        rego_code = parsed_json.get("rego_code")
-        is_valid = parsed_json.get("is_valid")
-        error_message = parsed_json.get("error_message")
+        if isinstance(result.structuredContent, dict):
+            structured = result.structuredContent
+            # dict 가 아닌 반환값은 FastMCP 가 {"result": ...} 로 감싸서 보냄
+            return structured["result"] if set(structured) == {"result"} else structured
 
-        return {
-            "rego_code": rego_code,
-            "is_valid": is_valid,
-            "error_message": error_message
-        }
-        
-    async def initialize(self):
-        """Initialize MCP client, load tools, prompts, and LLM agent."""
-        model = AzureChatOpenAI(
-            azure_endpoint=self.azure_endpoint,
-            api_key=self.api_key,
-            azure_deployment=self.azure_deployment,
-            api_version=self.api_version
-        )
+        text = "".join(getattr(block, "text", "") for block in result.content)
+        return json.loads(text)
+
+    async def initialize(self, model=None, mcp_client=None, llm_cache_mode: str = LLM_CACHE_MODE):
+        """
+        Initialize MCP client and load prompts.
 
-        self.mcp_client = MultiServerMCPClient({
+        model / mcp_client 를 넘기면 Azure 모델, streamable-http MCP 클라이언트 대신 사용한다
+        (오프라인 벤치마크 등에서 fake 모델 / in-process transport 주입용).
+
+        모델은 LLM_CACHE_MODE 에 따라 디스크 응답 캐시(llm_cache.CachedChatModel)로 감싼다.
+        LLM_CACHE_MODE=record 로 한 번 실행해 두면 replay 로 네트워크 없이 같은 응답을 재현할 수 있다.
+        """
+        # LLM_DEPLOYMENTS 의 deployment 들로 부하 분산 (설정이 없으면 아래 deployment 하나)
+        self.gateway = None if model else build_gateway(default={
+            "azure_endpoint": self.azure_endpoint,
+            "api_key": self.api_key,
+            "azure_deployment": self.azure_deployment,
+            "api_version": self.api_version
+        })
+        model = model or self.gateway
+
+        self.mcp_client = mcp_client or MultiServerMCPClient({
             "opa_tools": {
                 "url": self.mcp_url,
                 "transport": "streamable_http"
             }
         })
+        # 직접 호출하는 tool / prompt 는 세션을 매번 만들지 않고 풀에서 재사용
+        if self.session_pool is not None:
+            await self.session_pool.close()
+        self.session_pool = MCPSessionPool(lambda: self.mcp_client.session("opa_tools"))
+        self.session_pool.start()
 
-        tools = await self.mcp_client.get_tools()
-        self.prompts["base"] = (await self.mcp_client.get_prompt("opa_tools", "base_prompt"))[0].content
-        self.prompts["rego_gen"] = (await self.mcp_client.get_prompt("opa_tools", "rego_gen_prompt"))[0].content
-        self.prompts["test_rego_gen"] = (await self.mcp_client.get_prompt("opa_tools", "test_rego_gen_prompt"))[0].content
-        self.prompts["opa_test"] = (await self.mcp_client.get_prompt("opa_tools", "opa_test_prompt"))[0].content
+        # prompt 버전을 조회하고, 버전이 같으면 캐시한 prompt 사용
+        # (tool 은 call_tool 로 직접 호출하므로 tool 목록은 받지 않음)
+        started = time.perf_counter()
+        version = await self._prompts_version()
+        prompts = self._load_cached_prompts(version)
+        self.state["prompts_cached"] = prompts is not None
+        if prompts is None:
+            prompts = await self._fetch_prompts()
+            self._store_cached_prompts(version, prompts)
+        self.prompts = prompts
 
-        self.agent = create_react_agent(model, tools, prompt=self.prompts["base"])
-        print("✅ MCP Client initialized, prompts loaded")
+        self.model = with_response_cache(model, llm_cache_mode)
+        self.state.update(
+            initialized=True,
+            llm_cache_mode=llm_cache_mode,
+            startup_seconds=round(time.perf_counter() - started, 4),
+            prompts_version=version
+        )
+        logger.info("MCP Client initialized, prompts loaded: %s", self.state)
 
-    async def generate_policy(self, user_request: str):
+    async def _prompts_version(self):
+        """서버 prompt 내용의 hash (prompts://version). 조회할 수 없으면 None (캐시 사용 안 함)"""
+        try:
+            result = await self.session_pool.run(lambda session: session.read_resource("prompts://version"))
+            return result.contents[0].text
+        except Exception as e:
+            logger.warning("prompt version lookup error: %s", e)
+            return None
+
+    async def _fetch_prompts(self) -> dict:
+        """모든 prompt 를 동시에 조회"""
+        messages = await asyncio.gather(*[
+            self.session_pool.run(lambda session, name=name: load_mcp_prompt(session, name))
+            for name in PROMPT_NAMES.values()
+        ])
+        return {key: message[0].content for key, message in zip(PROMPT_NAMES, messages)}
+
+    @staticmethod
+    def _load_cached_prompts(version: str):
+        if not version or not PROMPT_CACHE_PATH:
+            return None
+        try:
+            with open(PROMPT_CACHE_PATH, encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        prompts = cached.get("prompts") or {}
+        if cached.get("version") != version or set(prompts) != set(PROMPT_NAMES):
+            return None
+        # 파일이 중간에 잘렸거나 수정된 경우를 걸러내기 위한 checksum
+        if cached.get("checksum") != hashlib.sha256(json.dumps(prompts, sort_keys=True).encode("utf-8")).hexdigest():
+            return None
+        return prompts
+
+    @staticmethod
+    def _store_cached_prompts(version: str, prompts: dict):
+        if not version or not PROMPT_CACHE_PATH:
+            return
+        payload = {
+            "version": version,
+            "checksum": hashlib.sha256(json.dumps(prompts, sort_keys=True).encode("utf-8")).hexdigest(),
+            "prompts": prompts,
+        }
+        try:
+            tmp_path = f"{PROMPT_CACHE_PATH}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, PROMPT_CACHE_PATH)
+        except OSError as e:
+            logger.warning("prompt cache store error: %s", e)
+
+    async def close(self):
+        if self.session_pool is not None:
+            await self.session_pool.close()
+
+    async def server_readiness(self, timeout: float = 2.0) -> dict:
+        """MCP 서버 /readyz 결과 (OPA warm-up 상태 포함)"""
+        parts = urlsplit(self.mcp_url)
+        try:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                resp = await client.get(f"{parts.scheme}://{parts.netloc}/readyz")
+            return resp.json()
+        except (httpx.HTTPError, ValueError) as e:
+            return {"ready": False, "error": str(e)}
+
+    async def retrieve_examples(self, user_request: str, top_k: int = 3):
         """
-        Generate OPA Rego policy and test code using LLM, validate via MCP Server.
+        기존 정책 중 요청과 비슷한 top_k 개를 rego_gen 프롬프트에 넣을 few-shot 텍스트로 변환
         """
+        try:
+            result = await self.call_tool("policy_examples", {"user_request": user_request, "top_k": top_k})
+        except Exception as e:
+            logger.warning("policy examples error: %s", e)
+            return "(none)"
 
-        print(f"Generating policy...")
-        prompt_text = self.prompts["rego_gen"].format(user_request=user_request)
+        examples = [example for example in result["examples"] if example.get("rego_code")]
+        if not examples:
+            return "(none)"
+        return "\n\n".join(
+            f"# {example['policy_name']}: {example.get('description') or ''}\n{example['rego_code']}"
+            for example in examples
+        )
 
-        # LLM 요청
-        policy_json = ""
-        inputs = {"messages": prompt_text}
-        async for chunk_msg, _ in self.agent.astream(inputs, stream_mode="messages"):
-            if hasattr(chunk_msg, "content") and isinstance(chunk_msg.content, str):
-                policy_json += chunk_msg.content
-
-        print(policy_json)
-        result = self.extract_rego_or_last_json(policy_json)
-        print("="*50)
-
-        return {
-                "success": result["is_valid"],
-                "policy": result["rego_code"],
-                "error_message": result["error_message"]
-            }
+    async def generate_policy(self, user_request: str, retry_limit: int = 3, use_cache: bool = True,
+                              candidates: int = 1, latency_budget_ns: float = None):
+        """
+        Generate OPA Rego policy using LLM, validate via MCP Server.
+
+        generate_policy_events 를 끝까지 소비하고 마지막 "result" 이벤트를 반환한다.
+        """
+        result = None
+        async for event in self.generate_policy_events(user_request, retry_limit, use_cache, candidates,
+                                                       latency_budget_ns):
+            if event["event"] == "result":
+                result = event["data"]
+        return result
+
+    async def _draft_candidate(self, prompt_text: str, temperature: float):
+        """hedged 생성 후보 1개: temperature 를 바꿔 생성하고 바로 opa_check. (rego_code, check, llm 초, check 초)"""
+        started = time.perf_counter()
+        extractor, usage, chunks = RegoStreamExtractor(), None, 0
+        stream = self.model.bind(temperature=temperature).astream(prompt_text)
+        try:
+            async for chunk in stream:
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                if isinstance(chunk.content, str) and chunk.content:
+                    chunks += 1
+                    if extractor.feed(chunk.content) and self.stop_early:
+                        break
+        finally:
+            await stream.aclose()
+        llm_seconds = time.perf_counter() - started
+        LLM_SECONDS.labels("hedge").observe(llm_seconds)
+        record_llm_tokens("hedge", usage, chunks)
+
+        rego_code = extractor.result()
+        started = time.perf_counter()
+        check = await self.call_tool("opa_check", {"rego_code": rego_code})
+        return check.get("rego_code") or rego_code, check, llm_seconds, time.perf_counter() - started
+
+    async def _profile_gate(self, rego_code: str, check: dict, latency_budget_ns: float):
+        """
+        opa_check 를 통과한 정책을 opa_profile 로 측정하고, ns/op 가 budget 을 넘으면 check 를 실패로 바꾼다.
+        profiling 자체가 실패하면 (opa bench 불가 등) 정책을 막지 않는다. (profile, check) 반환
+        """
+        profile = await self.call_tool("opa_profile", {"policy_code": rego_code, "budget_ns": latency_budget_ns})
+        if profile.get("error"):
+            logger.warning("opa_profile error, skipping latency gate: %s", profile["error"])
+        elif not profile["within_budget"]:
+            check = {**check, "is_valid": False, "over_budget": True, "error_message": (
+                f"latency budget exceeded: {profile['ns_per_op']} ns/op > {latency_budget_ns} ns/op"
+            )}
+        return profile, check
+
+    def _repair_prompt(self, rego_code: str, check: dict, profile: dict = None) -> str:
+        """opa_check 실패면 repair 프롬프트, latency budget 초과면 profile 을 담은 optimize 프롬프트"""
+        if check.get("over_budget"):
+            rules = "\n".join(
+                f"- {rule['name']}: mean {rule['mean_ns']} ns, p99 {rule['p99_ns']} ns, evals {rule['num_eval']}"
+                for rule in profile["rules"][:5]
+            )
+            return self.prompts["rego_optimize"].format(
+                rego_code=rego_code,
+                profile=f"ns/op: {profile['ns_per_op']}, allocs/op: {profile['allocs_per_op']}\n{rules}",
+                budget_ns=profile["budget_ns"]
+            )
+        return self.prompts["rego_repair"].format(rego_code=rego_code, error_message=check["error_message"])
+
+    async def _race_candidates(self, prompt_text: str, candidates: int):
+        """
+        후보 candidates 개를 동시에 생성/검증하고, 끝나는 순서대로 validation 이벤트를 낸다.
+        처음으로 유효한 후보가 나오면 나머지 후보(진행 중인 LLM 스트림 / tool 호출)를 취소한다.
+
+        각 validation 이벤트 data 에는 후보 결과(_candidate)가 함께 담긴다.
+        """
+        tasks = {
+            asyncio.create_task(self._draft_candidate(prompt_text, HEDGE_TEMPERATURES[i % len(HEDGE_TEMPERATURES)])): i
+            for i in range(candidates)
+        }
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        logger.warning("hedge candidate %d failed: %s", tasks[task], task.exception())
+                        continue
+                    rego_code, check, llm_seconds, check_seconds = task.result()
+                    yield {"event": "validation", "data": {
+                        "attempt": 1, "candidate": tasks[task], **check,
+                        "_candidate": (rego_code, check, llm_seconds, check_seconds)
+                    }}
+                    if check["is_valid"]:
+                        return
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def generate_policy_events(self, user_request: str, retry_limit: int = 3, use_cache: bool = True,
+                                     candidates: int = 1, latency_budget_ns: float = None):
+        """
+        정책 생성 과정을 이벤트 단위로 바로바로 내보내는 async generator.
+
+        generate → opa_check → repair 루프를 클라이언트가 직접 수행한다.
+        opa_check 는 LLM 턴 없이 MCP tool 로 바로 호출하고, 실패하면 컴파일 에러만 담은
+        짧은 repair 프롬프트로 다시 생성한다. 최초 생성 이후 최대 retry_limit 번 수정한다.
+
+        use_cache 이면 의미상 비슷한 요청으로 이미 검증된 정책이 있는지 semantic cache 를
+        먼저 조회하고, 새로 생성해서 검증을 통과한 정책은 캐시에 저장한다.
+        semantic cache 는 MCP 서버에 semantic 임베딩(EMBEDDER=openai)이 설정된 경우에만 동작하고,
+        아니면 항상 miss 이다.
+
+        candidates > 1 (hedged 모드) 이면 첫 초안을 temperature 가 다른 후보 여러 개로 동시에 생성해서
+        가장 먼저 검증을 통과한 후보를 사용하고 나머지는 취소한다 (비용을 더 쓰고 지연을 줄임).
+        모두 실패하면 가장 먼저 끝난 후보로 일반 repair 루프를 이어간다.
+        이 모드에서는 후보들의 token 이벤트를 보내지 않는다.
+
+        latency_budget_ns 가 있으면 opa_check 를 통과해서 결과로 돌려줄 최종 후보만 opa_profile 로 한 번 측정하고
+        (repair 중간 후보나 hedged 후보들은 측정하지 않음), ns/op 가 budget 을 넘으면 규칙별 profile 을 담은
+        optimize 프롬프트로 다시 생성한다 (retry_limit 에 포함).
+        semantic cache 에서 찾은 정책도 budget 을 넘으면 사용하지 않는다.
+
+        Yields:
+            {"event": "token", "data": {"attempt", "text"}}                 LLM 출력 토큰
+            {"event": "tool_call", "data": {"name", "arguments"}}          MCP tool 호출 직전
+            {"event": "validation", "data": {"attempt", "is_valid", ...}}  opa_check 결과
+            {"event": "profile", "data": {"attempt", "ns_per_op", ...}}    opa_profile 결과 (budget 이 있을 때)
+            {"event": "result", "data": {...}}                              최종 결과 (마지막 이벤트)
+        """
+        generation_started = time.perf_counter()
+
+        if use_cache:
+            try:
+                yield {"event": "tool_call", "data": {"name": "policy_cache_lookup", "arguments": {"user_request": user_request}}}
+                cached = await self.call_tool("policy_cache_lookup", {"user_request": user_request})
+                profile = None
+                if cached["hit"] and latency_budget_ns:
+                    profile, gated = await self._profile_gate(cached["rego_code"], {"is_valid": True}, latency_budget_ns)
+                    yield {"event": "profile", "data": {"attempt": 0, **profile}}
+                    if not gated["is_valid"]:
+                        logger.info("semantic cache hit exceeds latency budget, regenerating")
+                        cached["hit"] = False
+                if cached["hit"]:
+                    logger.info("semantic cache hit (score=%.3f)", cached["score"])
+                    GENERATION_SECONDS.labels("cached").observe(time.perf_counter() - generation_started)
+                    yield {"event": "result", "data": {
+                        "success": True,
+                        "policy": cached["rego_code"],
+                        "error_message": "",
+                        "attempts": 0,
+                        "candidates": 0,
+                        "profile": profile,
+                        "timings": {},
+                        "cached": True
+                    }}
+                    return
+            except Exception as e:
+                logger.warning("semantic cache lookup error: %s", e)
+
+        logger.info("Generating policy...")
+        timings = {"retrieval": 0.0, "llm": 0.0, "opa_check": 0.0, "opa_profile": 0.0}
+
+        # 비슷한 기존 정책을 few-shot 예시로 사용
+        started = time.perf_counter()
+        examples = await self.retrieve_examples(user_request)
+        timings["retrieval"] += time.perf_counter() - started
+
+        prompt_text = self.prompts["rego_gen"].format(user_request=user_request, examples=examples)
+        rego_code, check, profile = None, {"is_valid": False, "error_message": ""}, None
+
+        attempts = 0
+        candidates = max(1, min(candidates, HEDGE_MAX_CANDIDATES))
+        if candidates > 1:
+            attempts = 1
+            chosen = None
+            async for event in self._race_candidates(prompt_text, candidates):
+                result = event["data"].pop("_candidate")
+                yield event
+                if chosen is None or result[1]["is_valid"]:
+                    chosen = result
+
+            if chosen is None:
+                raise RuntimeError("all hedged candidates failed")
+            rego_code, check, llm_seconds, check_seconds = chosen
+            timings["llm"] += llm_seconds
+            timings["opa_check"] += check_seconds
+            if not check["is_valid"]:
+                GENERATION_RETRIES.inc()
+                prompt_text = self._repair_prompt(rego_code, check)
+
+        while True:
+            while not check["is_valid"] and attempts <= retry_limit:
+                attempts += 1
+
+                # LLM 요청 (토큰 단위 스트리밍)
+                purpose = "generate" if attempts == 1 else "repair"
+                started = time.perf_counter()
+                extractor, usage, chunks = RegoStreamExtractor(), None, 0
+                stream = self.model.astream(prompt_text)
+                try:
+                    async for chunk in stream:
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        if isinstance(chunk.content, str) and chunk.content:
+                            if not chunks:
+                                LLM_FIRST_TOKEN_SECONDS.labels(purpose).observe(time.perf_counter() - started)
+                            chunks += 1
+                            yield {"event": "token", "data": {"attempt": attempts, "text": chunk.content}}
+                            # 코드 블록이 닫히면 뒤따르는 설명 문장은 받지 않음
+                            if extractor.feed(chunk.content) and self.stop_early:
+                                break
+                finally:
+                    await stream.aclose()
+                elapsed = time.perf_counter() - started
+                timings["llm"] += elapsed
+                LLM_SECONDS.labels(purpose).observe(elapsed)
+                record_llm_tokens(purpose, usage, chunks)
+                rego_code, profile = extractor.result(), None
+
+                # 문법 검증 (MCP tool 직접 호출)
+                yield {"event": "tool_call", "data": {"name": "opa_check", "arguments": {"rego_code": rego_code}}}
+                started = time.perf_counter()
+                check = await self.call_tool("opa_check", {"rego_code": rego_code})
+                timings["opa_check"] += time.perf_counter() - started
+                # 서버 pre-lint 가 auto-fix (JSON 포장 제거 등) 를 적용했으면 고친 코드를 사용
+                rego_code = check.get("rego_code") or rego_code
+                yield {"event": "validation", "data": {"attempt": attempts, **check}}
+
+                if check["is_valid"]:
+                    break
+
+                logger.info("attempt %d failed: %s", attempts, check["error_message"])
+                GENERATION_RETRIES.inc()
+                prompt_text = self._repair_prompt(rego_code, check)
+
+            # 성능 gate: 검사를 모두 통과한 최종 후보만 한 번 측정 (repair 중간 후보는 측정하지 않음).
+            # budget 을 넘으면 실패로 보고, 재시도가 남았으면 optimize 프롬프트로 다시 생성
+            if not (check["is_valid"] and latency_budget_ns):
+                break
+            yield {"event": "tool_call", "data": {"name": "opa_profile", "arguments": {"policy_code": rego_code}}}
+            started = time.perf_counter()
+            profile, check = await self._profile_gate(rego_code, check, latency_budget_ns)
+            timings["opa_profile"] += time.perf_counter() - started
+            yield {"event": "profile", "data": {"attempt": attempts, **profile}}
+            if check["is_valid"] or attempts > retry_limit:
+                break
+
+            logger.info("attempt %d over latency budget: %s", attempts, check["error_message"])
+            GENERATION_RETRIES.inc()
+            prompt_text = self._repair_prompt(rego_code, check, profile)
+
+        if use_cache and check["is_valid"]:
+            try:
+                await self.call_tool("policy_cache_store", {"user_request": user_request, "rego_code": rego_code})
+            except Exception as e:
+                logger.warning("semantic cache store error: %s", e)
+
+        GENERATION_ATTEMPTS.observe(attempts)
+        GENERATION_SECONDS.labels("success" if check["is_valid"] else "failure").observe(
+            time.perf_counter() - generation_started
+        )
+        logger.info("policy generation finished: success=%s attempts=%d timings=%s", check["is_valid"], attempts, timings)
+
+        yield {"event": "result", "data": {
+            "success": check["is_valid"],
+            "policy": rego_code,
+            "error_message": check["error_message"],
+            "attempts": attempts,
+            "candidates": candidates,
+            "profile": profile,
+            "timings": {stage: round(seconds, 4) for stage, seconds in timings.items()},
+            "cached": False
+        }}
     
     async def test_policy(self, rego_code: str):
         """
-        Generate OPA Rego policy and test code using LLM, validate via MCP Server.
+        Generate OPA Rego test code using LLM, validate via MCP Server.
+
+        LLM 으로 테스트 코드를 만든 뒤 validate_and_test tool 한 번으로
+        fmt / check / test(+coverage) 를 수행하고 그 리포트를 반환한다.
         """
 
-        print(f"Generating Test OPA policy...")
+        logger.info("Generating Test OPA policy...")
         prompt_text = self.prompts["test_rego_gen"].format(rego_code=rego_code)
 
         # LLM 요청
-        policy_json = ""
-        inputs = {"messages": prompt_text}
-        async for chunk_msg, _ in self.agent.astream(inputs, stream_mode="messages"):
-            if hasattr(chunk_msg, "content") and isinstance(chunk_msg.content, str):
-                policy_json += chunk_msg.content
+        started = time.perf_counter()
+        extractor, usage, chunks = RegoStreamExtractor(), None, 0
+        stream = self.model.astream(prompt_text)
+        try:
+            async for chunk in stream:
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                if isinstance(chunk.content, str) and chunk.content:
+                    chunks += 1
+                    if extractor.feed(chunk.content) and self.stop_early:
+                        break
+        finally:
+            await stream.aclose()
+        llm_seconds = time.perf_counter() - started
+        LLM_SECONDS.labels("test").observe(llm_seconds)
+        record_llm_tokens("test", usage, chunks)
+        test_code = extractor.result()
 
-        result = self.extract_rego_or_last_json(policy_json)
-        print("="*50)
-        print(result)
+        # 검증 (MCP tool 1회)
+        report = await self.call_tool("validate_and_test", {"policy_code": rego_code, "test_code": test_code})
+        logger.info("test policy result: status=%s detail=%s", report.get("status"), report.get("detail"))
+        return {"test_code": test_code, "llm_seconds": round(llm_seconds, 4), **report}
 
 
 # ===============================
@@ -135,9 +620,30 @@ client_manager = MCPClientManager(
     azure_deployment="gpt-4o"
 )
 
+# 비동기 job 모드 (/jobs) 용 큐. 동기 엔드포인트도 admit() 으로 같은 상한을 적용 (worker 수만큼만 동시에 정책 생성)
+job_queue = JobQueue(client_manager.generate_policy)
+
 @app.on_event("startup")
 async def startup_event():
     await client_manager.initialize()
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_queue.stop()
+    await client_manager.close()
+
+@app.middleware("http")
+async def trace_middleware(request: Request, call_next):
+    """요청마다 trace id 설정 (X-Trace-Id 헤더가 있으면 그대로 사용), 응답 헤더로 반환"""
+    trace_id = request.headers.get(TRACE_HEADER) or new_trace_id()
+    token = trace_id_var.set(trace_id)
+    try:
+        response = await call_next(request)
+    finally:
+        trace_id_var.reset(token)
+    response.headers[TRACE_HEADER] = trace_id
+    return response
 
 # ===============================
 # FastAPI Endpoint
@@ -146,14 +652,114 @@ async def startup_event():
 async def generate_policy(request: dict):
     user_request = request.get("request")
     retry_limit = int(request.get("retry_limit", 3))
+    use_cache = bool(request.get("use_cache", True))
+    candidates = int(request.get("candidates", 1))
+    latency_budget_ns = float(request["latency_budget_ns"]) if request.get("latency_budget_ns") else None
 
     if not user_request:
         raise HTTPException(status_code=400, detail="Missing 'request' field.")
 
-    result = await client_manager.generate_policy(user_request, retry_limit)
+    try:
+        async with job_queue.admit():
+            result = await client_manager.generate_policy(user_request, retry_limit, use_cache, candidates,
+                                                          latency_budget_ns)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
     return result
 
+@app.post("/jobs", status_code=202)
+async def submit_job(request: dict):
+    """
+    정책 생성 job 등록. 결과는 GET /jobs/{job_id} 로 조회한다.
+    대기 중/실행 중인 job 과 요청이 같으면 기존 job_id 를 반환한다.
+    """
+    user_request = request.get("request")
+    retry_limit = int(request.get("retry_limit", 3))
+    use_cache = bool(request.get("use_cache", True))
+    candidates = int(request.get("candidates", 1))
+    latency_budget_ns = float(request["latency_budget_ns"]) if request.get("latency_budget_ns") else None
+
+    if not user_request:
+        raise HTTPException(status_code=400, detail="Missing 'request' field.")
+
+    try:
+        job, deduplicated = job_queue.submit(
+            user_request, retry_limit=retry_limit, use_cache=use_cache, candidates=candidates,
+            latency_budget_ns=latency_budget_ns
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    return {"job_id": job.job_id, "status": job.status, "deduplicated": deduplicated}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return {**job.to_dict(), "queue_position": job_queue.position(job)}
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """클라이언트 초기화(prompt / tool 로드) + MCP 서버 warm-up 이 모두 끝났는지"""
+    server = await client_manager.server_readiness()
+    ready = client_manager.state["initialized"] and bool(server.get("ready"))
+    content = {"ready": ready, **client_manager.state, "mcp_server": server,
+               "session_pool": client_manager.session_pool.stats if client_manager.session_pool else None,
+               "llm_gateway": client_manager.gateway.stats if client_manager.gateway else None}
+    return JSONResponse(content, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+async def metrics():
+    content, content_type = metrics_response()
+    return Response(content=content, media_type=content_type)
+
+@app.post("/generate_policy/stream")
+async def generate_policy_stream(request: dict):
+    """
+    /generate_policy 의 스트리밍 버전 (Server-Sent Events).
+    token / tool_call / validation 이벤트를 발생 즉시 보내고, 마지막에 result 이벤트를 보낸다.
+    """
+    user_request = request.get("request")
+    retry_limit = int(request.get("retry_limit", 3))
+    use_cache = bool(request.get("use_cache", True))
+    candidates = int(request.get("candidates", 1))
+    latency_budget_ns = float(request["latency_budget_ns"]) if request.get("latency_budget_ns") else None
+
+    if not user_request:
+        raise HTTPException(status_code=400, detail="Missing 'request' field.")
+
+    # 스트림을 열기 전에 대기열 자리를 잡아 둔다 (가득 차 있으면 429). 실행 슬롯은 스트림 안에서 대기
+    try:
+        admission = job_queue.reserve()
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    async def event_stream():
+        try:
+            await admission.acquire()
+            async for event in client_manager.generate_policy_events(user_request, retry_limit, use_cache, candidates,
+                                                                     latency_budget_ns):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+        finally:
+            admission.release()
+
+    stream = event_stream()
+    # 응답을 보내기 전에 연결이 끊겨 generator 가 시작되지 않은 채 버려져도 자리는 반납
+    weakref.finalize(stream, admission.release)
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ===============================
 # Local Test
 # ===============================
@@ -0,0 +1,255 @@
+import os
+import random
+import asyncio
+import logging
+from dataclasses import dataclass
+from contextlib import asynccontextmanager
+
+import anyio
+import httpx
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+from telemetry import MCP_SESSIONS, MCP_SESSION_ERRORS, MCP_POOL_OPEN
+
+# ===================================
+# MCP 세션 풀 설정
+# ===================================
+# 동시에 열어 둘 MCP 세션 수 (동시 tool 호출 수 상한)
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", 16))
+# idle 세션 health check (ping) 주기(초). 0 이면 사용 안 함
+MCP_POOL_PING_INTERVAL = float(os.getenv("MCP_POOL_PING_INTERVAL", 30))
+MCP_POOL_PING_TIMEOUT = float(os.getenv("MCP_POOL_PING_TIMEOUT", 5))
+# 세션 연결 실패 시 재시도 횟수와 backoff(초)
+MCP_CONNECT_RETRIES = int(os.getenv("MCP_CONNECT_RETRIES", 5))
+MCP_CONNECT_BACKOFF = float(os.getenv("MCP_CONNECT_BACKOFF", 0.2))
+MCP_CONNECT_BACKOFF_MAX = float(os.getenv("MCP_CONNECT_BACKOFF_MAX", 5))
+
+logger = logging.getLogger(__name__)
+
+# 세션이 끊겼다는 뜻의 예외. 이 외의 예외(tool 오류 등)는 세션을 그대로 두고 호출한 쪽으로 전달
+_TRANSPORT_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, httpx.TransportError)
+
+
+def _is_session_terminated(error: McpError) -> bool:
+    """
+    streamable-http 클라이언트는 알 수 없는 세션 id 에 대한 서버의 404 를
+    McpError(code=32600, "Session terminated") 로 바꿔서 올린다 (서버 재시작 후 첫 호출)
+    """
+    return abs(error.error.code) == 32600 and "session terminated" in (error.error.message or "").lower()
+
+
+def is_session_error(error: BaseException) -> bool:
+    """세션 / 연결이 끊겨서 난 오류인지 (ExceptionGroup 으로 감싸진 경우 포함)"""
+    if isinstance(error, _TRANSPORT_ERRORS):
+        return True
+    if isinstance(error, McpError):
+        return error.error.code == CONNECTION_CLOSED or _is_session_terminated(error)
+    if isinstance(error, httpx.HTTPStatusError):
+        # 서버가 세션 id 를 모름 (mcp-server 재시작 등)
+        return error.response.status_code == 404
+    return any(is_session_error(inner) for inner in getattr(error, "exceptions", ()))
+
+
+@dataclass
+class PooledSession:
+    session: object
+    closing: asyncio.Event
+    task: asyncio.Task
+
+
+class MCPSessionPool:
+    """
+    초기화가 끝난 MCP ClientSession 을 재사용하는 풀.
+
+    - connect() 는 초기화된 ClientSession 을 내주는 async context manager
+      (MultiServerMCPClient.session, in-process 세션 등). 세션마다 전용 task 가
+      context 를 열어 두므로 HTTP 커넥션(keep-alive)과 MCP 세션이 호출 사이에 유지된다
+    - 최대 size 개까지 열고, 모두 사용 중이면 반납될 때까지 대기
+    - 주기적으로 idle 세션에 ping 을 보내서 끊긴 세션을 정리
+    - 세션 오류(서버 재시작 등으로 연결이 끊김)가 나면 그 세션을 버리고 새 세션으로 한 번 더 실행.
+      tool 오류 등 다른 예외는 세션을 반납하고 재시도 없이 그대로 전달
+    """
+
+    def __init__(self, connect, size: int = MCP_POOL_SIZE, ping_interval: float = MCP_POOL_PING_INTERVAL):
+        self.connect = connect
+        self.size = size
+        self.ping_interval = ping_interval
+        self._idle = asyncio.Queue()
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._health_task = None
+        self._closed = False
+
+    @property
+    def stats(self) -> dict:
+        return {"size": self.size, "open": self._open, "in_use": self._in_use, "waiting": self._waiting}
+
+    def start(self):
+        if self._health_task is None and self.ping_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _connect_once(self) -> PooledSession:
+        """전용 task 에서 connect() context 를 열고, 닫으라는 신호가 올 때까지 유지"""
+        ready = asyncio.get_running_loop().create_future()
+        closing = asyncio.Event()
+
+        async def hold():
+            try:
+                async with self.connect() as session:
+                    ready.set_result(session)
+                    await closing.wait()
+            except Exception as e:
+                if not ready.done():
+                    ready.set_exception(e)
+                else:
+                    logger.warning("mcp session closed with error: %s", e)
+            finally:
+                if not ready.done():
+                    ready.cancel()
+
+        task = asyncio.create_task(hold())
+        session = await ready
+        return PooledSession(session=session, closing=closing, task=task)
+
+    async def _connect(self) -> PooledSession:
+        """연결 실패 시 지수 backoff + jitter 로 재시도"""
+        for attempt in range(MCP_CONNECT_RETRIES + 1):
+            try:
+                return await self._connect_once()
+            except Exception as e:
+                MCP_SESSION_ERRORS.labels("connect").inc()
+                if attempt == MCP_CONNECT_RETRIES:
+                    raise
+                delay = min(MCP_CONNECT_BACKOFF * 2 ** attempt, MCP_CONNECT_BACKOFF_MAX)
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning("mcp connect failed (%s), retry %d in %.2fs", e, attempt + 1, delay)
+                await asyncio.sleep(delay)
+
+    async def _acquire(self) -> PooledSession:
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except asyncio.QueueEmpty:
+                if self._open < self.size:
+                    return await self._open_session()
+                self._waiting += 1
+                try:
+                    pooled = await self._idle.get()
+                finally:
+                    self._waiting -= 1
+
+            if pooled is None:
+                # 다른 세션이 닫혀서 자리가 생김
+                continue
+            if pooled.task.done():
+                # idle 상태에서 끊긴 세션
+                self._discard(pooled)
+                continue
+            MCP_SESSIONS.labels("reused").inc()
+            return pooled
+
+    async def _open_session(self) -> PooledSession:
+        self._open += 1
+        MCP_POOL_OPEN.set(self._open)
+        try:
+            pooled = await self._connect()
+        except BaseException:
+            self._open -= 1
+            MCP_POOL_OPEN.set(self._open)
+            self._wake_waiter()
+            raise
+        MCP_SESSIONS.labels("new").inc()
+        return pooled
+
+    def _wake_waiter(self):
+        if self._waiting:
+            self._idle.put_nowait(None)
+
+    def _release(self, pooled: PooledSession):
+        if self._closed or pooled.task.done():
+            self._discard(pooled)
+        else:
+            self._idle.put_nowait(pooled)
+
+    def _discard(self, pooled: PooledSession):
+        pooled.closing.set()
+        self._open -= 1
+        MCP_POOL_OPEN.set(self._open)
+        self._wake_waiter()
+
+    @asynccontextmanager
+    async def session(self):
+        """
+        풀에서 세션을 빌려 쓰고 반납.
+        사용 중 세션 오류가 나거나 취소되면 상태를 알 수 없으므로 그 세션은 반납하지 않고 닫음
+        """
+        pooled = await self._acquire()
+        self._in_use += 1
+        healthy = False
+        try:
+            yield pooled.session
+            healthy = True
+        except Exception as e:
+            healthy = not is_session_error(e)
+            raise
+        finally:
+            self._in_use -= 1
+            if healthy:
+                self._release(pooled)
+            else:
+                self._discard(pooled)
+
+    async def run(self, func):
+        """
+        func(session) 실행. 세션 오류가 나면 새 세션으로 한 번 더 실행한다
+        (mcp-server 재시작 등으로 풀의 세션이 끊긴 경우). 그 외의 예외는 재시도하지 않는다.
+        """
+        try:
+            async with self.session() as session:
+                return await func(session)
+        except Exception as e:
+            if not is_session_error(e):
+                raise
+            MCP_SESSION_ERRORS.labels("call").inc()
+            logger.warning("mcp session error, reconnecting: %s", e)
+
+        async with self.session() as session:
+            return await func(session)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            for _ in range(self._idle.qsize()):
+                try:
+                    pooled = self._idle.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if pooled is None:
+                    self._idle.put_nowait(None)
+                    continue
+                try:
+                    await asyncio.wait_for(pooled.session.send_ping(), MCP_POOL_PING_TIMEOUT)
+                except Exception as e:
+                    MCP_SESSION_ERRORS.labels("ping").inc()
+                    logger.info("dropping unhealthy mcp session: %s", e)
+                    self._discard(pooled)
+                    continue
+                self._release(pooled)
+
+    async def close(self):
+        self._closed = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+        tasks = []
+        while not self._idle.empty():
+            pooled = self._idle.get_nowait()
+            if pooled is None:
+                continue
+            self._discard(pooled)
+            tasks.append(pooled.task)
+        await asyncio.gather(*tasks, return_exceptions=True)
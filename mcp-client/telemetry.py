@@ -0,0 +1,108 @@
+import os
+import uuid
+import logging
+import contextvars
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# ===================================
+# Trace ID / 로깅
+# ===================================
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+TRACE_HEADER = "X-Trace-Id"
+
+# FastAPI 요청마다 발급하는 trace id. MCP tool 호출 시 _meta.trace_id 로 서버에 전달
+trace_id_var = contextvars.ContextVar("trace_id", default="-")
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record):
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s"
+    )
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceIdFilter())
+
+# ===================================
+# Prometheus metrics
+# ===================================
+_LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+GENERATION_SECONDS = Histogram(
+    "policy_generation_duration_seconds", "End-to-end policy generation time", ["outcome"],
+    buckets=_LLM_BUCKETS + (120.0,)
+)
+GENERATION_ATTEMPTS = Histogram(
+    "policy_generation_attempts", "LLM attempts per policy generation", buckets=(1, 2, 3, 4, 5, 6, 8, 10)
+)
+GENERATION_RETRIES = Counter(
+    "policy_generation_retries_total", "Repair attempts after a failed opa_check"
+)
+LLM_SECONDS = Histogram(
+    "llm_stream_duration_seconds", "LLM streaming call time", ["purpose"], buckets=_LLM_BUCKETS
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_first_token_seconds", "Time to first LLM token", ["purpose"], buckets=_LLM_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "LLM tokens (usage metadata, chunk count if unavailable)", ["purpose", "kind"]
+)
+TOOL_CALL_SECONDS = Histogram(
+    "mcp_tool_call_duration_seconds", "MCP tool call round-trip time seen by the client", ["tool", "status"]
+)
+MCP_SESSIONS = Counter(
+    "mcp_client_sessions_total", "MCP sessions handed out by the session pool", ["kind"]
+)
+MCP_SESSION_ERRORS = Counter(
+    "mcp_client_session_errors_total", "MCP session failures (connect / call / ping)", ["stage"]
+)
+MCP_POOL_OPEN = Gauge(
+    "mcp_client_pool_open_sessions", "Open MCP sessions in the session pool"
+)
+LLM_CACHE_REQUESTS = Counter(
+    "llm_response_cache_total", "LLM response cache lookups and evictions", ["result"]
+)
+LLM_CACHE_BYTES = Gauge(
+    "llm_response_cache_bytes", "Bytes stored in the on-disk LLM response cache"
+)
+LLM_GATEWAY_REQUESTS = Counter(
+    "llm_gateway_requests_total", "LLM calls per deployment by outcome (ok / rate_limited / failover / error)",
+    ["deployment", "result"]
+)
+LLM_GATEWAY_IN_FLIGHT = Gauge(
+    "llm_gateway_in_flight", "LLM calls in flight per deployment", ["deployment"]
+)
+
+JOBS_SUBMITTED = Counter(
+    "policy_jobs_submitted_total", "Policy generation jobs by admission result", ["result"]
+)
+JOB_QUEUE_DEPTH = Gauge(
+    "policy_job_queue_depth", "Jobs waiting in the queue"
+)
+JOB_WAIT_SECONDS = Histogram(
+    "policy_job_wait_seconds", "Time a job waited in the queue before a worker picked it up", buckets=_LLM_BUCKETS
+)
+
+
+def metrics_response():
+    """/metrics 응답 본문과 content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def record_llm_tokens(purpose: str, usage: dict, chunks: int):
+    """usage_metadata 가 있으면 실제 토큰 수, 없으면 스트리밍 chunk 수를 출력 토큰 수로 기록"""
+    if usage:
+        LLM_TOKENS.labels(purpose, "input").inc(usage.get("input_tokens", 0))
+        LLM_TOKENS.labels(purpose, "output").inc(usage.get("output_tokens", 0))
+    else:
+        LLM_TOKENS.labels(purpose, "output").inc(chunks)
@@ -1,16 +1,80 @@
 from mcp.server.fastmcp import FastMCP
-# from service.mariadb import get_user_by_id, get_all_users
-from service.qdrant import QdrantService
+# from service.repository import repository
+from service.opa import (
+    get_validation_backend, get_opa_version, get_check_version, opa_test_async, format_errors, OpaServerBackend
+)
+from service.lint import prelint, prelint_pair, requires_if
+from service.executor import get_executor
+from service.cache import result_cache, make_key, make_verdict_key
+from service.batch import check_batch, test_batch
+from service.embedding import get_embedder
+from service.bundle import PolicyBundleBuilder, etag_matches
+from service.evaluator import OpaEvaluator
+from service.validation import validate_and_test
+from service.consistency import check_active_policies
+from service.profiler import profile_policy
+from service.benchmark_history import compare_with_history
+from service.readiness import warmup
+from service.telemetry import configure_logging, instrument_tools, metrics_response
+from starlette.responses import JSONResponse, Response
 
 import os
-import tempfile
-import subprocess
+import json
+import hashlib
+import logging
+from contextlib import asynccontextmanager
 
-# Qdrant 연결
-qdrant = QdrantService(url="http://qdrant:6333")
+configure_logging()
+logger = logging.getLogger("mcp_server")
+
+# Qdrant / 임베딩을 쓰는 backend 는 처음 사용할 때 import / 생성 (서버 시작 시간에 포함되지 않도록)
+qdrant = None
+semantic_cache = None
+policy_indexer = None
+bundle_builder = PolicyBundleBuilder()
+evaluator = None
+
+
+def get_qdrant():
+    # QDRANT_LOCATION=":memory:" 이면 서버 없이 메모리 모드
+    global qdrant
+    if qdrant is None:
+        from service.qdrant import QdrantService
+        qdrant = QdrantService(
+            url=os.getenv("QDRANT_URL", "http://qdrant:6333"),
+            location=os.getenv("QDRANT_LOCATION")
+        )
+    return qdrant
+
+
+def get_semantic_cache():
+    global semantic_cache
+    if semantic_cache is None:
+        from service.semantic_cache import SemanticPolicyCache
+        semantic_cache = SemanticPolicyCache(get_qdrant(), get_embedder())
+    return semantic_cache
+
+
+def get_policy_indexer():
+    global policy_indexer
+    if policy_indexer is None:
+        from service.policy_index import PolicyIndexer
+        policy_indexer = PolicyIndexer(get_qdrant(), get_embedder())
+    return policy_indexer
+
+
+def get_evaluator():
+    # 평가는 상주 OPA 서버가 필요하므로 CLI backend 설정이어도 서버 backend 를 사용
+    global evaluator
+    if evaluator is None:
+        backend = get_validation_backend()
+        evaluator = OpaEvaluator(backend if hasattr(backend, "client") else OpaServerBackend())
+    return evaluator
 
 # MCP Server 생성
 mcp_server = FastMCP(name="opa_tools", host="0.0.0.0", port="8001", debug=True)
+# tool 호출마다 trace_id 설정 + 호출 수 / 처리 시간 metric
+instrument_tools(mcp_server)
 
 
 @mcp_server.prompt("base_prompt")
@@ -31,12 +95,54 @@ Generate a valid OPA Rego policy based on the request below.
 [User request]
 {user_request}
 
+[Reference policies]
+{examples}
+
 Rules:
 - Ensure the policy follows valid Rego syntax (with 'opa check' command).
-- If the generated code is not valid, re-generate code.
+- Use the reference policies only as style and syntax examples.
 - `if` keyword is required before the rule body starts.
 - Do not include explanations or comments.
-- Output must be a JSON only.
+- Output must be a JSON only: {{"rego_code": "<policy code>"}}
+"""
+
+@mcp_server.prompt("rego_repair_prompt")
+def get_rego_repair_prompt() -> str:
+    """
+    Get a prompt to fix rego code that failed 'opa check'.
+    """
+    return """
+Fix the OPA Rego policy below so that 'opa check' passes. Keep its behavior.
+
+[Rego code]
+{rego_code}
+
+[opa check error]
+{error_message}
+
+Output must be a JSON only: {{"rego_code": "<fixed policy code>"}}
+"""
+
+@mcp_server.prompt("rego_optimize_prompt")
+def get_rego_optimize_prompt() -> str:
+    """
+    Get a prompt to speed up rego code that exceeded its latency budget.
+    """
+    return """
+Rewrite the OPA Rego policy below so that it evaluates faster. Keep its behavior.
+
+[Rego code]
+{rego_code}
+
+[opa profile]
+{profile}
+
+Rules:
+- The policy must evaluate within {budget_ns} ns per decision.
+- Focus on the most expensive rules listed in the profile.
+- Avoid nested iteration over input collections; prefer direct lookups, sets and object keys.
+- `if` keyword is required before the rule body starts.
+- Output must be a JSON only: {{"rego_code": "<optimized policy code>"}}
 """
 
 @mcp_server.prompt("test_rego_gen_prompt")
@@ -55,7 +161,7 @@ Rules:
 - If the generated code is not valid, re-generate code.
 - `if` keyword is required before the rule body starts.
 - Do not include explanations or comments.
-- Output must be a JSON only.
+- Output must be a JSON only: {{"rego_code": "<test code>"}}
 """
 
 @mcp_server.prompt("opa_test_prompt")
@@ -77,6 +183,24 @@ Output JSON only:
 }
 """
 
+# prompt 내용의 hash. 클라이언트는 이 값이 같으면 디스크에 캐시한 prompt 를 그대로 사용
+PROMPTS_VERSION = hashlib.sha256(json.dumps({
+    "base_prompt": get_agent_prompt(),
+    "rego_gen_prompt": get_rego_gen_prompt(),
+    "rego_repair_prompt": get_rego_repair_prompt(),
+    "rego_optimize_prompt": get_rego_optimize_prompt(),
+    "test_rego_gen_prompt": get_test_rego_gen_prompt(),
+    "opa_test_prompt": get_opa_test_prompt(),
+}, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+@mcp_server.resource("prompts://version")
+def get_prompts_version() -> str:
+    """
+    Get the hash of all prompt templates (changes whenever a prompt changes).
+    """
+    return PROMPTS_VERSION
+
 # -------------------------------
 # Tool: User 정보 추출
 # -------------------------------
@@ -84,8 +208,8 @@ Output JSON only:
 # async def get_user_tool(data: dict):
 #     emp_id = data.get("emp_id")
 #     if emp_id:
-#         return {"user": get_user_by_id(emp_id)}
-#     return {"users": get_all_users()}
+#         return {"user": await repository.get_user_by_id(emp_id)}
+#     return {"users": [user async for batch in repository.iter_users() for user in batch]}
 
 # -------------------------------
 # Tool: Rego 코드 테스트
@@ -102,14 +226,22 @@ async def opa_check(rego_code):
         as defined by the OPA compiler. It does not execute or test the logic of the policy —
         only the correctness of the code structure and grammar.
 
-        The function temporarily writes the given Rego code to a `.rego` file
-        and runs the `opa check` CLI command to verify its syntax.
-        If the command returns a zero exit code, the code is syntactically valid.
+        The code is compiled by a long-running OPA server (`PUT /v1/policies`)
+        over a pooled keep-alive HTTP connection, so no `opa` process is started
+        per call. If the server is not reachable, the `opa check` CLI is used instead.
 
         This tool is particularly useful before running OPA unit tests or deploying
         Rego policies to production environments, as it prevents invalid code
         from being evaluated or executed.
 
+        Obviously broken code (missing `package`, unbalanced braces, unterminated
+        strings, missing `if` before a rule body) is rejected by an in-process pre-lint
+        without invoking OPA. Code wrapped in JSON ({"rego_code": ...}) or a code fence
+        is unwrapped before it is checked.
+
+        Results are cached per module. Code that was already found valid is also answered
+        from the cache when it differs only in indentation, spacing or comments.
+
     Args:
         rego_code: str
             The OPA policy code as a string. This should contain valid Rego language syntax.
@@ -117,7 +249,7 @@ async def opa_check(rego_code):
     Returns (JSON):
         {
             "reto_code": str
-                - The input rego code
+                - The checked rego code (the input after safe auto-fixes)
 
             "is_valid": bool
                 - True if the syntax check passed (valid Rego code)
@@ -126,32 +258,43 @@ async def opa_check(rego_code):
             "error_message": str
                 - An empty string if valid
                 - The compiler error message returned by OPA if invalid
+                  ("policy.rego:<row>[:<col>]: <code>: <message>")
+
+            "fixes": list[str]
+                - Auto-fixes applied to the input (e.g. "unwrap_json")
         }
     """
     is_valid = False
     error_message = ""
+    fixes = []
     try:
-        # 임시 파일에 정책 저장
-        with tempfile.NamedTemporaryFile(mode="w", suffix=".rego", delete=False) as tmp:
-            tmp.write(rego_code)
-            tmp_path = tmp.name
-
-        # opa check 실행
-        result = subprocess.run(
-            ["opa", "check", tmp_path],
-            capture_output=True,
-            text=True
-        )
+        # 검증하는 쪽(OPA 서버 또는 CLI)의 버전
+        opa_version = await get_check_version()
 
-        if result.returncode == 0:
-            is_valid = True
-        else:
-            error_message = result.stderr.strip()
+        # 확실히 잘못된 코드는 OPA 를 부르지 않고 거절, JSON 포장 등은 벗겨서 검증
+        lint = prelint(rego_code, requires_if(opa_version))
+        rego_code, fixes = lint.rego_code, lint.fixes
+        if not lint.ok:
+            return {"rego_code": rego_code, "is_valid": False,
+                    "error_message": format_errors(lint.errors), "fixes": fixes}
+
+        # 같은 (정규화된) 코드는 이전 결과 재사용. 들여쓰기 / 공백만 다른 코드는 '유효함' 판정을 재사용
+        cache_key = make_key("check", [rego_code], opa_version)
+        verdict_key = make_verdict_key("check", [rego_code], opa_version)
+        cached = result_cache.get(cache_key, verdict_key)
+        if cached is not None:
+            return {"rego_code": rego_code, **cached, "fixes": fixes}
+
+        # 상주 OPA 서버 (또는 CLI fallback) 로 검증
+        is_valid, error_message = await get_validation_backend().check(rego_code)
+        result_cache.set(cache_key, {"is_valid": is_valid, "error_message": error_message})
+        if is_valid:
+            result_cache.set(verdict_key, {"is_valid": True, "error_message": ""})
 
     except Exception as e:
         error_message = str(e)
 
-    return {"rego_code": rego_code, "is_valid": is_valid, "error_message": error_message}
+    return {"rego_code": rego_code, "is_valid": is_valid, "error_message": error_message, "fixes": fixes}
 
 @mcp_server.tool("opa_test")
 async def opa_test(policy_code, test_code):
@@ -170,8 +313,12 @@ async def opa_test(policy_code, test_code):
         Each test case evaluates specific input data and checks whether the policy produces
         the expected decision output.
 
-        The function automatically writes both Rego sources into temporary files,
-        executes the OPA test runner, and captures the detailed CLI output.
+        Both sources go through the same in-process pre-lint as `opa_check` first;
+        obviously broken code fails without running OPA.
+
+        The function writes both Rego sources into a scratch directory owned by this call,
+        executes the OPA test runner as an asyncio subprocess (bounded by
+        OPA_MAX_CONCURRENCY and OPA_EXEC_TIMEOUT), and captures the detailed CLI output.
         It returns a structured JSON result indicating whether all tests passed or failed,
         along with the OPA output (including any stack traces or failure reasons).
 
@@ -199,44 +346,689 @@ async def opa_test(policy_code, test_code):
     if not test_code:
         return {"status": "error", "detail": "test_code is missing"}
 
-    policy_path = "/tmp/policy.rego"
-    test_path = "/tmp/policy_test.rego"
+    try:
+        opa_version = await get_opa_version()
+
+        # 확실히 잘못된 코드는 opa test 를 실행하지 않고 실패 처리
+        policy_code, test_code, error_message = prelint_pair(policy_code, test_code, requires_if(opa_version))
+        if error_message:
+            return {"status": "fail", "detail": error_message}
+
+        cache_key = make_key("test", [policy_code, test_code], opa_version)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
+        # 독립된 워크스페이스에서 비동기로 opa test 실행 (이벤트 루프를 막지 않음)
+        result = await opa_test_async(policy_code, test_code)
+        # timeout 등 실행 오류는 일시적일 수 있으므로 캐시하지 않음
+        if result["status"] != "error":
+            result_cache.set(cache_key, result)
+        return result
+
+    except Exception as e:
+        return {"status": "error", "detail": str(e)}
+
+@mcp_server.tool("validate_and_test")
+async def validate_and_test_tool(policy_code: str, test_code: str):
+    """
+    Tool Name: validate_and_test
+    --------------------
+    Description:
+        Formats, type-checks and unit-tests a Rego policy together with its test code
+        in a single call, and returns a structured report including test coverage.
+
+        Both files are written into one workspace owned by this call, then
+        `opa fmt`, `opa check` and `opa test --coverage` are run on it. If the check
+        fails the tests are not run. Use this instead of calling `opa_check` and
+        `opa_test` separately.
+
+    Args:
+        policy_code: str
+            The main Rego policy logic to be validated.
+        test_code: str
+            A Rego test file that defines unit tests using OPA's `test_` naming convention.
 
-    # 정책 코드 저장
-    with open(policy_path, "w", encoding="utf-8") as f:
-        f.write(policy_code)
+    Returns (JSON):
+        {
+            "status": str               - "success" | "fail" | "error"
+            "detail": str               - Test summary or compiler errors
+            "is_valid": bool            - True if `opa check` passed for both files
+            "error_message": str        - Compiler errors ("" if valid)
+            "formatted_policy": str     - The policy after `opa fmt` (input if it could not be formatted)
+            "formatted_test": str       - The test code after `opa fmt`
+            "tests": list               - [{"name", "package", "passed", "duration_ns", "error"}]
+            "passed": int               - Number of passed tests
+            "failed": int               - Number of failed tests
+            "coverage": float           - Policy line coverage in percent
+            "uncovered_lines": list     - Policy line numbers not covered by any test
+            "timings_ms": dict          - {"fmt", "check", "test", "total"} in milliseconds
+        }
+    """
+    if not policy_code:
+        return {"status": "error", "detail": "rego_code is missing"}
 
-    # 테스트 파일 생성 (없으면 생성)
-    with open(test_path, "w", encoding="utf-8") as f:
-        f.write(test_code)
+    if not test_code:
+        return {"status": "error", "detail": "test_code is missing"}
 
     try:
-        # opa test 실행
-        result = subprocess.run(
-            ["opa", "test", policy_path, test_path],
-            capture_output=True,
-            text=True
-        )
+        cache_key = make_key("validate_and_test", [policy_code, test_code], await get_opa_version())
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
 
-        if result.returncode == 0:
-            return {"status": "success", "detail": result.stdout.strip() or "OPA test passed successfully."}
-        else:
-            return {"status": "fail", "detail": result.stderr.strip() or "OPA test failed."}
+        result = await validate_and_test(policy_code, test_code)
+        if result["status"] != "error":
+            result_cache.set(cache_key, result)
+        return result
 
     except Exception as e:
         return {"status": "error", "detail": str(e)}
 
-    finally:
-        # 테스트 후 임시 정책 파일 삭제
-        if os.path.exists(policy_path):
-            os.remove(policy_path)
+# -------------------------------
+# Tool: 여러 Rego 코드 일괄 검증
+# -------------------------------
+@mcp_server.tool("opa_check_batch")
+async def opa_check_batch(rego_codes: list[str]):
+    """
+    Tool Name: opa_check_batch
+    --------------------
+    Description:
+        Validates the syntax of many OPA Rego modules in a single call.
+
+        All modules are written into one workspace (one directory per item) and
+        checked with a single `opa check` run over the directory. Modules that declare
+        the same package are split into separate runs so that they cannot conflict
+        with each other. Diagnostics are attributed back to the input item they came from.
+
+        Like `opa_check`, each module is pre-linted first: obviously broken modules are
+        rejected without running OPA and safe auto-fixes (e.g. unwrapping JSON) are applied.
+        Previously validated modules are answered from the result cache shared with `opa_check`.
+
+    Args:
+        rego_codes: list[str]
+            The OPA policy codes to validate.
+
+    Returns (JSON):
+        {
+            "results": [
+                {
+                    "index": int          - Position of the item in `rego_codes`
+                    "rego_code": str      - The checked rego code (after auto-fixes)
+                    "is_valid": bool      - True if the syntax check passed
+                    "error_message": str  - Compiler errors for this item ("" if valid)
+                    "fixes": list[str]    - Auto-fixes applied to the input
+                }
+            ]
+        }
+    """
+    try:
+        # 일괄 검증은 CLI 로 하므로 로컬 opa 버전 (서버와 같은 버전이면 opa_check 와 캐시 항목 공유)
+        opa_version = await get_opa_version()
+        v1 = requires_if(opa_version)
+        codes, fixes, results = [], [], []
+        for code in rego_codes:
+            lint = prelint(code, v1)
+            codes.append(lint.rego_code)
+            fixes.append(lint.fixes)
+            results.append(None if lint.ok else {"is_valid": False, "error_message": format_errors(lint.errors)})
+
+        # opa_check 와 같은 key (정규화된 auto-fix 후 코드)
+        keys = [make_key("check", [code], opa_version) for code in codes]
+        verdict_keys = [make_verdict_key("check", [code], opa_version) for code in codes]
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                results[i] = result_cache.get(key, verdict_keys[i])
+
+        # pre-lint 를 통과했고 캐시에 없는 항목만 opa check 한 번으로 검증
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            checked = await check_batch([codes[i] for i in missing])
+            for i, item in zip(missing, checked):
+                results[i] = {"is_valid": item["is_valid"], "error_message": item["error_message"]}
+                result_cache.set(keys[i], results[i])
+                if item["is_valid"]:
+                    result_cache.set(verdict_keys[i], results[i])
+
+        return {"results": [
+            {"index": i, "rego_code": code, **results[i], "fixes": fixes[i]} for i, code in enumerate(codes)
+        ]}
+
+    except Exception as e:
+        return {"results": [
+            {"index": i, "rego_code": code, "is_valid": False, "error_message": str(e), "fixes": []}
+            for i, code in enumerate(rego_codes)
+        ]}
+
+@mcp_server.tool("opa_test_batch")
+async def opa_test_batch(items: list[dict]):
+    """
+    Tool Name: opa_test_batch
+    --------------------
+    Description:
+        Executes OPA unit tests for many policy/test pairs in a single call.
+
+        Every pair is written into its own directory inside one workspace and a single
+        `opa test --format json` run is executed over the directory. Pairs that declare
+        the same packages are split into separate runs. Each test case result is
+        attributed back to the pair it belongs to.
+
+    Args:
+        items: list[dict]
+            [{"policy_code": str, "test_code": str}, ...]
+
+    Returns (JSON):
+        {
+            "results": [
+                {
+                    "index": int      - Position of the pair in `items`
+                    "status": str     - "success" | "fail" | "error"
+                    "detail": str     - Test summary or compiler errors for this pair
+                    "tests": list     - [{"name", "package", "passed", "duration_ns", "error"}]
+                }
+            ]
+        }
+    """
+    results = [None] * len(items)
+    pending = []
+    for i, item in enumerate(items):
+        if not item.get("policy_code"):
+            results[i] = {"index": i, "status": "error", "detail": "rego_code is missing", "tests": []}
+        elif not item.get("test_code"):
+            results[i] = {"index": i, "status": "error", "detail": "test_code is missing", "tests": []}
+        else:
+            pending.append(i)
+
+    try:
+        if pending:
+            tested = await test_batch([items[i] for i in pending])
+            for i, item in zip(pending, tested):
+                results[i] = {**item, "index": i}
+
+    except Exception as e:
+        for i in pending:
+            results[i] = {"index": i, "status": "error", "detail": str(e), "tests": []}
+
+    return {"results": results}
+
+# -------------------------------
+# Tool: 활성 정책 전체 교차 검증
+# -------------------------------
+@mcp_server.tool("policy_consistency_check")
+async def policy_consistency_check(shards: int = None):
+    """
+    Tool Name: policy_consistency_check
+    --------------------
+    Description:
+        Checks all active policies in the MariaDB `policy` table together, as they would
+        be deployed in one bundle, and reports conflicts between them.
+
+        Policies that can affect each other (same or nested package, `data.` references
+        to another policy's package) are grouped into the same shard. Shards are checked
+        in parallel with one `opa check` run each, bounded by OPA_MAX_CONCURRENCY.
+        Package collisions and duplicate `default` rules are detected without OPA.
+
+        The same check is available as a CLI: `python -m service.consistency`.
+
+    Args:
+        shards: int (optional)
+            Number of shards (default: OPA_MAX_CONCURRENCY).
+
+    Returns (JSON):
+        {
+            "policies": int     - Number of policies checked
+            "shards": int       - Number of shards
+            "valid": bool       - True if no error-level conflict was found
+            "conflicts": [
+                {
+                    "kind": str             - "package_collision" | "conflicting_default" | OPA error code
+                    "severity": str         - "error" | "warning"
+                    "package": str          - Package of the policy where the conflict was found
+                    "policy_ids": list[int] - Policies involved
+                    "message": str          - Description or OPA error message
+                }
+            ]
+            "elapsed": float    - Seconds spent
+        }
+    """
+    try:
+        return await check_active_policies(shards)
+    except Exception as e:
+        logger.error("policy consistency check error: %s", e)
+        return {"policies": 0, "shards": 0, "valid": False, "conflicts": [], "elapsed": 0.0, "error": str(e)}
+
+# -------------------------------
+# Tool: 요청 문장 기반 semantic cache
+# -------------------------------
+@mcp_server.tool("policy_cache_lookup")
+async def policy_cache_lookup(user_request: str):
+    """
+    Tool Name: policy_cache_lookup
+    --------------------
+    Description:
+        Looks up a previously generated and validated Rego policy for a semantically
+        similar user request.
+
+        The request is embedded and searched in the Qdrant cache collection. Only entries
+        of the current cache version that are younger than the TTL, whose similarity
+        is above the threshold and whose numbers and negations ("not", "불가능", ...)
+        match the request exactly are returned.
+
+        The cache is disabled (always a miss) unless a semantic embedder is configured
+        (EMBEDDER=openai); the lexical hashing embedder scores opposite requests as similar.
+
+    Args:
+        user_request: str
+            The natural-language policy request.
+
+    Returns (JSON):
+        {
+            "hit": bool          - True if a similar request was found
+            "rego_code": str     - The cached policy ("" on miss)
+            "request": str       - The cached request text that matched ("" on miss)
+            "score": float       - Cosine similarity of the match (0.0 on miss)
+        }
+    """
+    try:
+        cached = await get_semantic_cache().lookup(user_request)
+    except Exception as e:
+        logger.warning("semantic cache lookup error: %s", e)
+        cached = None
+
+    if cached is None:
+        return {"hit": False, "rego_code": "", "request": "", "score": 0.0}
+    return {"hit": True, **cached}
+
+@mcp_server.tool("policy_cache_store")
+async def policy_cache_store(user_request: str, rego_code: str):
+    """
+    Tool Name: policy_cache_store
+    --------------------
+    Description:
+        Stores a generated Rego policy in the semantic cache for the given user request.
+        The policy is validated with `opa_check` first and is only stored if it passes.
+        The stored code is the one `opa_check` validated, after its auto-fixes
+        (code fence / JSON unwrapping), not the raw input.
 
-        if os.path.exists(test_path):
-            os.remove(test_path)
+    Args:
+        user_request: str
+            The natural-language policy request.
+        rego_code: str
+            The generated policy code.
+
+    Returns (JSON):
+        {
+            "stored": bool       - True if the entry was inserted
+            "error_message": str - Why the entry was not stored ("" if stored)
+        }
+    """
+    if not get_semantic_cache().enabled:
+        return {"stored": False, "error_message": "semantic cache is disabled (no semantic embedder configured)"}
+
+    check = await opa_check(rego_code)
+    if not check["is_valid"]:
+        return {"stored": False, "error_message": check["error_message"]}
+
+    try:
+        # pre-lint auto-fix 로 포장(fence / JSON)을 벗긴 코드 = 실제로 검증을 통과한 코드
+        await get_semantic_cache().store(user_request, check["rego_code"])
+    except Exception as e:
+        return {"stored": False, "error_message": str(e)}
+    return {"stored": True, "error_message": ""}
+
+# -------------------------------
+# Tool: 기존 정책 검색 (few-shot 예시용)
+# -------------------------------
+@mcp_server.tool("policy_examples")
+async def policy_examples(user_request: str, top_k: int = 3, created_by: str = None, api_id: int = None):
+    """
+    Tool Name: policy_examples
+    --------------------
+    Description:
+        Retrieves the existing active policies that are most similar to the user request,
+        to be used as few-shot examples for policy generation.
+
+        Policies from the MariaDB `policy` table are indexed in a Qdrant collection.
+        If the last sync is older than POLICY_INDEX_SYNC_INTERVAL, an incremental sync is
+        started in the background; the search itself never waits for it.
+
+    Args:
+        user_request: str
+            The natural-language policy request.
+        top_k: int
+            Number of policies to return.
+        created_by: str (optional)
+            Only return policies created by this employee ID.
+        api_id: int (optional)
+            Only return policies attached to this API.
+
+    Returns (JSON):
+        {
+            "examples": [
+                {"policy_id": int, "policy_name": str, "description": str, "rego_code": str, "score": float}
+            ]
+        }
+    """
+    try:
+        indexer = get_policy_indexer()
+        indexer.maybe_sync_in_background()
+        examples = await indexer.retrieve(user_request, top_k, created_by, api_id)
+    except Exception as e:
+        logger.warning("policy examples error: %s", e)
+        examples = []
+    return {"examples": examples}
+
+@mcp_server.tool("policy_index_sync")
+async def policy_index_sync(full: bool = False):
+    """
+    Tool Name: policy_index_sync
+    --------------------
+    Description:
+        Incrementally indexes the MariaDB `policy` table into Qdrant.
+
+        Only rows whose updated_at is past the last watermark (minus a small overlap
+        window, to catch rows committed late with an earlier timestamp) are read,
+        using keyset pagination, and rows whose checksum did not change are not
+        re-embedded. Changed rows are embedded and bulk-upserted in batches.
+
+    Args:
+        full: bool
+            If True, rescan the whole table (unchanged rows are still skipped by checksum).
+
+    Returns (JSON):
+        {
+            "scanned": int    - Rows read from MariaDB
+            "upserted": int   - Rows embedded and written to Qdrant
+            "elapsed": float  - Seconds spent
+        }
+    """
+    return await get_policy_indexer().sync(full)
+
+# -------------------------------
+# Tool: 실행 중인 OPA 로 정책 평가
+# -------------------------------
+@mcp_server.tool("opa_eval")
+async def opa_eval(policy_code: str, input: dict, query: str = "allow"):
+    """
+    Tool Name: opa_eval
+    --------------------
+    Description:
+        Evaluates a Rego policy against one input document using the long-running OPA server.
+
+        The policy is loaded once with `PUT /v1/policies` (identical code is reused on later
+        calls) and the decision is queried through `/v1/data/<package>/<query>`.
+        No `opa` process is started.
+
+    Args:
+        policy_code: str
+            The Rego policy to evaluate.
+        input: dict
+            The input document (`input` in Rego).
+        query: str
+            The rule inside the policy package to evaluate (e.g. "allow"; "" for the whole package).
+
+    Returns (JSON):
+        {
+            "result": any        - The decision (null if undefined)
+            "latency_ms": float  - Time spent evaluating this decision
+            "error": str | null  - Load or evaluation error
+        }
+    """
+    result = await opa_eval_batch(policy_code, [input], query)
+    if result["error"]:
+        return {"result": None, "latency_ms": 0.0, "error": result["error"]}
+    decision = result["decisions"][0]
+    return {"result": decision["result"], "latency_ms": decision["latency_ms"], "error": decision["error"]}
+
+@mcp_server.tool("opa_eval_batch")
+async def opa_eval_batch(policy_code: str, inputs: list[dict], query: str = "allow"):
+    """
+    Tool Name: opa_eval_batch
+    --------------------
+    Description:
+        Evaluates a Rego policy against many input documents using the long-running OPA server.
+
+        The policy is loaded once, then all inputs are evaluated through `/v1/data`
+        concurrently over a pooled keep-alive HTTP client (bounded by OPA_EVAL_CONCURRENCY).
+        Useful to replay thousands of recorded requests against a generated policy.
+
+    Args:
+        policy_code: str
+            The Rego policy to evaluate.
+        inputs: list[dict]
+            The input documents.
+        query: str
+            The rule inside the policy package to evaluate (e.g. "allow"; "" for the whole package).
+
+    Returns (JSON):
+        {
+            "decisions": [{"index": int, "result": any, "latency_ms": float, "error": str | null}],
+            "load_ms": float     - Time spent loading the policy (≈0 when already loaded)
+            "total_ms": float    - Total time for the call
+            "error": str | null  - Policy load error (compile errors, unreachable server)
+        }
+    """
+    try:
+        result = await get_evaluator().evaluate(policy_code, inputs, query)
+        return {**result, "error": None}
+    except Exception as e:
+        return {"decisions": [], "load_ms": 0.0, "total_ms": 0.0, "error": str(e)}
+
+# -------------------------------
+# Tool: 정책 성능 profiling
+# -------------------------------
+@mcp_server.tool("opa_profile")
+async def opa_profile(policy_code: str, inputs: list[dict] = None, query: str = "allow", budget_ns: float = None):
+    """
+    Tool Name: opa_profile
+    --------------------
+    Description:
+        Measures how expensive a Rego policy is to evaluate.
+
+        Each input is evaluated with `opa eval --profile` and the expression timings are
+        summed per rule. `opa bench` measures ns/op and allocations on the first
+        OPA_BENCH_INPUTS inputs. When no inputs are given, they are synthesized from the
+        `input.` paths the policy reads and the literals it compares them with.
+
+    Args:
+        policy_code: str
+            The Rego policy to profile.
+        inputs: list[dict] (optional)
+            Input documents to evaluate (default: synthesized from the policy).
+        query: str
+            The rule inside the policy package to evaluate (e.g. "allow"; "" for the whole package).
+        budget_ns: float (optional)
+            Latency budget in ns/op; `within_budget` reports whether the policy fits.
+
+    Returns (JSON):
+        {
+            "query": str            - Evaluated query (data.<package>.<query>)
+            "inputs": int           - Number of inputs profiled
+            "ns_per_op": float      - Mean evaluation time per decision (opa bench)
+            "allocs_per_op": float  - Heap allocations per decision
+            "bytes_per_op": float   - Heap bytes per decision
+            "rules": [
+                {"name": str, "total_ns": int, "mean_ns": float, "p99_ns": float, "num_eval": int}
+            ]                       - Per-rule breakdown, most expensive first
+            "budget_ns": float | null
+            "within_budget": bool | null
+            "opa_version": str
+            "error": str | null     - Compile or evaluation error
+        }
+    """
+    try:
+        result = await profile_policy(policy_code, inputs, query, budget_ns)
+        return {**result, "opa_version": await get_opa_version(), "error": None}
+    except Exception as e:
+        return {"query": query, "inputs": 0, "ns_per_op": 0.0, "allocs_per_op": 0.0, "bytes_per_op": 0.0,
+                "rules": [], "budget_ns": budget_ns, "within_budget": False if budget_ns is not None else None,
+                "opa_version": "", "error": str(e)}
+
+# -------------------------------
+# Tool: 정책 성능 regression 검사
+# -------------------------------
+@mcp_server.tool("policy_benchmark_compare")
+async def policy_benchmark_compare(policy_code: str, policy_id: int = None, inputs: list[dict] = None,
+                                   query: str = "allow", threshold: float = None, record: bool = True):
+    """
+    Tool Name: policy_benchmark_compare
+    --------------------
+    Description:
+        Benchmarks a new version of a policy and compares it with its previous versions
+        recorded in the MariaDB `policy_benchmark` tables.
+
+        Previous versions are runs with the same policy_id (or the same package when
+        policy_id is not given) and a different policy hash, measured on the same input
+        corpus and OPA version. When no inputs are given, the corpus of the latest previous
+        version is reused so both versions see the same inputs. The baseline is the median
+        of the last BENCH_BASELINE_RUNS runs; ns/op, allocs/op and per-rule p99 that grow by
+        more than the threshold are reported as regressions.
+
+    Args:
+        policy_code: str
+            The new version of the policy.
+        policy_id: int (optional)
+            The policy's ID in the `policy` table.
+        inputs: list[dict] (optional)
+            Input corpus (default: the previous version's corpus, else synthesized).
+        query: str
+            The rule inside the policy package to evaluate (default "allow").
+        threshold: float (optional)
+            Allowed slowdown ratio (default BENCH_REGRESSION_THRESHOLD, e.g. 0.1 = 10%).
+        record: bool
+            Store this run in the benchmark history (default True).
+
+    Returns (JSON):
+        {
+            "benchmark_id": int | null  - ID of the stored run
+            "policy_hash": str
+            "corpus_hash": str
+            "opa_version": str
+            "current": dict             - opa_profile result for this version
+            "baseline": dict | null     - {"runs", "ns_per_op", "allocs_per_op", "rules": {name: p99_ns}}
+            "regressions": [
+                {"metric": str, "rule": str (per-rule only), "baseline": float, "current": float, "change": float}
+            ]
+            "regressed": bool
+            "error": str | null
+        }
+    """
+    try:
+        result = await compare_with_history(policy_code, policy_id, inputs, query, threshold, record)
+        return {**result, "error": None}
+    except Exception as e:
+        logger.error("policy benchmark compare error: %s", e)
+        return {"benchmark_id": None, "policy_hash": "", "corpus_hash": "", "opa_version": "", "current": None,
+                "baseline": None, "regressions": [], "regressed": False, "error": str(e)}
+
+# -------------------------------
+# Tool: OPA bundle 배포
+# -------------------------------
+@mcp_server.tool("bundle_publish")
+async def bundle_publish(policy_id: int = None):
+    """
+    Tool Name: bundle_publish
+    --------------------
+    Description:
+        Rebuilds the OPA bundle that is served to the `opa` service at
+        /bundles/<name>.tar.gz from the active policies in the MariaDB `policy` table.
+
+        With a policy_id only that policy is re-read and only its bundle segment is
+        rebuilt (removed if it is inactive or deleted); all other segments are reused.
+        Without a policy_id the whole bundle is resynced with the table.
+
+    Args:
+        policy_id: int (optional)
+            The policy that changed.
+
+    Returns (JSON):
+        {
+            "revision": str   - New bundle revision (also the HTTP ETag)
+            "policies": int   - Number of policies in the bundle
+            "changed": int    - Number of segments that were rebuilt or removed
+        }
+    """
+    if policy_id is None:
+        return await bundle_builder.refresh(full=True)
+    return await bundle_builder.publish_policy(policy_id)
+
+# -------------------------------
+# OPA bundle 서버 (ETag / If-None-Match 지원)
+# -------------------------------
+@mcp_server.custom_route("/bundles/{name}", methods=["GET"])
+async def serve_bundle(request):
+    if request.path_params["name"] != f"{bundle_builder.name}.tar.gz":
+        return Response(status_code=404)
+
+    try:
+        await bundle_builder.refresh_if_stale()
+    except Exception as e:
+        # DB 장애 시에도 마지막으로 만든 bundle 은 계속 제공
+        logger.error("bundle refresh error: %s", e)
+
+    etag = bundle_builder.etag
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        # 변경 없음: OPA 는 다운로드/재활성화 없이 다음 polling 까지 대기
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return Response(
+        content=bundle_builder.build(),
+        media_type="application/gzip",
+        headers={"ETag": etag}
+    )
+
+# -------------------------------
+# 결과 캐시 상태
+# -------------------------------
+@mcp_server.custom_route("/cache/stats", methods=["GET"])
+async def cache_stats(request):
+    return JSONResponse(result_cache.stats)
+
+# -------------------------------
+# Prometheus metrics
+# -------------------------------
+@mcp_server.custom_route("/metrics", methods=["GET"])
+async def metrics(request):
+    content, content_type = metrics_response()
+    return Response(content=content, media_type=content_type)
+
+# -------------------------------
+# Liveness / readiness
+# -------------------------------
+@mcp_server.custom_route("/healthz", methods=["GET"])
+async def healthz(request):
+    return JSONResponse({"status": "ok"})
+
+@mcp_server.custom_route("/readyz", methods=["GET"])
+async def readyz(request):
+    # warm-up 이 아직 시작되지 않았거나 실패했으면 (다시) 시작
+    warmup.start()
+    state = {
+        **warmup.state,
+        "prompts_version": PROMPTS_VERSION,
+        "qdrant_initialized": qdrant is not None,
+        "executor": get_executor().stats,
+    }
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
 
 # -------------------------------
 # 서버 시작
 # -------------------------------
+def with_warmup(lifespan):
+    """streamable-http 앱 lifespan 에 OPA warm-up 시작을 추가 (요청 처리는 warm-up 을 기다리지 않음)"""
+    @asynccontextmanager
+    async def wrapped(app):
+        async with lifespan(app):
+            warmup.start()
+            yield
+    return wrapped
+
+
 if __name__ == "__main__":
-    print("Starting MCP Server on port 8001...")
-    mcp_server.run(transport="streamable-http")
+    import uvicorn
+
+    logger.info("Starting MCP Server on port 8001...")
+    app = mcp_server.streamable_http_app()
+    app.router.lifespan_context = with_warmup(app.router.lifespan_context)
+    uvicorn.run(app, host=mcp_server.settings.host, port=int(mcp_server.settings.port),
+                log_level=mcp_server.settings.log_level.lower())
@@ -0,0 +1,219 @@
+import re
+import json
+import asyncio
+
+from service.executor import get_executor
+from service.opa import format_errors, POLICY_FILENAME, TEST_FILENAME
+
+_PACKAGE_RE = re.compile(r"^\s*package\s+([^\s#]+)", re.MULTILINE)
+_ITEM_RE = re.compile(r"item_(\d+)/")
+
+
+def parse_package(rego_code: str):
+    """모듈의 package 경로 (없으면 None)"""
+    match = _PACKAGE_RE.search(rego_code or "")
+    return match.group(1) if match else None
+
+
+def plan_layers(packages: list) -> list:
+    """
+    한 워크스페이스에 같이 둘 수 있는 항목끼리 묶기.
+
+    같은 package 를 정의하는 모듈을 한 번에 컴파일하면 서로의 rule 과 충돌하므로
+    (예: `default allow` 중복) package 가 겹치지 않도록 항목들을 layer 로 나눈다.
+
+    Parameters:
+        packages (list): 항목별 package 집합 [{"authz"}, {"authz", "authz_test"}, ...]
+
+    Returns:
+        list: layer 별 항목 index 목록 [[0, 2], [1], ...]
+    """
+    layers = []
+    for index, pkgs in enumerate(packages):
+        for layer in layers:
+            if not (layer["packages"] & pkgs):
+                layer["items"].append(index)
+                layer["packages"] |= pkgs
+                break
+        else:
+            layers.append({"items": [index], "packages": set(pkgs)})
+    return [layer["items"] for layer in layers]
+
+
+def item_dir(index: int) -> str:
+    return f"item_{index}"
+
+
+def parse_errors(result) -> list:
+    """opa --format json 에러 출력 파싱 (stdout/stderr 어느 쪽이든)"""
+    for output in (result.stderr, result.stdout):
+        try:
+            payload = json.loads(output)
+        except ValueError:
+            continue
+        if isinstance(payload, dict) and payload.get("errors"):
+            return payload["errors"]
+
+    # JSON 이 아니면 텍스트 에러를 그대로 한 건으로 취급
+    text = (result.stderr or result.stdout).strip()
+    return [{"code": "rego_error", "message": text}] if text else []
+
+
+def parse_test_case(case: dict) -> dict:
+    """opa test --format json 의 테스트 케이스 1건을 {"name", "package", "passed", "duration_ns", "error"} 로 변환"""
+    return {
+        "name": case.get("name"),
+        "package": case.get("package"),
+        "passed": not case.get("fail") and not case.get("error"),
+        "duration_ns": case.get("duration"),
+        "error": (case.get("error") or {}).get("message"),
+    }
+
+
+def _attribute(errors: list, items: list) -> dict:
+    """에러를 파일 경로(item_<n>/...) 기준으로 항목별로 분배. 위치가 없는 에러는 layer 전체에 적용"""
+    attributed = {index: [] for index in items}
+    for err in errors:
+        file = (err.get("location") or {}).get("file", "")
+        match = _ITEM_RE.search(file) or _ITEM_RE.search(err.get("message", ""))
+        if match and int(match.group(1)) in attributed:
+            attributed[int(match.group(1))].append(err)
+        else:
+            for index in items:
+                attributed[index].append(err)
+    return attributed
+
+
+def format_file_errors(errors: list) -> str:
+    """에러 목록을 파일별로 묶어서 `opa check` CLI 형태의 메시지로 변환"""
+    by_file = {}
+    for err in errors:
+        file = (err.get("location") or {}).get("file", "")
+        by_file.setdefault(file.rsplit("/", 1)[-1] or POLICY_FILENAME, []).append(err)
+    return "\n".join(format_errors(errs, filename) for filename, errs in by_file.items())
+
+
+async def run_until_clean(items: list, build_files, run_layer) -> dict:
+    """
+    layer 를 실행하고, 에러가 있으면 에러가 없던 항목만 다시 실행.
+
+    OPA 는 파싱/컴파일 단계에서 에러가 나면 이후 단계를 건너뛰므로,
+    에러가 없던 항목도 완전히 검증되었다고 볼 수 없기 때문이다.
+    """
+    outcomes = {}
+    pending = list(items)
+    while pending:
+        async with get_executor().workspace(build_files(pending)) as ws:
+            layer_outcome, errors = await run_layer(ws, pending)
+
+        if not errors:
+            outcomes.update(layer_outcome)
+            break
+
+        attributed = _attribute(errors, pending)
+        failed = [index for index in pending if attributed[index]]
+        for index in failed:
+            outcomes[index] = {"errors": attributed[index]}
+        # 모든 항목에 걸친 에러면 더 이상 나눌 수 없으므로 종료
+        pending = [index for index in pending if not attributed[index]]
+        if not failed:
+            break
+    return outcomes
+
+
+async def check_layer(ws, items: list):
+    """워크스페이스 전체를 `opa check` 한 번으로 검증하는 run_until_clean 용 layer 실행 함수"""
+    result = await ws.run(["check", "--format", "json", "--max-errors=-1", "."])
+    if result.timed_out:
+        return {}, [{"code": "opa_timeout", "message": result.stderr}]
+    errors = [] if result.returncode == 0 else parse_errors(result)
+    return {index: {"errors": []} for index in items}, errors
+
+
+async def check_batch(rego_codes: list) -> list:
+    """
+    여러 Rego 모듈을 하나의 워크스페이스에서 `opa check` 한 번으로 검증
+
+    Returns:
+        list: 입력 순서대로 {"index", "is_valid", "error_message"}
+    """
+    layers = plan_layers([{parse_package(code)} - {None} for code in rego_codes])
+
+    def build_files(items):
+        return {f"{item_dir(i)}/{POLICY_FILENAME}": rego_codes[i] for i in items}
+
+    outcomes = {}
+    for layer_outcome in await asyncio.gather(*[run_until_clean(items, build_files, check_layer) for items in layers]):
+        outcomes.update(layer_outcome)
+
+    return [
+        {
+            "index": index,
+            "is_valid": not outcomes[index]["errors"],
+            "error_message": format_file_errors(outcomes[index]["errors"]),
+        }
+        for index in range(len(rego_codes))
+    ]
+
+
+async def test_batch(items: list) -> list:
+    """
+    여러 (policy_code, test_code) 쌍을 하나의 워크스페이스에서 `opa test` 한 번으로 실행
+
+    Returns:
+        list: 입력 순서대로 {"index", "status", "detail", "tests": [{"name", "package", "passed", "duration_ns"}]}
+    """
+    layers = plan_layers([
+        {parse_package(item.get("policy_code")), parse_package(item.get("test_code"))} - {None}
+        for item in items
+    ])
+
+    def build_files(indices):
+        files = {}
+        for i in indices:
+            files[f"{item_dir(i)}/{POLICY_FILENAME}"] = items[i].get("policy_code") or ""
+            files[f"{item_dir(i)}/{TEST_FILENAME}"] = items[i].get("test_code") or ""
+        return files
+
+    async def run_layer(ws, indices):
+        result = await ws.run(["test", "--format", "json", "."])
+        if result.timed_out:
+            return {}, [{"code": "opa_timeout", "message": result.stderr}]
+        try:
+            cases = json.loads(result.stdout)
+        except ValueError:
+            cases = None
+        if not isinstance(cases, list):
+            return {}, parse_errors(result)
+
+        outcome = {index: {"errors": [], "tests": []} for index in indices}
+        for case in cases:
+            match = _ITEM_RE.search((case.get("location") or {}).get("file", ""))
+            if not match or int(match.group(1)) not in outcome:
+                continue
+            outcome[int(match.group(1))]["tests"].append(parse_test_case(case))
+        return outcome, []
+
+    outcomes = {}
+    for layer_outcome in await asyncio.gather(*[run_until_clean(indices, build_files, run_layer) for indices in layers]):
+        outcomes.update(layer_outcome)
+
+    results = []
+    for index in range(len(items)):
+        outcome = outcomes[index]
+        if outcome["errors"]:
+            results.append({"index": index, "status": "fail",
+                            "detail": format_file_errors(outcome["errors"]), "tests": []})
+            continue
+
+        tests = outcome["tests"]
+        passed = sum(1 for test in tests if test["passed"])
+        failed = [test["name"] for test in tests if not test["passed"]]
+        if not tests:
+            status, detail = "fail", "no tests found"
+        elif failed:
+            status, detail = "fail", f"PASS: {passed}/{len(tests)}, FAIL: {', '.join(failed)}"
+        else:
+            status, detail = "success", f"PASS: {passed}/{len(tests)}"
+        results.append({"index": index, "status": status, "detail": detail, "tests": tests})
+    return results
@@ -0,0 +1,127 @@
+import os
+import json
+import hashlib
+import statistics
+
+from service.opa import get_opa_version
+from service.batch import parse_package
+from service.profiler import profile_policy, synthesize_inputs, OPA_PROFILE_MAX_INPUTS
+from service.repository import repository
+
+# ===================================
+# 정책 성능 이력 / regression 판정 설정
+# ===================================
+# 이전 버전 대비 이 비율 이상 느려지면 regression (0.1 = 10%)
+BENCH_REGRESSION_THRESHOLD = float(os.getenv("BENCH_REGRESSION_THRESHOLD", 0.1))
+# baseline 으로 쓸 이전 버전 측정 수 (중앙값 사용)
+BENCH_BASELINE_RUNS = int(os.getenv("BENCH_BASELINE_RUNS", 5))
+# 규칙별 p99 비교 시 무시할 절대 차이(ns). 수백 ns 단위의 측정 잡음으로 regression 이 나지 않도록
+BENCH_RULE_MIN_DELTA_NS = float(os.getenv("BENCH_RULE_MIN_DELTA_NS", 1000))
+
+
+def policy_hash(rego_code: str) -> str:
+    return hashlib.sha256(rego_code.encode("utf-8")).hexdigest()
+
+
+def corpus_json(inputs: list) -> str:
+    """입력 문서 묶음의 정규화된 JSON (키 순서와 무관하게 같은 hash)"""
+    return json.dumps(inputs, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def _regression(metric: str, current: float, baseline: float, threshold: float, min_delta: float = 0.0, **extra):
+    if not baseline or current - baseline <= min_delta or current <= baseline * (1 + threshold):
+        return None
+    return {"metric": metric, **extra, "baseline": baseline, "current": current,
+            "change": round(current / baseline - 1, 4)}
+
+
+def find_regressions(current: dict, predecessors: list, threshold: float = BENCH_REGRESSION_THRESHOLD) -> dict:
+    """
+    현재 측정을 이전 버전 측정들의 중앙값과 비교
+
+    Parameters:
+        current (dict): profile_policy 결과
+        predecessors (list): 같은 corpus / OPA 버전으로 측정한 이전 버전 측정 (get_benchmarks 행)
+
+    Returns:
+        dict: {"baseline": {"runs", "ns_per_op", "allocs_per_op", "rules": {name: p99_ns}} | None,
+               "regressions": [{"metric", "rule"(규칙별만), "baseline", "current", "change"}]}
+    """
+    if not predecessors:
+        return {"baseline": None, "regressions": []}
+
+    rule_samples = {}
+    for run in predecessors:
+        for rule in run["rules"]:
+            rule_samples.setdefault(rule["rule_name"], []).append(rule["p99_ns"])
+    baseline = {
+        "runs": len(predecessors),
+        "ns_per_op": statistics.median(run["ns_per_op"] for run in predecessors),
+        "allocs_per_op": statistics.median(
+            [run["allocs_per_op"] for run in predecessors if run["allocs_per_op"] is not None] or [0]
+        ),
+        "rules": {name: statistics.median(samples) for name, samples in rule_samples.items()},
+    }
+
+    regressions = [
+        _regression("ns_per_op", current["ns_per_op"], baseline["ns_per_op"], threshold),
+        _regression("allocs_per_op", current["allocs_per_op"], baseline["allocs_per_op"], threshold),
+    ]
+    for rule in current["rules"]:
+        regressions.append(_regression("p99_ns", rule["p99_ns"], baseline["rules"].get(rule["name"]), threshold,
+                                       BENCH_RULE_MIN_DELTA_NS, rule=rule["name"]))
+    return {"baseline": baseline, "regressions": [r for r in regressions if r]}
+
+
+async def compare_with_history(rego_code: str, policy_id: int = None, inputs: list = None, query: str = "allow",
+                               threshold: float = None, record: bool = True) -> dict:
+    """
+    정책을 측정해서 이전 버전들의 측정과 비교하고, 결과를 이력에 저장
+
+    이전 버전은 policy_id (없으면 package) 가 같고 policy hash 가 다른 측정이다.
+    inputs 를 주지 않으면 가장 최근 이전 버전이 쓴 corpus 를 그대로 사용해서 같은 입력으로 비교하고,
+    이력이 없을 때만 정책에서 입력을 만든다. corpus 나 OPA 버전이 다른 측정은 비교하지 않는다.
+
+    Returns:
+        dict: {"benchmark_id", "policy_hash", "corpus_hash", "opa_version", "current", "baseline",
+               "regressions", "regressed"}
+    """
+    threshold = BENCH_REGRESSION_THRESHOLD if threshold is None else threshold
+    package = parse_package(rego_code)
+    if not package:
+        raise ValueError("package declaration is missing")
+    opa_version = await get_opa_version()
+    current_hash = policy_hash(rego_code)
+
+    if inputs is None:
+        history = await repository.get_benchmarks(policy_id, package, limit=BENCH_BASELINE_RUNS)
+        latest = next((run for run in history if run["policy_hash"] != current_hash), None)
+        corpus = await repository.get_benchmark_corpus(latest["corpus_hash"]) if latest else None
+        inputs = json.loads(corpus) if corpus else synthesize_inputs(rego_code)
+    inputs = inputs[:OPA_PROFILE_MAX_INPUTS]
+    corpus = corpus_json(inputs)
+    corpus_hash = hashlib.sha256(corpus.encode("utf-8")).hexdigest()
+
+    current = await profile_policy(rego_code, inputs, query)
+    # 같은 버전의 재측정은 baseline 에서 제외
+    comparable = await repository.get_benchmarks(policy_id, package, corpus_hash, opa_version,
+                                                 limit=BENCH_BASELINE_RUNS * 4)
+    predecessors = [run for run in comparable if run["policy_hash"] != current_hash][:BENCH_BASELINE_RUNS]
+    comparison = find_regressions(current, predecessors, threshold)
+
+    benchmark_id = None
+    if record:
+        benchmark_id = await repository.add_benchmark({
+            **current, "policy_id": policy_id, "package": package, "policy_hash": current_hash,
+            "corpus_hash": corpus_hash, "opa_version": opa_version,
+        }, corpus)
+
+    return {
+        "benchmark_id": benchmark_id,
+        "policy_hash": current_hash,
+        "corpus_hash": corpus_hash,
+        "opa_version": opa_version,
+        "current": current,
+        **comparison,
+        "regressed": bool(comparison["regressions"]),
+    }
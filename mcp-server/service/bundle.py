@@ -0,0 +1,169 @@
+import os
+import re
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import tarfile
+
+from service.repository import repository
+from service.policy_changes import PolicyChangeCursor
+
+# ===================================
+# Bundle 설정
+# ===================================
+BUNDLE_NAME = os.getenv("BUNDLE_NAME", "policies")
+# OPA 가 bundle 을 요청할 때 이 시간(초)이 지났으면 DB 변경분을 먼저 반영
+BUNDLE_REFRESH_INTERVAL = float(os.getenv("BUNDLE_REFRESH_INTERVAL", 10))
+
+_PACKAGE_RE = re.compile(r"^\s*package\s+([\w.]+)", re.MULTILINE)
+_TAR_BLOCK = tarfile.BLOCKSIZE
+
+
+def _tar_entry(name: str, content: bytes) -> bytes:
+    """tar 헤더 + 내용 (512 byte 단위 padding). end-of-archive 블록은 붙이지 않음"""
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mode = 0o644
+    info.mtime = 0
+    padding = (-len(content)) % _TAR_BLOCK
+    return info.tobuf(tarfile.GNU_FORMAT, "utf-8", "surrogateescape") + content + b"\0" * padding
+
+
+def package_root(rego_code: str):
+    """`package a.b` → bundle manifest root "a/b" """
+    match = _PACKAGE_RE.search(rego_code or "")
+    return match.group(1).replace(".", "/") if match else None
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match 헤더(쉼표로 구분된 ETag 목록, W/ 접두어, "*")에 etag 가 있는지 (weak 비교)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+def minimal_roots(roots) -> list:
+    """
+    다른 root 의 하위 경로인 root 를 제거 ("a", "a/b" → ["a"]).
+    OPA 는 manifest roots 가 서로 겹치면 bundle 전체를 거부한다
+    """
+    minimal = []
+    for root in sorted(set(roots)):
+        if not any(root == kept or root.startswith(kept + "/") for kept in minimal):
+            minimal.append(root)
+    return minimal
+
+
+class PolicyBundleBuilder:
+    """
+    활성 정책들을 OPA bundle(.tar.gz, .manifest 포함)로 만드는 빌더.
+
+    정책마다 tar entry 를 따로 gzip 한 segment 를 캐시해 두고, bundle 은
+    segment 들과 .manifest segment 를 이어 붙여서 만든다 (gzip multi-member, OPA 가 그대로 읽음).
+    정책 하나가 바뀌면 그 정책의 segment 만 다시 압축하고 나머지는 재사용한다.
+
+    revision 은 segment checksum 들의 해시이며, HTTP ETag 로도 사용한다.
+    """
+
+    def __init__(self, name: str = BUNDLE_NAME):
+        self.name = name
+        self._segments = {}
+        self._bundle = None
+        self.revision = None
+        self.cursor = PolicyChangeCursor()
+        self.last_refresh = 0.0
+        self.rebuilt_segments = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def etag(self) -> str:
+        self.build()
+        return f'"{self.revision}"'
+
+    def update_policy(self, row: dict) -> bool:
+        """정책 1건 반영. 비활성/코드 없음이면 제거. 실제로 바뀌었으면 True"""
+        policy_id = row["policy_id"]
+        rego_code = row.get("rego_code")
+        if not rego_code or not row.get("is_active", True):
+            return self.remove_policy(policy_id)
+
+        checksum = hashlib.sha256(rego_code.encode("utf-8")).hexdigest()
+        current = self._segments.get(policy_id)
+        if current and current["checksum"] == checksum:
+            return False
+
+        entry = _tar_entry(f"policy_{policy_id}/policy.rego", rego_code.encode("utf-8"))
+        self._segments[policy_id] = {
+            "checksum": checksum,
+            "root": package_root(rego_code),
+            "data": gzip.compress(entry, mtime=0),
+        }
+        self.rebuilt_segments += 1
+        self._bundle = None
+        return True
+
+    def remove_policy(self, policy_id: int) -> bool:
+        if self._segments.pop(policy_id, None) is None:
+            return False
+        self._bundle = None
+        return True
+
+    def build(self) -> bytes:
+        """변경이 있을 때만 segment 를 이어 붙여 bundle 재조립 (재압축 없음)"""
+        if self._bundle is not None:
+            return self._bundle
+
+        policy_ids = sorted(self._segments)
+        digest = hashlib.sha256()
+        for policy_id in policy_ids:
+            digest.update(f"{policy_id}:{self._segments[policy_id]['checksum']}\n".encode("utf-8"))
+        self.revision = digest.hexdigest()[:32]
+
+        # roots 를 정책 package 로 한정해야 상주 OPA 의 PUT /v1/policies (검증/평가용) 와 충돌하지 않음
+        roots = minimal_roots(seg["root"] for seg in self._segments.values() if seg["root"])
+        manifest = json.dumps({"revision": self.revision, "roots": roots}).encode("utf-8")
+        tail = gzip.compress(_tar_entry(".manifest", manifest) + b"\0" * (_TAR_BLOCK * 2), mtime=0)
+
+        self._bundle = b"".join(self._segments[policy_id]["data"] for policy_id in policy_ids) + tail
+        return self._bundle
+
+    async def refresh(self, full: bool = False) -> dict:
+        """
+        DB 변경분 반영. full 이면 활성 정책 전체로 다시 맞추고(삭제된 정책 제거 포함),
+        아니면 updated_at watermark 이후에 바뀐 정책만 반영한다 (PolicyChangeCursor).
+        """
+        async with self._lock:
+            changed = 0
+            if full:
+                seen = set()
+                async for batch in repository.iter_policies(active_only=True):
+                    for row in batch:
+                        seen.add(row["policy_id"])
+                        changed += self.update_policy(row)
+                        self.cursor.observe(row)
+                for policy_id in set(self._segments) - seen:
+                    changed += self.remove_policy(policy_id)
+            else:
+                async for rows in self.cursor.changes():
+                    for row in rows:
+                        changed += self.update_policy(row)
+                        self.cursor.observe(row)
+
+            self.last_refresh = time.time()
+            self.build()
+            return {"revision": self.revision, "policies": len(self._segments), "changed": changed}
+
+    async def refresh_if_stale(self):
+        if time.time() - self.last_refresh > BUNDLE_REFRESH_INTERVAL:
+            await self.refresh(full=self.last_refresh == 0.0)
+
+    async def publish_policy(self, policy_id: int) -> dict:
+        """정책 1건만 DB 에서 다시 읽어서 해당 segment 만 재생성"""
+        async with self._lock:
+            row = await repository.get_policy_by_id(policy_id)
+            changed = self.update_policy(row) if row else self.remove_policy(policy_id)
+            self.build()
+            return {"revision": self.revision, "policies": len(self._segments), "changed": int(changed)}
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# ===================================
+# 결과 캐시 설정
+# ===================================
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 1024))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 3600))
+# 지정하면 재시작 후에도 유지되는 디스크(sqlite) 캐시 사용
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+
+# 앞뒤 공백을 지워도 토큰이 바뀌지 않는 문자
+_PUNCTUATION = set("()[]{},;")
+
+
+def canonicalize(rego_code: str) -> str:
+    """
+    캐시 키 계산용 Rego 정규화.
+
+    줄바꿈 문자, 줄 끝 공백, 파일 끝 빈 줄 차이는 같은 모듈로 취급한다.
+    줄과 들여쓰기, 앞쪽 빈 줄은 그대로 두므로 캐시된 에러 메시지의 줄 / 열 번호는 그대로 유효하다.
+    raw string(`) 이 있으면 줄 끝 공백이 값에 포함될 수 있으므로 줄바꿈 문자만 정리한다.
+    """
+    lines = rego_code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    if "`" not in rego_code:
+        lines = [line.rstrip() for line in lines]
+    return "\n".join(lines).rstrip("\n")
+
+
+def normalize_layout(rego_code: str) -> str:
+    """
+    판정(유효 여부) 캐시 키 계산용 Rego 정규화 (`opa fmt` 대용).
+
+    문자열("...", `...`) 밖에서 주석과 빈 줄을 지우고, 들여쓰기와 줄 안의 공백을 토큰 사이 공백 하나로 줄이고,
+    괄호 / 쉼표 주변 공백은 없앤다. 줄바꿈은 문장 구분자이므로 유지한다.
+    줄 / 열 위치가 바뀌므로 에러 메시지 캐시 키에는 쓰지 않는다.
+    """
+    text = rego_code.replace("\r\n", "\n").replace("\r", "\n")
+    lines, line, quote, gap = [], [], None, False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quote:
+            line.append(char)
+            if char == "\\" and quote == '"' and i + 1 < len(text):
+                i += 1
+                line.append(text[i])
+            elif char == quote or (char == "\n" and quote == '"'):
+                quote = None
+        elif char == "\n":
+            lines.append("".join(line))
+            line, gap = [], False
+        elif char in " \t":
+            gap = True
+        elif char == "#":
+            while i + 1 < len(text) and text[i + 1] != "\n":
+                i += 1
+        else:
+            if gap and line and line[-1] not in _PUNCTUATION and char not in _PUNCTUATION:
+                line.append(" ")
+            gap = False
+            line.append(char)
+            if char in "\"`":
+                quote = char
+        i += 1
+    lines.append("".join(line))
+    return "\n".join(line for line in lines if line)
+
+
+def _digest(kind: str, modules: list, opa_version: str, normalize) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{kind}\0{opa_version}\0".encode("utf-8"))
+    for module in modules:
+        digest.update(normalize(module or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def make_key(kind: str, modules: list, opa_version: str) -> str:
+    """검증 종류 + OPA 버전 + 정규화된 모듈 목록의 sha256 (에러 메시지의 줄 / 열 번호까지 재사용)"""
+    return _digest(kind, modules, opa_version, canonicalize)
+
+
+def make_verdict_key(kind: str, modules: list, opa_version: str) -> str:
+    """
+    들여쓰기 / 공백 / 주석만 다른 모듈끼리 공유하는 판정 키 (normalize_layout).
+    줄 / 열 번호가 없는 '유효함' 판정만 이 키로 저장한다
+    """
+    return _digest(f"{kind}:verdict", modules, opa_version, normalize_layout)
+
+
+class ResultCache:
+    """
+    OPA check/test 결과 캐시.
+
+    - 메모리 LRU (TTL 적용)
+    - 선택적인 디스크 tier (sqlite, 재시작 후에도 유지)
+    - hit / miss 카운터
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+                 cache_dir: str = RESULT_CACHE_DIR):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(cache_dir, "opa_results.db"), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS result (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS result_created_at ON result (created_at)")
+            self._db.commit()
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "memory_size": len(self._memory),
+            "disk_enabled": self._db is not None,
+        }
+
+    def get(self, key: str, *fallbacks: str):
+        """key, fallbacks 순서로 조회해서 처음 찾은 값 반환 (hit / miss 는 한 번만 집계)"""
+        now = time.time()
+        with self._lock:
+            for candidate in (key, *fallbacks):
+                value = self._lookup(candidate, now)
+                if value is not None:
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def _lookup(self, key: str, now: float):
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, value = entry
+            if now - created_at < self.ttl:
+                self._memory.move_to_end(key)
+                return value
+            del self._memory[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT value, created_at FROM result WHERE key=?", (key,)
+            ).fetchone()
+            if row and now - row[1] < self.ttl:
+                value = json.loads(row[0])
+                self._store_memory(key, value, row[1])
+                self.disk_hits += 1
+                return value
+        return None
+
+    def set(self, key: str, value: dict):
+        created_at = time.time()
+        with self._lock:
+            self._store_memory(key, value, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "REPLACE INTO result (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), created_at)
+                )
+                self._db.execute("DELETE FROM result WHERE created_at < ?", (created_at - self.ttl,))
+                self._db.commit()
+
+    def _store_memory(self, key: str, value: dict, created_at: float):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+
+result_cache = ResultCache()
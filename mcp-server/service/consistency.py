@@ -0,0 +1,228 @@
+import re
+import json
+import time
+import heapq
+import asyncio
+import argparse
+
+from service.executor import get_executor
+from service.opa import POLICY_FILENAME
+from service.batch import parse_package, item_dir, run_until_clean, check_layer
+from service.repository import repository
+
+# ===================================
+# 정책 전체 교차 검증
+# ===================================
+_DEFAULT_RE = re.compile(r"^\s*default\s+([A-Za-z_]\w*)", re.MULTILINE)
+_DATA_REF_RE = re.compile(r"\bdata\.([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)")
+_ITEM_RE = re.compile(r"item_(\d+)/")
+# OPA 도 잡지만 위치를 한 곳만 알려주므로, 관련 정책을 모두 묶은 conflicting_default 로 대신 보고
+_DEFAULT_ERROR_RE = re.compile(r"multiple default rules")
+
+
+def _prefixes(path: str) -> list:
+    """"a.b.c" → ["a", "a.b", "a.b.c"]"""
+    parts = path.split(".")
+    return [".".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, index: int) -> int:
+        while self.parent[index] != index:
+            self.parent[index] = self.parent[self.parent[index]]
+            index = self.parent[index]
+        return index
+
+    def union(self, a: int, b: int):
+        self.parent[self.find(a)] = self.find(b)
+
+
+def plan_shards(rego_codes: list, shard_count: int) -> list:
+    """
+    서로 영향을 줄 수 있는 정책끼리 같은 shard 에 두고, shard 들의 크기를 고르게 나눔.
+
+    다음 정책들은 같이 컴파일해야 충돌을 찾을 수 있으므로 하나의 연결 요소로 묶는다.
+    - 같은 package, 또는 한쪽 package 가 다른 쪽의 상위 경로인 경우
+    - data.<경로> 로 다른 정책의 package 를 참조하는 경우
+
+    Returns:
+        list: shard 별 정책 index 목록
+    """
+    packages = [parse_package(code) for code in rego_codes]
+    by_package, by_prefix = {}, {}
+    for index, package in enumerate(packages):
+        if package:
+            by_package.setdefault(package, []).append(index)
+            for prefix in _prefixes(package):
+                by_prefix.setdefault(prefix, []).append(index)
+
+    uf = _UnionFind(len(rego_codes))
+    for index, package in enumerate(packages):
+        # 같은 package / 하위 package 를 가진 정책 전부
+        for other in by_prefix.get(package, []) if package else []:
+            uf.union(index, other)
+        for ref in set(_DATA_REF_RE.findall(rego_codes[index] or "")):
+            # 참조 경로를 포함하는 package (data.a.b.allow → package a.b) 와 그 아래 package (data.a → a.*)
+            for prefix in _prefixes(ref):
+                for other in by_package.get(prefix, []):
+                    uf.union(index, other)
+            for other in by_prefix.get(ref, []):
+                uf.union(index, other)
+
+    components = {}
+    for index in range(len(rego_codes)):
+        components.setdefault(uf.find(index), []).append(index)
+
+    # 큰 연결 요소부터 가장 가벼운 shard 에 배치
+    heap = [(0, shard) for shard in range(max(1, min(shard_count, len(components))))]
+    shards = [[] for _ in heap]
+    for component in sorted(components.values(), key=len, reverse=True):
+        load, shard = heapq.heappop(heap)
+        shards[shard].extend(component)
+        heapq.heappush(heap, (load + len(component), shard))
+    return [sorted(shard) for shard in shards if shard]
+
+
+def _static_conflicts(policies: list) -> list:
+    """OPA 를 부르지 않고 찾을 수 있는 충돌: package 중복, 같은 package 안의 default 중복"""
+    by_package = {}
+    for policy in policies:
+        package = parse_package(policy["rego_code"])
+        if package:
+            by_package.setdefault(package, []).append(policy)
+
+    conflicts = []
+    for package, members in sorted(by_package.items()):
+        if len(members) < 2:
+            continue
+        conflicts.append({
+            "kind": "package_collision",
+            "severity": "warning",
+            "package": package,
+            "policy_ids": [policy["policy_id"] for policy in members],
+            "message": f"package {package} is declared by {len(members)} policies; their rules are merged",
+        })
+
+        defaults = {}
+        for policy in members:
+            for rule in set(_DEFAULT_RE.findall(policy["rego_code"])):
+                defaults.setdefault(rule, []).append(policy["policy_id"])
+        for rule, policy_ids in sorted(defaults.items()):
+            if len(policy_ids) > 1:
+                conflicts.append({
+                    "kind": "conflicting_default",
+                    "severity": "error",
+                    "package": package,
+                    "policy_ids": policy_ids,
+                    "message": f"multiple default rules data.{package}.{rule} found",
+                })
+    return conflicts
+
+
+def _opa_conflicts(policies: list, outcomes: dict) -> list:
+    """opa check 에러를 정책 ID 기준 conflict 로 변환 (같은 에러가 여러 항목에 붙은 경우 한 번만)"""
+    def describe(text: str) -> str:
+        # 워크스페이스 경로(item_<n>/policy.rego) 를 정책 ID 로 바꿔서 표시
+        return re.sub(r"item_(\d+)/" + re.escape(POLICY_FILENAME),
+                      lambda m: f"policy {policies[int(m.group(1))]['policy_id']}", text)
+
+    conflicts = {}
+    for index, outcome in sorted(outcomes.items()):
+        for err in outcome["errors"]:
+            message = err.get("message", "")
+            if _DEFAULT_ERROR_RE.search(message):
+                continue
+            location = err.get("location") or {}
+            key = (err.get("code"), message, location.get("file"), location.get("row"))
+            conflict = conflicts.get(key)
+            if conflict is None:
+                conflict = conflicts[key] = {
+                    "kind": err.get("code") or "rego_error",
+                    "severity": "error",
+                    "package": parse_package(policies[index]["rego_code"]),
+                    "policy_ids": [],
+                    "message": describe(message),
+                    "row": location.get("row"),
+                }
+            # 에러 위치의 정책 + 메시지에 언급된 다른 정책
+            mentioned = {int(m) for m in _ITEM_RE.findall(message)} | {index}
+            for other in sorted(mentioned):
+                if other < len(policies) and policies[other]["policy_id"] not in conflict["policy_ids"]:
+                    conflict["policy_ids"].append(policies[other]["policy_id"])
+    return list(conflicts.values())
+
+
+async def check_policy_set(policies: list, shard_count: int = None) -> dict:
+    """
+    정책 전체를 하나의 bundle 처럼 같이 검증
+
+    연결된 정책끼리 묶은 shard 마다 `opa check` 를 실행하고, shard 들은 동시에 실행한다
+    (opa 프로세스 동시 실행 수는 OPA_MAX_CONCURRENCY 로 제한, 기본값은 CPU 수).
+
+    Parameters:
+        policies (list): [{"policy_id", "rego_code"}, ...]
+        shard_count (int): shard 수 (기본값: OPA_MAX_CONCURRENCY)
+
+    Returns:
+        dict: {"policies", "shards", "valid", "elapsed",
+               "conflicts": [{"kind", "severity", "package", "policy_ids", "message", "row"(OPA 에러만)}]}
+    """
+    started = time.perf_counter()
+    policies = [policy for policy in policies if policy.get("rego_code")]
+    rego_codes = [policy["rego_code"] for policy in policies]
+    shards = plan_shards(rego_codes, shard_count or get_executor().max_concurrency)
+
+    def build_files(indices):
+        return {f"{item_dir(i)}/{POLICY_FILENAME}": rego_codes[i] for i in indices}
+
+    outcomes = {}
+    for shard_outcome in await asyncio.gather(*[run_until_clean(shard, build_files, check_layer) for shard in shards]):
+        outcomes.update(shard_outcome)
+
+    conflicts = _static_conflicts(policies) + _opa_conflicts(policies, outcomes)
+    return {
+        "policies": len(policies),
+        "shards": len(shards),
+        "valid": not any(conflict["severity"] == "error" for conflict in conflicts),
+        "conflicts": conflicts,
+        "elapsed": round(time.perf_counter() - started, 4),
+    }
+
+
+async def check_active_policies(shard_count: int = None) -> dict:
+    """MariaDB policy 테이블의 활성 정책 전체를 교차 검증"""
+    policies = [row async for batch in repository.iter_policies(active_only=True) for row in batch]
+    return await check_policy_set(policies, shard_count)
+
+
+# ===================================
+# CLI: python -m service.consistency
+# ===================================
+def main():
+    from service import mariadb
+
+    parser = argparse.ArgumentParser(description="Check all active policies together for cross-policy conflicts")
+    parser.add_argument("--shards", type=int, default=None, help="Number of shards (default: OPA_MAX_CONCURRENCY)")
+    parser.add_argument("--output", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    policies = [policy for policy in mariadb.get_all_policies() if policy.get("is_active", True)]
+    report = asyncio.run(check_policy_set(policies, args.shards))
+
+    for conflict in report["conflicts"]:
+        print(f"[{conflict['severity']}] {conflict['kind']} package={conflict['package']} "
+              f"policies={conflict['policy_ids']}: {conflict['message']}")
+    print(f"{report['policies']} policies, {report['shards']} shards, {len(report['conflicts'])} conflicts, "
+          f"{report['elapsed']}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    raise SystemExit(0 if report["valid"] else 1)
+
+
+if __name__ == "__main__":
+    main()
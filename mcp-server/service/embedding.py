@@ -0,0 +1,104 @@
+import os
+import re
+import math
+import hashlib
+
+import httpx
+
+# ===================================
+# Embedding 설정
+# ===================================
+# "hashing": 외부 호출 없는 로컬 결정적 임베딩 (테스트/벤치마크용, 의미 유사도가 아닌 표면 유사도),
+# "openai": OpenAI 호환 embeddings API
+EMBEDDER = os.getenv("EMBEDDER", "hashing")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 384))
+EMBEDDING_URL = os.getenv("EMBEDDING_URL", "")
+EMBEDDING_API_KEY = os.getenv("EMBEDDING_API_KEY", "")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    """
+    feature hashing 기반 결정적 임베딩.
+
+    단어와 문자 3-gram 을 해시해서 고정 차원 벡터에 누적한다.
+    한국어처럼 조사가 붙는 언어도 3-gram 덕분에 표현이 조금 달라도 유사도가 높게 나온다.
+    단, 글자가 겹치는 정도만 보므로 "가능" / "불가능" 처럼 뜻이 반대인 문장도 유사도가 높고
+    표현만 바꾼 같은 뜻의 문장은 낮다. 그래서 semantic 이 아니며 semantic cache 에는 쓰지 않는다.
+    """
+
+    # 의미 유사도를 표현하는 임베딩인지 (SemanticPolicyCache 가 확인)
+    semantic = False
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    @property
+    def name(self) -> str:
+        return f"hashing-{self.dim}"
+
+    def _features(self, text: str):
+        for word in _TOKEN_RE.findall(text.lower()):
+            yield "w:" + word
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield "c:" + padded[i:i + 3]
+
+    def embed(self, text: str) -> list:
+        vector = [0.0] * self.dim
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    async def aembed(self, text: str) -> list:
+        return self.embed(text)
+
+    async def aembed_many(self, texts: list) -> list:
+        return [self.embed(text) for text in texts]
+
+
+class OpenAIEmbedder:
+    """OpenAI 호환 `/embeddings` API 를 호출하는 임베딩"""
+
+    semantic = True
+
+    def __init__(self, url: str = EMBEDDING_URL, api_key: str = EMBEDDING_API_KEY,
+                 model: str = EMBEDDING_MODEL, dim: int = EMBEDDING_DIM):
+        self.url = url
+        self.model = model
+        self.dim = dim
+        self.headers = {"api-key": api_key, "Authorization": f"Bearer {api_key}"}
+        self._client = None
+
+    @property
+    def name(self) -> str:
+        return f"openai-{self.model}"
+
+    async def aembed(self, text: str) -> list:
+        return (await self.aembed_many([text]))[0]
+
+    async def aembed_many(self, texts: list) -> list:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30, headers=self.headers)
+        resp = await self._client.post(self.url, json={"input": texts, "model": self.model, "dimensions": self.dim})
+        resp.raise_for_status()
+        data = sorted(resp.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+
+_embedder = None
+
+
+def get_embedder():
+    """환경 변수 EMBEDDER 에 따라 임베딩 구현을 한 번만 생성해서 반환"""
+    global _embedder
+    if _embedder is None:
+        _embedder = OpenAIEmbedder() if EMBEDDER == "openai" else HashingEmbedder()
+    return _embedder
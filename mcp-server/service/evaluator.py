@@ -0,0 +1,190 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+import httpx
+
+from service.opa import format_errors
+
+# ===================================
+# 정책 평가 설정
+# ===================================
+# /v1/data 동시 요청 수
+OPA_EVAL_CONCURRENCY = int(os.getenv("OPA_EVAL_CONCURRENCY", 32))
+# 상주 OPA 에 올려둘 평가용 정책 최대 개수 (초과 시 오래된 것부터 제거)
+OPA_EVAL_MAX_LOADED = int(os.getenv("OPA_EVAL_MAX_LOADED", 64))
+
+_PACKAGE_RE = re.compile(r"^(\s*package\s+)([\w.]+)", re.MULTILINE)
+
+
+class PolicyLoadError(Exception):
+    pass
+
+
+class OpaEvaluator:
+    """
+    상주 OPA 서버에 정책을 한 번만 올리고 (`PUT /v1/policies`), 입력 문서들을
+    `/v1/data` 로 평가하는 evaluator.
+
+    같은 정책은 코드 해시로 재사용하므로 두 번째 호출부터는 PUT 없이 바로 평가한다.
+    다른 정책/bundle 과 충돌하지 않도록 package 경로 앞에 고유 namespace 를 붙여서 올린다.
+
+    - 평가 중인 정책은 namespace 별 참조 수로 추적해서, LRU 로 밀려나도 평가가 끝난 뒤에 DELETE 한다
+    - OPA 가 재시작되면 올려둔 정책이 사라지므로, 결과가 없거나 404 인 응답이 있으면 정책이 아직 있는지 확인하고
+      없으면 다시 올린 뒤 해당 입력만 한 번 더 평가한다
+    """
+
+    def __init__(self, backend, max_concurrency: int = OPA_EVAL_CONCURRENCY,
+                 max_loaded: int = OPA_EVAL_MAX_LOADED):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()  # code hash -> data path
+        self._refs = {}               # namespace -> 평가 중인 호출 수
+        self._retired = set()         # 평가 중에 밀려나서 참조가 끝나면 지울 namespace
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _namespace(data_path: str) -> str:
+        return data_path.split("/", 1)[0]
+
+    async def _acquire(self, rego_code: str) -> tuple:
+        """정책을 올리고 (code hash, data 경로(namespace/package)) 반환. 평가가 끝나면 _release 호출"""
+        key = hashlib.sha256(rego_code.encode("utf-8")).hexdigest()
+        async with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                data_path = self._loaded[key]
+            else:
+                data_path = await self._put(rego_code)
+                self._loaded[key] = data_path
+                await self._evict()
+            namespace = self._namespace(data_path)
+            self._refs[namespace] = self._refs.get(namespace, 0) + 1
+            return key, data_path
+
+    async def _release(self, data_path: str):
+        namespace = self._namespace(data_path)
+        async with self._lock:
+            self._refs[namespace] -= 1
+            if self._refs[namespace]:
+                return
+            del self._refs[namespace]
+            if namespace in self._retired:
+                self._retired.discard(namespace)
+                await self._delete(namespace)
+
+    async def _put(self, rego_code: str) -> str:
+        match = _PACKAGE_RE.search(rego_code)
+        if not match:
+            raise PolicyLoadError("package declaration is missing")
+
+        namespace = f"opa_eval_{uuid.uuid4().hex}"
+        body = _PACKAGE_RE.sub(lambda m: f"{m.group(1)}{namespace}.{m.group(2)}", rego_code, count=1)
+        resp = await self.backend.client.put(f"/v1/policies/{namespace}", content=body.encode("utf-8"))
+        if resp.status_code != 200:
+            errors = resp.json().get("errors") or [{"code": "rego_error", "message": resp.text}]
+            raise PolicyLoadError(format_errors(errors).replace(f"{namespace}.", ""))
+        return f"{namespace}/{match.group(2).replace('.', '/')}"
+
+    async def _delete(self, namespace: str):
+        try:
+            await self.backend.client.delete(f"/v1/policies/{namespace}")
+        except httpx.HTTPError:
+            pass
+
+    async def _evict(self):
+        # 평가 중인 정책은 목록에서만 빼고 (새 호출은 다시 올림) 실제 DELETE 는 _release 에서
+        while len(self._loaded) > self.max_loaded:
+            _, old_path = self._loaded.popitem(last=False)
+            namespace = self._namespace(old_path)
+            if self._refs.get(namespace):
+                self._retired.add(namespace)
+            else:
+                await self._delete(namespace)
+
+    async def _is_loaded(self, data_path: str) -> bool:
+        try:
+            resp = await self.backend.client.get(f"/v1/policies/{self._namespace(data_path)}")
+        except httpx.HTTPError:
+            return True
+        return resp.status_code != 404
+
+    async def _invalidate(self, key: str, data_path: str):
+        """서버에서 사라진 정책을 목록에서 제거 (다음 _acquire 에서 다시 PUT)"""
+        async with self._lock:
+            if self._loaded.get(key) == data_path:
+                del self._loaded[key]
+
+    async def load_policy(self, rego_code: str) -> str:
+        """정책을 올리고 평가에 사용할 data 경로(namespace/package) 반환"""
+        _, data_path = await self._acquire(rego_code)
+        await self._release(data_path)
+        return data_path
+
+    async def evaluate(self, rego_code: str, inputs: list, query: str = "allow") -> dict:
+        """
+        Returns:
+            dict: {"decisions": [{"index", "result", "latency_ms", "error"}], "load_ms", "total_ms"}
+        """
+        started = time.perf_counter()
+        key, data_path = await self._acquire(rego_code)
+        load_ms = (time.perf_counter() - started) * 1000
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        def decision_url(path):
+            url = f"/v1/data/{path}"
+            if query:
+                url += "/" + query.strip("/").replace(".", "/")
+            return url
+
+        async def evaluate_one(url, index, input_doc):
+            """(decision, 정책이 사라졌을 수 있는 응답인지)"""
+            async with semaphore:
+                decision_started = time.perf_counter()
+                suspect = False
+                try:
+                    resp = await self.backend.client.post(url, json={"input": input_doc})
+                    payload = resp.json()
+                    error = None if resp.status_code == 200 else payload.get("message", resp.text)
+                    result = payload.get("result")
+                    suspect = resp.status_code == 404 or (resp.status_code == 200 and "result" not in payload)
+                except (httpx.HTTPError, ValueError) as e:
+                    result, error = None, str(e)
+                return {
+                    "index": index,
+                    "result": result,
+                    "latency_ms": round((time.perf_counter() - decision_started) * 1000, 3),
+                    "error": error,
+                }, suspect
+
+        try:
+            url = decision_url(data_path)
+            outcomes = await asyncio.gather(*[evaluate_one(url, i, doc) for i, doc in enumerate(inputs)])
+            decisions = [decision for decision, _ in outcomes]
+            retry = [decision["index"] for decision, suspect in outcomes if suspect]
+
+            # 결과가 비어 있는 응답은 정책이 정말 undefined 일 수도 있으므로, 서버에서 정책이 사라진 경우에만 재시도
+            if retry and not await self._is_loaded(data_path):
+                await self._invalidate(key, data_path)
+                released, data_path = data_path, None
+                await self._release(released)
+                key, data_path = await self._acquire(rego_code)
+                url = decision_url(data_path)
+                retried = await asyncio.gather(*[evaluate_one(url, i, inputs[i]) for i in retry])
+                for decision, _ in retried:
+                    decisions[decision["index"]] = decision
+        finally:
+            if data_path is not None:
+                await self._release(data_path)
+
+        return {
+            "decisions": decisions,
+            "load_ms": round(load_ms, 3),
+            "total_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
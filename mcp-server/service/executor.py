@@ -0,0 +1,171 @@
+import os
+import time
+import shutil
+import signal
+import asyncio
+import tempfile
+from dataclasses import dataclass
+from contextlib import asynccontextmanager
+
+from service.telemetry import OPA_SUBPROCESS_SECONDS
+
+# ===================================
+# OPA 실행 엔진 설정
+# ===================================
+OPA_BINARY = os.getenv("OPA_BINARY", "opa")
+# 동시에 실행할 수 있는 opa 프로세스 수
+OPA_MAX_CONCURRENCY = int(os.getenv("OPA_MAX_CONCURRENCY", os.cpu_count() or 4))
+# opa 프로세스 1회 실행 제한 시간(초)
+OPA_EXEC_TIMEOUT = float(os.getenv("OPA_EXEC_TIMEOUT", 30))
+
+
+@dataclass
+class ExecResult:
+    returncode: int
+    stdout: str
+    stderr: str
+    duration: float
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+
+class Workspace:
+    """opa 호출 1건이 단독으로 사용하는 임시 디렉토리"""
+
+    def __init__(self, executor: "OpaExecutor", path: str):
+        self.executor = executor
+        self.path = path
+
+    def write(self, relpath: str, content: str) -> str:
+        path = os.path.join(self.path, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def read(self, relpath: str) -> str:
+        with open(os.path.join(self.path, relpath), encoding="utf-8") as f:
+            return f.read()
+
+    async def run(self, args: list, timeout: float = None) -> ExecResult:
+        """워크스페이스를 cwd 로 opa 실행 (출력의 파일 경로는 워크스페이스 기준 상대 경로)"""
+        return await self.executor.run(args, cwd=self.path, timeout=timeout)
+
+
+class OpaExecutor:
+    """
+    asyncio subprocess 로 opa 를 실행하는 엔진.
+
+    - 이벤트 루프를 막지 않음 (asyncio.create_subprocess_exec)
+    - 호출마다 독립된 워크스페이스 디렉토리 사용
+    - 세마포어로 동시 실행 수 제한, 호출별 timeout
+    - timeout / 취소 시 프로세스 그룹을 kill
+    """
+
+    def __init__(self, max_concurrency: int = OPA_MAX_CONCURRENCY,
+                 timeout: float = OPA_EXEC_TIMEOUT, opa_binary: str = OPA_BINARY):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.opa_binary = opa_binary
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._running = set()
+        self._waiting = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": len(self._running),
+            "waiting": self._waiting,
+        }
+
+    @asynccontextmanager
+    async def workspace(self, files: dict = None):
+        """files({상대경로: 내용})를 기록한 워크스페이스를 만들고, 종료 시 삭제"""
+        path = tempfile.mkdtemp(prefix="opa_ws_")
+        workspace = Workspace(self, path)
+        try:
+            for relpath, content in (files or {}).items():
+                workspace.write(relpath, content)
+            yield workspace
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    async def run(self, args: list, cwd: str = None, timeout: float = None) -> ExecResult:
+        timeout = timeout or self.timeout
+
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        try:
+            started = time.perf_counter()
+            proc = await asyncio.create_subprocess_exec(
+                self.opa_binary, *args,
+                cwd=cwd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
+            )
+            self._running.add(proc)
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+            except asyncio.TimeoutError:
+                self._kill(proc)
+                await proc.wait()
+                OPA_SUBPROCESS_SECONDS.labels(args[0], "timeout").observe(time.perf_counter() - started)
+                return ExecResult(
+                    returncode=-1,
+                    stdout="",
+                    stderr=f"opa {args[0]} timed out after {timeout}s",
+                    duration=time.perf_counter() - started,
+                    timed_out=True
+                )
+            except asyncio.CancelledError:
+                # 요청이 취소되면 opa 프로세스도 함께 종료
+                self._kill(proc)
+                raise
+            finally:
+                self._running.discard(proc)
+
+            duration = time.perf_counter() - started
+            OPA_SUBPROCESS_SECONDS.labels(args[0], "ok" if proc.returncode == 0 else "error").observe(duration)
+            return ExecResult(
+                returncode=proc.returncode,
+                stdout=stdout.decode("utf-8", errors="replace"),
+                stderr=stderr.decode("utf-8", errors="replace"),
+                duration=duration
+            )
+        finally:
+            self._semaphore.release()
+
+    @staticmethod
+    def _kill(proc):
+        if proc.returncode is not None:
+            return
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            proc.kill()
+
+    def cancel_all(self):
+        """실행 중인 모든 opa 프로세스 강제 종료 (서버 종료 시 사용)"""
+        for proc in list(self._running):
+            self._kill(proc)
+
+
+_executor = None
+
+
+def get_executor() -> OpaExecutor:
+    global _executor
+    if _executor is None:
+        _executor = OpaExecutor()
+    return _executor
@@ -0,0 +1,226 @@
+import re
+import json
+from dataclasses import dataclass, field
+
+from service.opa import format_errors, POLICY_FILENAME, TEST_FILENAME
+from service.telemetry import PRELINT_RESULTS
+
+# ===================================
+# OPA 호출 전 Rego pre-lint
+# ===================================
+# 확실한 오류만 잡는다. 애매하면 통과시키고 판단은 OPA 에 맡긴다.
+_OPENERS = {"{": "}", "[": "]", "(": ")"}
+_CLOSERS = {closer: opener for opener, closer in _OPENERS.items()}
+_MAX_ERRORS = 10
+
+_FENCED_RE = re.compile(r"^```[\w-]*\s*\n(.*?)\n?```$", re.DOTALL)
+_REGO_V1_RE = re.compile(r"^\s*import\s+rego\.v1\b", re.MULTILINE)
+# 규칙 head 바로 뒤에 body 가 오는 경우: `allow {`, `deny[msg] {`, `f(x) {`
+_RULE_WITHOUT_IF_RE = re.compile(r"^(\s*)(?!(?:package|import|default|else|not|some|every)\b)"
+                                 r"[A-Za-z_]\w*(\s*\[[^\]\n]*\]|\s*\([^)\n]*\))?\s*\{")
+_JSON_CODE_KEYS = ("rego_code", "policy_code", "test_code", "code")
+
+
+@dataclass
+class LintResult:
+    rego_code: str                              # auto-fix 적용 후 코드
+    errors: list = field(default_factory=list)  # OPA 에러 형식 [{"code", "message", "location": {"row", "col"}}]
+    fixes: list = field(default_factory=list)   # 적용한 auto-fix 이름
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _error(message: str, row: int, col: int = None) -> dict:
+    location = {"file": POLICY_FILENAME, "row": row}
+    if col:
+        location["col"] = col
+    return {"code": "rego_parse_error", "message": message, "location": location}
+
+
+def autofix(rego_code: str):
+    """
+    LLM 출력에서 흔한, 의미가 바뀌지 않는 포장만 벗기기.
+
+    - ```rego ...``` 코드 블록
+    - {"rego_code": "..."} 형태의 JSON
+    - 줄바꿈 없이 "\\n" 으로 이스케이프된 한 줄짜리 코드
+
+    Returns:
+        (str, list): (고친 코드, 적용한 fix 이름 목록)
+    """
+    fixes = []
+    code = rego_code
+
+    fenced = _FENCED_RE.match(code.strip())
+    if fenced:
+        code = fenced.group(1)
+        fixes.append("unwrap_code_fence")
+
+    stripped = code.strip()
+    if stripped.startswith("{") and stripped.endswith("}"):
+        try:
+            parsed = json.loads(stripped)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict):
+            value = next((parsed[key] for key in _JSON_CODE_KEYS if isinstance(parsed.get(key), str)), None)
+            if value is not None:
+                code = value
+                fixes.append("unwrap_json")
+
+    if "\n" not in code and "\\n" in code and code.lstrip().startswith("package"):
+        code = code.replace("\\n", "\n").replace("\\t", "\t").replace('\\"', '"')
+        fixes.append("unescape_newlines")
+
+    return code, fixes
+
+
+def _scan(code: str):
+    """
+    문자열 / 주석을 건너뛰면서 괄호 짝과 문자열 종료를 확인.
+
+    Returns:
+        (list, str): (에러 목록, 문자열과 주석을 공백으로 가린 코드)
+    """
+    errors = []
+    masked = []
+    stack = []
+    row, col = 1, 0
+    i, length = 0, len(code)
+
+    while i < length:
+        ch = code[i]
+        col += 1
+
+        if ch == "\n":
+            masked.append(ch)
+            row, col = row + 1, 0
+            i += 1
+            continue
+
+        if ch == "#":
+            end = code.find("\n", i)
+            end = length if end < 0 else end
+            masked.append(" " * (end - i))
+            col += end - i - 1
+            i = end
+            continue
+
+        if ch == '"':
+            j = i + 1
+            while j < length and code[j] not in '"\n':
+                j += 2 if code[j] == "\\" else 1
+            if j >= length or code[j] == "\n":
+                errors.append(_error("non-terminated string", row, col))
+                return errors, "".join(masked)
+            masked.append('"' + " " * (j - i - 1) + '"')
+            col += j - i
+            i = j + 1
+            continue
+
+        if ch == "`":
+            end = code.find("`", i + 1)
+            if end < 0:
+                errors.append(_error("non-terminated raw string", row, col))
+                return errors, "".join(masked)
+            segment = code[i:end + 1]
+            masked.append(re.sub(r"[^\n]", " ", segment))
+            newlines = segment.count("\n")
+            if newlines:
+                row += newlines
+                col = len(segment) - segment.rfind("\n") - 1
+            else:
+                col += end - i
+            i = end + 1
+            continue
+
+        if ch in _OPENERS:
+            stack.append((ch, row, col))
+        elif ch in _CLOSERS:
+            if not stack:
+                errors.append(_error(f"unexpected {ch} token", row, col))
+                return errors, "".join(masked)
+            opener, _, _ = stack.pop()
+            if opener != _CLOSERS[ch]:
+                errors.append(_error(f"unexpected {ch} token: expected {_OPENERS[opener]}", row, col))
+                return errors, "".join(masked)
+
+        masked.append(ch)
+        i += 1
+
+    for opener, open_row, open_col in stack[:_MAX_ERRORS]:
+        errors.append(_error(f"unexpected eof token: expected {_OPENERS[opener]}", open_row, open_col))
+    return errors, "".join(masked)
+
+
+def _missing_package(masked: str):
+    for row, line in enumerate(masked.split("\n"), start=1):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if re.match(r"package\s+\S", stripped):
+            return None
+        return _error("package expected", row, len(line) - len(line.lstrip()) + 1)
+    return _error("package expected", 1)
+
+
+def _rules_without_if(masked: str) -> list:
+    """v1 문법에서 `if` 없이 body 가 시작되는 최상위 규칙"""
+    errors = []
+    depth = 0
+    for row, line in enumerate(masked.split("\n"), start=1):
+        if depth == 0:
+            match = _RULE_WITHOUT_IF_RE.match(line)
+            if match:
+                errors.append(_error("`if` keyword is required before rule body", row, len(match.group(1)) + 1))
+                if len(errors) >= _MAX_ERRORS:
+                    break
+        depth += sum(line.count(opener) for opener in _OPENERS) - sum(line.count(closer) for closer in _CLOSERS)
+    return errors
+
+
+def prelint(rego_code: str, v1: bool = False) -> LintResult:
+    """
+    OPA 를 부르기 전에 확실히 잘못된 모듈을 걸러내고 안전한 auto-fix 적용
+
+    Parameters:
+        rego_code (str): 검사할 모듈
+        v1 (bool): OPA 1.x 처럼 `if` 키워드가 필수인지 (`import rego.v1` 이 있으면 항상 필수)
+
+    Returns:
+        LintResult: errors 가 비어 있으면 OPA 로 검증할 만한 코드
+    """
+    code, fixes = autofix(rego_code or "")
+    errors, masked = _scan(code)
+    if not errors:
+        missing = _missing_package(masked)
+        if missing:
+            errors = [missing]
+        elif v1 or _REGO_V1_RE.search(masked):
+            errors = _rules_without_if(masked)
+
+    PRELINT_RESULTS.labels("rejected" if errors else "fixed" if fixes else "passed").inc()
+    return LintResult(code, errors, fixes)
+
+
+def prelint_pair(policy_code: str, test_code: str, v1: bool = False):
+    """
+    opa test 에 넘길 policy / test 두 파일 pre-lint
+
+    Returns:
+        (str, str, str): (고친 policy, 고친 test, 에러 메시지 ("" 이면 통과))
+    """
+    policy_lint, test_lint = prelint(policy_code, v1), prelint(test_code, v1)
+    error_message = "\n".join(
+        format_errors(lint.errors, filename)
+        for lint, filename in ((policy_lint, POLICY_FILENAME), (test_lint, TEST_FILENAME)) if lint.errors
+    )
+    return policy_lint.rego_code, test_lint.rego_code, error_message
+
+
+def requires_if(opa_version: str) -> bool:
+    """OPA 1.0 부터 v1 문법(`if` 필수)이 기본"""
+    major = opa_version.lstrip("v").split(".", 1)[0]
+    return major.isdigit() and int(major) >= 1
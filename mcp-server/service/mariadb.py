@@ -1,116 +1,111 @@
-from contextlib import contextmanager
-from mysql.connector import pooling
-import os
-
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "port": int(os.getenv("DB_PORT", 3306)),
-    "user": os.getenv("DB_USER", "root"),
-    "password": os.getenv("DB_PASSWORD", "rootpassword"),
-    "database": os.getenv("DB_NAME", "opa_db"),
-}
-
-# Connection Pool
-connection_pool = pooling.MySQLConnectionPool(
-    pool_name="mcp_pool",
-    pool_size=5,
-    **DB_CONFIG
-)
-
-@contextmanager
-def db_cursor(dictionary=False):
-    """자동으로 연결 및 커서 닫기를 처리하는 헬퍼"""
-    conn = connection_pool.get_connection()
-    try:
-        with conn.cursor(dictionary=dictionary) as cursor:
-            yield cursor
-            conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+import asyncio
+import threading
+
+from service.repository import DB_CONFIG, DB_BATCH_SIZE, MariaDBRepository
+
+# ===================================
+# 동기 호출용 thin wrapper
+# ===================================
+# 기존 동기 함수 시그니처는 그대로 두고, 내부적으로는 전용 이벤트 루프(백그라운드 스레드)에서
+# 비동기 repository 를 실행한다. 비동기 코드에서는 service.repository.repository 를 직접 await 한다.
+_loop = None
+_loop_lock = threading.Lock()
+_repository = MariaDBRepository(DB_CONFIG)
+
+
+def _run(coro):
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="mariadb-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+
+async def _collect(batches):
+    return [row async for batch in batches for row in batch]
 
 # ===================================
 # USER TABLE CRUD
 # ===================================
 
 def get_user_by_id(emp_id: str):
-    with db_cursor(dictionary=True) as cursor:
-        cursor.execute("SELECT * FROM user WHERE emp_id=%s", (emp_id,))
-        return cursor.fetchone()
+    return _run(_repository.get_user_by_id(emp_id))
 
 
 def get_all_users():
-    with db_cursor(dictionary=True) as cursor:
-        cursor.execute("SELECT * FROM user")
-        return cursor.fetchall()
+    return _run(_collect(_repository.iter_users()))
 
 
 def add_user(emp_id, name, dept, role):
-    with db_cursor() as cursor:
-        cursor.execute(
-            "INSERT INTO user (emp_id, name, dept, role) VALUES (%s, %s, %s, %s)",
-            (emp_id, name, dept, role)
-        )
+    _run(_repository.add_user(emp_id, name, dept, role))
+
+
+def bulk_upsert_users(users: list):
+    return _run(_repository.bulk_upsert_users(users))
 
 
 def delete_user(emp_id):
-    with db_cursor() as cursor:
-        cursor.execute("DELETE FROM user WHERE emp_id=%s", (emp_id,))
+    _run(_repository.delete_user(emp_id))
 
 # ===================================
 # API TABLE CRUD
 # ===================================
 
 def get_api_by_id(api_id: int):
-    with db_cursor(dictionary=True) as cursor:
-        cursor.execute("SELECT * FROM api WHERE api_id=%s", (api_id,))
-        return cursor.fetchone()
+    return _run(_repository.get_api_by_id(api_id))
 
 
 def get_all_apis():
-    with db_cursor(dictionary=True) as cursor:
-        cursor.execute("SELECT * FROM api")
-        return cursor.fetchall()
+    return _run(_collect(_repository.iter_apis()))
 
 
 def add_api(api_name, endpoint, method, description=None):
-    with db_cursor() as cursor:
-        cursor.execute(
-            "INSERT INTO api (api_name, endpoint, method, description) VALUES (%s, %s, %s, %s)",
-            (api_name, endpoint, method, description)
-        )
+    _run(_repository.add_api(api_name, endpoint, method, description))
+
+
+def bulk_upsert_apis(apis: list):
+    return _run(_repository.bulk_upsert_apis(apis))
 
 
 def delete_api(api_id):
-    with db_cursor() as cursor:
-        cursor.execute("DELETE FROM api WHERE api_id=%s", (api_id,))
+    _run(_repository.delete_api(api_id))
 
 # ===================================
 # POLICY TABLE CRUD
 # ===================================
 
 def get_policy_by_id(policy_id: int):
-    with db_cursor(dictionary=True) as cursor:
-        cursor.execute("SELECT * FROM policy WHERE policy_id=%s", (policy_id,))
-        return cursor.fetchone()
+    return _run(_repository.get_policy_by_id(policy_id))
 
 
 def get_all_policies():
-    with db_cursor(dictionary=True) as cursor:
-        cursor.execute("SELECT * FROM policy")
-        return cursor.fetchall()
+    return _run(_collect(_repository.iter_policies()))
+
+
+def get_policies_updated_since(updated_at=None, policy_id=0, limit=DB_BATCH_SIZE):
+    return _run(_repository.get_policies_updated_since(updated_at, policy_id, limit))
 
 
 def add_policy(policy_name, api_id, emp_id, rego_code, is_active=True):
-    with db_cursor() as cursor:
-        cursor.execute(
-            "INSERT INTO policy (policy_name, api_id, emp_id, rego_code, is_active) VALUES (%s, %s, %s, %s, %s)",
-            (policy_name, api_id, emp_id, rego_code, is_active)
-        )
+    _run(_repository.add_policy(policy_name, api_id, emp_id, rego_code, is_active))
+
+
+def bulk_upsert_policies(policies: list):
+    return _run(_repository.bulk_upsert_policies(policies))
 
 
 def delete_policy(policy_id):
-    with db_cursor() as cursor:
-        cursor.execute("DELETE FROM policy WHERE policy_id=%s", (policy_id,))
\ No newline at end of file
+    _run(_repository.delete_policy(policy_id))
+
+# ===================================
+# POLICY_BENCHMARK TABLES
+# ===================================
+
+def add_benchmark(run: dict, corpus: str):
+    return _run(_repository.add_benchmark(run, corpus))
+
+
+def get_benchmarks(policy_id: int = None, package: str = None, corpus_hash: str = None,
+                   opa_version: str = None, limit: int = 20):
+    return _run(_repository.get_benchmarks(policy_id, package, corpus_hash, opa_version, limit))
@@ -1,39 +1,327 @@
-
-
 import os
+import re
+import time
+import uuid
+import atexit
+import shutil
+import logging
+import tempfile
 import subprocess
 
+import httpx
+
+from service.executor import get_executor
+from service.telemetry import OPA_HTTP_HOOKS
+
+# ===================================
+# OPA 설정
+# ===================================
+OPA_URL = os.getenv("OPA_URL", "http://opa:8181")
+# "server": 상주 OPA 서버로 검증 (연결 불가 시 CLI fallback), "cli": 매번 `opa check` 실행
+OPA_CHECK_BACKEND = os.getenv("OPA_CHECK_BACKEND", "server")
+# true 이면 MCP 서버가 직접 `opa run --server` 프로세스를 띄워서 사용
+OPA_MANAGED = os.getenv("OPA_MANAGED", "false").lower() == "true"
+OPA_MANAGED_ADDR = os.getenv("OPA_MANAGED_ADDR", "127.0.0.1:8182")
+OPA_HTTP_TIMEOUT = float(os.getenv("OPA_HTTP_TIMEOUT", 5))
+OPA_HTTP_POOL_SIZE = int(os.getenv("OPA_HTTP_POOL_SIZE", 20))
+# 서버 연결 실패 후 다시 서버를 시도하기까지 CLI 만 사용하는 시간(초)
+OPA_SERVER_RETRY_AFTER = float(os.getenv("OPA_SERVER_RETRY_AFTER", 30))
+
+POLICY_FILENAME = "policy.rego"
+TEST_FILENAME = "policy_test.rego"
+
+_PACKAGE_RE = re.compile(r"^(\s*package\s+)", re.MULTILINE)
+
+logger = logging.getLogger(__name__)
+
+
+def format_errors(errors: list, filename: str = POLICY_FILENAME) -> str:
+    """
+    OPA 서버가 반환한 에러 목록을 `opa check` CLI 와 같은 형태의 메시지로 변환
+
+    Parameters:
+        errors (list): [{"code", "message", "location": {"file", "row", "col"}}, ...]
+        filename (str): 메시지에 표시할 파일 이름
+
+    Returns:
+        str: "1 error occurred: policy.rego:3:5: rego_parse_error: ..." 형태의 메시지
+    """
+    lines = []
+    for err in errors:
+        location = err.get("location") or {}
+        prefix = filename
+        if location.get("row"):
+            prefix += f":{location['row']}"
+            if location.get("col"):
+                prefix += f":{location['col']}"
+        lines.append(f"{prefix}: {err.get('code', 'rego_error')}: {err.get('message', '')}")
+
+    if len(lines) == 1:
+        return f"1 error occurred: {lines[0]}"
+    return f"{len(lines)} errors occurred:\n" + "\n".join(lines)
+
+
+# ===================================
+# CLI Backend
+# ===================================
+class OpaCliBackend:
+    """`opa check` CLI 를 매번 실행하는 검증 backend"""
+
+    name = "cli"
+
+    @staticmethod
+    def _write_policy(rego_code: str):
+        workdir = tempfile.mkdtemp(prefix="opa_check_")
+        path = os.path.join(workdir, POLICY_FILENAME)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(rego_code)
+        return workdir, path
+
+    @staticmethod
+    def _result(returncode: int, stderr: str, workdir: str):
+        if returncode == 0:
+            return True, ""
+        # 임시 디렉토리 경로를 지워서 서버 backend 와 같은 "policy.rego:row" 형태로 맞춤
+        return False, stderr.strip().replace(workdir + os.sep, "")
+
+    async def check(self, rego_code: str):
+        async with get_executor().workspace({POLICY_FILENAME: rego_code}) as ws:
+            result = await ws.run(["check", POLICY_FILENAME])
+        if result.timed_out:
+            return False, result.stderr
+        return self._result(result.returncode, result.stderr, ws.path)
+
+    def check_sync(self, rego_code: str):
+        workdir, path = self._write_policy(rego_code)
+        try:
+            result = subprocess.run(["opa", "check", path], capture_output=True, text=True)
+            return self._result(result.returncode, result.stderr, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ===================================
+# Server Backend
+# ===================================
+class OpaServerBackend:
+    """
+    상주 OPA 서버(`opa run --server`)의 `PUT /v1/policies` 로 모듈을 컴파일해서 검증하는 backend.
+
+    keep-alive 커넥션 풀을 재사용하므로 호출마다 OPA 프로세스를 띄우지 않는다.
+    서버에 연결할 수 없거나 정책 에러가 아닌 응답(5xx, 413 등)이면 fallback(CLI) backend 로 검증한다.
+    """
+
+    name = "server"
+
+    def __init__(self, url: str = OPA_URL, fallback=None,
+                 timeout: float = OPA_HTTP_TIMEOUT, pool_size: int = OPA_HTTP_POOL_SIZE):
+        self.url = url.rstrip("/")
+        self.fallback = fallback or OpaCliBackend()
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self._client = None
+        self._sync_client = None
+        self._down_until = 0.0
+        self._version = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.url, timeout=self.timeout, limits=self.limits, event_hooks=OPA_HTTP_HOOKS
+            )
+        return self._client
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(base_url=self.url, timeout=self.timeout, limits=self.limits)
+        return self._sync_client
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _mark_down(self):
+        self._down_until = time.monotonic() + OPA_SERVER_RETRY_AFTER
+        # 다시 연결될 때는 다른 버전의 서버일 수 있음
+        self._version = None
+
+    async def version(self) -> str:
+        """서버의 OPA 버전 (`GET /v1/data/system/version`). 조회할 수 없으면 fallback(CLI) 버전"""
+        if not self.available:
+            return await get_opa_version()
+        if self._version is None:
+            try:
+                resp = await self.client.get("/v1/data/system/version")
+                resp.raise_for_status()
+                self._version = resp.json()["result"]["version"]
+            except httpx.TransportError:
+                self._mark_down()
+                return await get_opa_version()
+            except (httpx.HTTPStatusError, ValueError, KeyError, TypeError):
+                return await get_opa_version()
+        return self._version
+
+    @staticmethod
+    def _prepare(rego_code: str):
+        """
+        검증용 policy id 와 요청 본문 생성.
+
+        서버에는 다른 모듈들도 함께 로드되어 있으므로 (동시 요청 포함) 같은 package 끼리
+        충돌하지 않도록 package 경로 앞에 요청마다 고유한 namespace 를 붙인다.
+        package 줄만 바뀌므로 에러의 줄 번호는 원본과 같다.
+        """
+        namespace = f"opa_check_{uuid.uuid4().hex}"
+        body = _PACKAGE_RE.sub(lambda m: f"{m.group(1)}{namespace}.", rego_code, count=1)
+        return namespace, body
+
+    @staticmethod
+    def _result(resp: httpx.Response, namespace: str):
+        """
+        PUT 응답 → (is_valid, error_message). 정책 자체의 문제(400 + rego 파싱/컴파일 에러)가 아니면
+        (5xx, 413 등) 판단할 수 없으므로 None 을 반환하고, 호출한 쪽이 fallback 으로 검증한다.
+        """
+        if resp.status_code == 200:
+            return True, ""
+        if resp.status_code != 400:
+            return None
+
+        try:
+            payload = resp.json()
+        except ValueError:
+            return None
+
+        errors = payload.get("errors") or []
+        if not errors or not all(str(err.get("code", "")).startswith("rego_") for err in errors):
+            return None
+        return False, format_errors(errors).replace(f"{namespace}.", "")
+
+    async def check(self, rego_code: str):
+        if not self.available:
+            return await self.fallback.check(rego_code)
+
+        namespace, body = self._prepare(rego_code)
+        try:
+            resp = await self.client.put(f"/v1/policies/{namespace}", content=body.encode("utf-8"))
+            if resp.status_code == 200:
+                # 검증 목적이므로 등록한 모듈은 바로 제거
+                await self.client.delete(f"/v1/policies/{namespace}")
+        except httpx.TransportError:
+            self._mark_down()
+            return await self.fallback.check(rego_code)
+
+        result = self._result(resp, namespace)
+        if result is None:
+            logger.warning("opa server returned %s for policy check, using fallback", resp.status_code)
+            return await self.fallback.check(rego_code)
+        return result
+
+    def check_sync(self, rego_code: str):
+        if not self.available:
+            return self.fallback.check_sync(rego_code)
+
+        namespace, body = self._prepare(rego_code)
+        try:
+            resp = self.sync_client.put(f"/v1/policies/{namespace}", content=body.encode("utf-8"))
+            if resp.status_code == 200:
+                self.sync_client.delete(f"/v1/policies/{namespace}")
+        except httpx.TransportError:
+            self._mark_down()
+            return self.fallback.check_sync(rego_code)
+
+        result = self._result(resp, namespace)
+        if result is None:
+            logger.warning("opa server returned %s for policy check, using fallback", resp.status_code)
+            return self.fallback.check_sync(rego_code)
+        return result
+
+
+class ManagedOpaServer:
+    """MCP 서버 프로세스가 직접 관리하는 `opa run --server` 인스턴스"""
+
+    def __init__(self, addr: str = OPA_MANAGED_ADDR):
+        self.addr = addr
+        self.process = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.addr}"
+
+    def start(self) -> str:
+        if self.process is None or self.process.poll() is not None:
+            self.process = subprocess.Popen(
+                ["opa", "run", "--server", "--addr", self.addr, "--log-level", "error"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            atexit.register(self.stop)
+        return self.url
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+
+_backend = None
+_opa_version = None
+
+
+async def get_opa_version() -> str:
+    """`opa version` 결과를 한 번만 조회해서 캐시 (결과 캐시 키에 포함)"""
+    global _opa_version
+    if _opa_version is None:
+        try:
+            result = await get_executor().run(["version"])
+            lines = result.stdout.strip().splitlines() if result.ok else []
+            _opa_version = lines[0].split(":", 1)[-1].strip() if lines else "unknown"
+        except OSError:
+            _opa_version = "unknown"
+    return _opa_version
+
+
+async def get_check_version() -> str:
+    """
+    opa_check 결과 캐시 키에 넣을 OPA 버전.
+    server backend 이면 실제로 검증하는 서버의 버전, 아니면 로컬 `opa` 의 버전.
+    """
+    backend = get_validation_backend()
+    if isinstance(backend, OpaServerBackend):
+        return await backend.version()
+    return await get_opa_version()
+
+
+def get_validation_backend():
+    """환경 변수 설정에 따라 검증 backend 를 한 번만 생성해서 반환"""
+    global _backend
+    if _backend is None:
+        if OPA_CHECK_BACKEND == "cli":
+            _backend = OpaCliBackend()
+        else:
+            url = ManagedOpaServer().start() if OPA_MANAGED else OPA_URL
+            _backend = OpaServerBackend(url)
+    return _backend
+
+
 def opa_syntax_check(rego_code: str):
     """
     Check OPA Rego code syntax.
-    
+
     Parameters:
         rego_code (str): The OPA policy code as a string.
-        
+
     Returns:
         Tuple[bool, str]: (is_valid, error_message)
             is_valid: True if syntax is correct.
             error_message: Empty if valid, otherwise the syntax error.
     """
     try:
-        # 임시 파일에 정책 저장
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode="w", suffix=".rego", delete=False) as tmp:
-            tmp.write(rego_code)
-            tmp_path = tmp.name
-
-        # opa check 실행
-        result = subprocess.run(
-            ["opa", "check", tmp_path],
-            capture_output=True,
-            text=True
-        )
-
-        if result.returncode == 0:
-            return True, ""
-        else:
-            return False, result.stderr.strip()
-
+        return get_validation_backend().check_sync(rego_code)
     except Exception as e:
         return False, str(e)
 
@@ -43,25 +331,22 @@ def opa_test(rego_code: str, test_code: str):
     """
     if not rego_code:
         return {"status": "error", "detail": "rego_code is missing"}
-    
+
     if not test_code:
         return {"status": "error", "detail": "test_code is missing"}
 
-    policy_path = "/tmp/policy.rego"
-    test_path = "/tmp/policy_test.rego"
-
-    # 정책 코드 저장
-    with open(policy_path, "w", encoding="utf-8") as f:
-        f.write(rego_code)
-
-    # 테스트 파일 생성 (없으면 생성)
-    with open(test_path, "w", encoding="utf-8") as f:
-        f.write(test_code)
-
+    # 호출마다 별도 디렉토리를 사용해서 동시 요청끼리 파일을 덮어쓰지 않도록 함
+    workdir = tempfile.mkdtemp(prefix="opa_test_")
     try:
+        with open(os.path.join(workdir, POLICY_FILENAME), "w", encoding="utf-8") as f:
+            f.write(rego_code)
+        with open(os.path.join(workdir, TEST_FILENAME), "w", encoding="utf-8") as f:
+            f.write(test_code)
+
         # opa test 실행
         result = subprocess.run(
-            ["opa", "test", policy_path, test_path],
+            ["opa", "test", POLICY_FILENAME, TEST_FILENAME],
+            cwd=workdir,
             capture_output=True,
             text=True
         )
@@ -75,9 +360,23 @@ def opa_test(rego_code: str, test_code: str):
         return {"status": "error", "detail": str(e)}
 
     finally:
-        # 테스트 후 임시 정책 파일 삭제
-        if os.path.exists(policy_path):
-            os.remove(policy_path)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def opa_test_async(rego_code: str, test_code: str, timeout: float = None):
+    """
+    opa_test 의 비동기 버전. 이벤트 루프를 막지 않고 독립된 워크스페이스에서 `opa test` 실행
+
+    Returns:
+        dict: {"status": "success" | "fail" | "error", "detail": str}
+    """
+    files = {POLICY_FILENAME: rego_code, TEST_FILENAME: test_code}
+    async with get_executor().workspace(files) as ws:
+        result = await ws.run(["test", POLICY_FILENAME, TEST_FILENAME], timeout=timeout)
 
-        if os.path.exists(test_path):
-            os.remove(test_path)
\ No newline at end of file
+    if result.timed_out:
+        return {"status": "error", "detail": result.stderr}
+    if result.returncode == 0:
+        return {"status": "success", "detail": result.stdout.strip() or "OPA test passed successfully."}
+    # opa test 는 실패한 테스트 내역을 stdout 에, 컴파일 에러를 stderr 에 출력
+    return {"status": "fail", "detail": result.stderr.strip() or result.stdout.strip() or "OPA test failed."}
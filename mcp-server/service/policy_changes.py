@@ -0,0 +1,78 @@
+import os
+from datetime import datetime, timedelta
+
+from service.repository import repository, DB_BATCH_SIZE
+
+# ===================================
+# 정책 변경분 조회 설정
+# ===================================
+# watermark 보다 이 시간(초)만큼 앞에서부터 다시 읽음.
+# updated_at 은 커밋 시각이 아니라 문장 실행 시각이므로, 먼저 시작해서 늦게 커밋된 행은
+# 이미 지나간 watermark 보다 앞선 시각을 가질 수 있다
+POLICY_SYNC_OVERLAP = float(os.getenv("POLICY_SYNC_OVERLAP", 5))
+
+
+class PolicyChangeCursor:
+    """
+    `policy` 테이블의 (updated_at, policy_id) 증분 조회 위치.
+
+    매번 watermark - overlap 부터 keyset pagination 으로 다시 읽고, overlap 구간에서 이미 본
+    (policy_id, updated_at) 은 건너뛴다. 같은 시각에 늦게 커밋된 행이나 policy_id 가 더 작은 행도
+    overlap 안에 커밋되면 놓치지 않는다.
+    """
+
+    def __init__(self, overlap: float = POLICY_SYNC_OVERLAP):
+        self.overlap = timedelta(seconds=overlap)
+        self.watermark = None
+        self._recent = {}  # policy_id -> updated_at (watermark - overlap 이후에 본 행)
+
+    def reset(self):
+        self.watermark = None
+        self._recent = {}
+
+    def is_new(self, row: dict) -> bool:
+        """overlap 구간에서 같은 버전을 이미 처리했으면 False"""
+        return row.get("updated_at") is None or self._recent.get(row["policy_id"]) != row["updated_at"]
+
+    def observe(self, row: dict):
+        """행을 처리한 것으로 기록하고 watermark 를 전진"""
+        updated_at = row.get("updated_at")
+        if updated_at is None:
+            return
+        self._recent[row["policy_id"]] = updated_at
+        if self.watermark is None or updated_at > self.watermark:
+            self.watermark = updated_at
+
+    def _prune(self):
+        if self.watermark is not None:
+            horizon = self.watermark - self.overlap
+            self._recent = {policy_id: at for policy_id, at in self._recent.items() if at >= horizon}
+
+    async def changes(self, batch_size: int = DB_BATCH_SIZE):
+        """
+        watermark 이후(overlap 포함) 변경된 정책 중 아직 처리하지 않은 행을 배치 단위로 반환.
+        호출한 쪽은 반영을 마친 행을 observe() 로 기록한다 (반영 중 실패하면 다음 조회에서 다시 읽힘).
+        """
+        keyset = (self.watermark - self.overlap, 0) if self.watermark is not None else (None, 0)
+        while True:
+            rows = await repository.get_policies_updated_since(*keyset, batch_size)
+            if not rows:
+                break
+            fresh = [row for row in rows if self.is_new(row)]
+            if fresh:
+                yield fresh
+            keyset = (rows[-1]["updated_at"], rows[-1]["policy_id"])
+            if len(rows) < batch_size:
+                break
+        self._prune()
+
+    def to_dict(self) -> dict:
+        return {
+            "updated_at": self.watermark.isoformat() if self.watermark else None,
+            "recent": {str(policy_id): at.isoformat() for policy_id, at in self._recent.items()},
+        }
+
+    def load(self, state: dict):
+        updated_at = state.get("updated_at")
+        self.watermark = datetime.fromisoformat(updated_at) if updated_at else None
+        self._recent = {int(policy_id): datetime.fromisoformat(at) for policy_id, at in (state.get("recent") or {}).items()}
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+
+from qdrant_client import models
+
+from service.policy_changes import PolicyChangeCursor
+
+# ===================================
+# 정책 인덱스 설정
+# ===================================
+POLICY_INDEX_COLLECTION = os.getenv("POLICY_INDEX_COLLECTION", "policy_examples")
+POLICY_INDEX_BATCH_SIZE = int(os.getenv("POLICY_INDEX_BATCH_SIZE", 256))
+# 마지막 동기화 위치(watermark)를 저장할 파일 (비어 있으면 메모리에만 유지)
+POLICY_INDEX_STATE = os.getenv("POLICY_INDEX_STATE", "")
+# 조회 시 마지막 동기화 후 이 시간(초)이 지났으면 백그라운드로 증분 동기화
+POLICY_INDEX_SYNC_INTERVAL = float(os.getenv("POLICY_INDEX_SYNC_INTERVAL", 60))
+
+logger = logging.getLogger(__name__)
+
+
+def policy_document(row: dict) -> str:
+    """임베딩 대상 텍스트 (정책 이름 + 설명 + Rego)"""
+    return "\n".join(filter(None, [row.get("policy_name"), row.get("description"), row.get("rego_code")]))
+
+
+def policy_checksum(row: dict) -> str:
+    payload = [policy_document(row), row.get("created_by"), row.get("api_id"), bool(row.get("is_active", True))]
+    return hashlib.sha256(json.dumps(payload, default=str).encode("utf-8")).hexdigest()
+
+
+class PolicyIndexer:
+    """
+    MariaDB `policy` 테이블 → Qdrant 증분 인덱싱 + 유사 정책 검색.
+
+    updated_at watermark 이후에 바뀐 행만 keyset pagination 으로 읽고 (PolicyChangeCursor),
+    Qdrant 에 저장된 checksum 과 같은 행은 다시 임베딩하지 않는다.
+    Qdrant 클라이언트는 동기 API 이므로 모든 호출을 asyncio.to_thread 로 실행한다.
+    """
+
+    def __init__(self, qdrant, embedder, collection: str = POLICY_INDEX_COLLECTION,
+                 state_path: str = POLICY_INDEX_STATE):
+        self.qdrant = qdrant
+        self.embedder = embedder
+        self.collection = collection
+        self.state_path = state_path
+        self.cursor = PolicyChangeCursor()
+        self.last_sync = 0.0
+        self._ready = False
+        self._sync_lock = asyncio.Lock()
+        self._load_state()
+
+    def _load_state(self):
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as f:
+                self.cursor.load(json.load(f))
+
+    def _save_state(self):
+        if self.state_path:
+            with open(self.state_path, "w", encoding="utf-8") as f:
+                json.dump(self.cursor.to_dict(), f)
+
+    def _ensure_collection(self, vector_size: int):
+        if not self._ready:
+            self.qdrant.ensure_collection(self.collection, vector_size, payload_indexes={
+                "is_active": models.PayloadSchemaType.BOOL,
+                "created_by": models.PayloadSchemaType.KEYWORD,
+                "api_id": models.PayloadSchemaType.INTEGER,
+            })
+            self._ready = True
+
+    def _stored_checksums(self, policy_ids: list) -> dict:
+        if not self._ready:
+            if not self.qdrant.client.collection_exists(self.collection):
+                return {}
+            self._ready = True
+        points = self.qdrant.client.retrieve(self.collection, ids=policy_ids, with_payload=["checksum"])
+        return {point.id: point.payload.get("checksum") for point in points}
+
+    async def _index_batch(self, rows: list) -> int:
+        checksums = {row["policy_id"]: policy_checksum(row) for row in rows}
+        stored = await asyncio.to_thread(self._stored_checksums, list(checksums))
+        changed = [row for row in rows if stored.get(row["policy_id"]) != checksums[row["policy_id"]]]
+        if not changed:
+            return 0
+
+        vectors = await self.embedder.aembed_many([policy_document(row) for row in changed])
+        await asyncio.to_thread(self._ensure_collection, len(vectors[0]))
+        points = [
+            models.PointStruct(
+                id=row["policy_id"],
+                vector=vector,
+                payload={
+                    "policy_id": row["policy_id"],
+                    "policy_name": row.get("policy_name"),
+                    "description": row.get("description"),
+                    "rego_code": row.get("rego_code"),
+                    "created_by": row.get("created_by"),
+                    "api_id": row.get("api_id"),
+                    "is_active": bool(row.get("is_active", True)),
+                    "checksum": checksums[row["policy_id"]],
+                }
+            )
+            for row, vector in zip(changed, vectors)
+        ]
+        await asyncio.to_thread(self.qdrant.upsert, self.collection, points)
+        return len(points)
+
+    async def sync(self, full: bool = False) -> dict:
+        """
+        watermark 이후 변경된 정책을 배치 단위로 읽어서 bulk upsert
+
+        Returns:
+            dict: {"scanned": 읽은 행 수, "upserted": 새로 임베딩한 행 수, "elapsed": 초}
+        """
+        async with self._sync_lock:
+            started = time.perf_counter()
+            if full:
+                self.cursor.reset()
+
+            scanned = upserted = 0
+            async for rows in self.cursor.changes(POLICY_INDEX_BATCH_SIZE):
+                scanned += len(rows)
+                upserted += await self._index_batch(rows)
+                for row in rows:
+                    self.cursor.observe(row)
+                self._save_state()
+            self._save_state()
+
+            self.last_sync = time.time()
+            return {"scanned": scanned, "upserted": upserted, "elapsed": round(time.perf_counter() - started, 4)}
+
+    def maybe_sync_in_background(self):
+        """마지막 동기화가 오래되었으면 검색을 막지 않고 백그라운드로 동기화"""
+        if time.time() - self.last_sync > POLICY_INDEX_SYNC_INTERVAL and not self._sync_lock.locked():
+            self.last_sync = time.time()
+            asyncio.create_task(self.sync()).add_done_callback(self._log_sync_error)
+
+    @staticmethod
+    def _log_sync_error(task):
+        if not task.cancelled() and task.exception():
+            logger.error("policy index sync error: %s", task.exception())
+
+    async def retrieve(self, query: str, top_k: int = 3, created_by: str = None, api_id: int = None) -> list:
+        """활성 정책 중 요청과 가장 비슷한 top_k 개"""
+        vector = await self.embedder.aembed(query)
+        if not self._ready and not await asyncio.to_thread(self.qdrant.client.collection_exists, self.collection):
+            return []
+        self._ready = True
+
+        must = [models.FieldCondition(key="is_active", match=models.MatchValue(value=True))]
+        if created_by:
+            must.append(models.FieldCondition(key="created_by", match=models.MatchValue(value=created_by)))
+        if api_id is not None:
+            must.append(models.FieldCondition(key="api_id", match=models.MatchValue(value=api_id)))
+
+        hits = await asyncio.to_thread(
+            self.qdrant.search, self.collection, vector, limit=top_k, query_filter=models.Filter(must=must)
+        )
+        return [
+            {
+                "policy_id": hit.payload["policy_id"],
+                "policy_name": hit.payload.get("policy_name"),
+                "description": hit.payload.get("description"),
+                "rego_code": hit.payload.get("rego_code"),
+                "score": hit.score,
+            }
+            for hit in hits
+        ]
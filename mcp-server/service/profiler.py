@@ -0,0 +1,197 @@
+import os
+import re
+import json
+import math
+import asyncio
+
+from service.executor import get_executor
+from service.opa import POLICY_FILENAME
+from service.batch import parse_package, parse_errors, format_file_errors
+
+# ===================================
+# 정책 성능 profiling 설정
+# ===================================
+# inputs 를 주지 않았을 때 정책에서 만들어 낼 입력 문서 수
+OPA_PROFILE_INPUTS = int(os.getenv("OPA_PROFILE_INPUTS", 4))
+# `opa bench` 로 ns/op 를 잴 입력 수 (bench 1회는 약 1초 걸림)
+OPA_BENCH_INPUTS = int(os.getenv("OPA_BENCH_INPUTS", 1))
+OPA_PROFILE_MAX_INPUTS = int(os.getenv("OPA_PROFILE_MAX_INPUTS", 32))
+# 순회하는 input 컬렉션(some x in input.items, input.items[_])에 넣을 원소 수
+OPA_PROFILE_COLLECTION_SIZE = int(os.getenv("OPA_PROFILE_COLLECTION_SIZE", 16))
+
+_INPUT_PATH_RE = re.compile(r"\binput((?:\.[A-Za-z_]\w*)+)")
+_LITERAL = r'("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?|true|false)'
+_COMPARE_RE = re.compile(
+    r"\binput((?:\.[A-Za-z_]\w*)+)\s*(?:==|!=|<=|>=|<|>)\s*" + _LITERAL + r"|" +
+    _LITERAL + r"\s*(?:==|!=|<=|>=|<|>)\s*input((?:\.[A-Za-z_]\w*)+)"
+)
+_COLLECTION_RE = re.compile(r"\bin\s+input((?:\.[A-Za-z_]\w*)+)|\binput((?:\.[A-Za-z_]\w*)+)\[")
+_RULE_HEAD_RE = re.compile(r"^(?:default\s+)?([A-Za-z_]\w*)")
+_STRING_RE = re.compile(r'"(?:[^"\\\n]|\\.)*"|`[^`]*`')
+
+
+def synthesize_inputs(rego_code: str, count: int = OPA_PROFILE_INPUTS) -> list:
+    """
+    정책이 참조하는 input 경로와 비교 상수로 입력 문서 만들기.
+
+    input.user.role == "admin" 처럼 상수와 비교하는 경로는 그 상수들과 어떤 상수와도 맞지 않는 값을
+    경로마다 다른 순서로 돌아가며 써서 일치 / 불일치 경로가 섞이게 하고, 순회하는 경로에는
+    OPA_PROFILE_COLLECTION_SIZE 개짜리 배열을 넣는다.
+    """
+    values = {}
+    for path in _INPUT_PATH_RE.findall(rego_code):
+        values.setdefault(path.lstrip("."), [])
+    for left_path, left_value, right_value, right_path in _COMPARE_RE.findall(rego_code):
+        path, literal = (left_path, left_value) if left_path else (right_path, right_value)
+        candidates = values.setdefault(path.lstrip("."), [])
+        value = json.loads(literal)
+        if value not in candidates:
+            candidates.append(value)
+
+    collections = {(left or right).lstrip(".") for left, right in _COLLECTION_RE.findall(rego_code)}
+
+    inputs = []
+    for i in range(max(1, count)):
+        document = {}
+        # 긴 경로부터 채워서 input.user 와 input.user.role 이 같이 있으면 객체가 되도록 함
+        for offset, path in enumerate(sorted(values, key=lambda p: (-p.count("."), p))):
+            if path in collections:
+                candidates = [[f"{path}_{k}" for k in range(OPA_PROFILE_COLLECTION_SIZE)]]
+            elif values[path]:
+                candidates = values[path] + ["__unmatched__"]
+            else:
+                # 상수와 비교하지 않는 경로끼리는 같은 입력 안에서 같은 값 (input.user.id == input.resource.owner 등)
+                candidates = [f"value_{i}"]
+            node, keys = document, path.split(".")
+            for key in keys[:-1]:
+                node = node.setdefault(key, {})
+                if not isinstance(node, dict):
+                    break
+            else:
+                node.setdefault(keys[-1], candidates[(i + offset) % len(candidates)])
+        inputs.append(document)
+    return inputs
+
+
+def rule_spans(rego_code: str) -> list:
+    """최상위 규칙별 줄 범위 [(name, start_row, end_row), ...] (profile 의 row 를 규칙에 매핑하기 위함)"""
+    spans = []
+    depth = 0
+    lines = rego_code.split("\n")
+    for row, line in enumerate(lines, start=1):
+        code = _STRING_RE.sub('""', line).split("#", 1)[0]
+        if depth == 0 and code.strip() and not line[:1].isspace():
+            match = _RULE_HEAD_RE.match(code)
+            if match and match.group(1) not in ("package", "import"):
+                if spans:
+                    spans[-1][2] = row - 1
+                spans.append([match.group(1), row, len(lines)])
+        depth = max(0, depth + code.count("{") + code.count("[") + code.count("(")
+                    - code.count("}") - code.count("]") - code.count(")"))
+    return [tuple(span) for span in spans]
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return float(ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))])
+
+
+def _rule_at(spans: list, row: int):
+    for name, start, end in spans:
+        if start <= row <= end:
+            return name
+    return None
+
+
+async def _profile_one(ws, query: str, index: int):
+    result = await ws.run(["eval", "--profile", "--format", "json",
+                           "--data", POLICY_FILENAME, "--input", f"input_{index}.json", query])
+    if not result.ok:
+        raise RuntimeError(format_file_errors(parse_errors(result)) or result.stderr.strip())
+    return json.loads(result.stdout).get("profile") or []
+
+
+async def _bench_one(ws, query: str, index: int):
+    result = await ws.run(["bench", "--format", "json", "--benchmem", "--count", "1",
+                           "--data", POLICY_FILENAME, "--input", f"input_{index}.json", query])
+    if not result.ok:
+        raise RuntimeError(format_file_errors(parse_errors(result)) or result.stderr.strip())
+    bench = json.loads(result.stdout)
+    n = max(bench.get("N") or 1, 1)
+    return {
+        "ns_per_op": bench.get("T", 0) / n,
+        "allocs_per_op": bench.get("MemAllocs", 0) / n,
+        "bytes_per_op": bench.get("MemBytes", 0) / n,
+    }
+
+
+async def profile_policy(rego_code: str, inputs: list = None, query: str = "allow", budget_ns: float = None) -> dict:
+    """
+    입력 문서들로 정책을 평가하면서 규칙별 평가 시간과 ns/op 측정
+
+    - 입력마다 `opa eval --profile` 로 표현식별 시간을 재고, 규칙 단위로 합산
+    - 앞쪽 OPA_BENCH_INPUTS 개 입력에 대해 `opa bench` 로 ns/op, allocs/op 측정
+    - budget_ns 가 있으면 ns/op 가 그 이하인지 판정
+
+    Returns:
+        dict: {"query", "inputs", "ns_per_op", "allocs_per_op", "bytes_per_op",
+               "rules": [{"name", "total_ns", "mean_ns", "p99_ns", "num_eval"}], "budget_ns", "within_budget"}
+    """
+    package = parse_package(rego_code)
+    if not package:
+        raise ValueError("package declaration is missing")
+    path = f"data.{package}" + (f".{query}" if query else "")
+
+    inputs = (inputs or synthesize_inputs(rego_code))[:OPA_PROFILE_MAX_INPUTS]
+    files = {POLICY_FILENAME: rego_code}
+    for index, document in enumerate(inputs):
+        files[f"input_{index}.json"] = json.dumps(document)
+
+    async with get_executor().workspace(files) as ws:
+        profiles, benches = await asyncio.gather(
+            asyncio.gather(*[_profile_one(ws, path, index) for index in range(len(inputs))]),
+            asyncio.gather(*[_bench_one(ws, path, index) for index in range(min(OPA_BENCH_INPUTS, len(inputs)))]),
+        )
+
+    # 규칙별 입력 1건당 시간 → 합계 / 평균 / p99
+    spans = rule_spans(rego_code)
+    per_rule = {}
+    for profile in profiles:
+        per_input = {}
+        for entry in profile:
+            location = entry.get("location") or {}
+            if location.get("file", POLICY_FILENAME).rsplit("/", 1)[-1] != POLICY_FILENAME:
+                continue
+            name = _rule_at(spans, location.get("row", 0)) or "(query)"
+            stats = per_input.setdefault(name, {"ns": 0, "num_eval": 0})
+            stats["ns"] += entry.get("total_time_ns", 0)
+            stats["num_eval"] += entry.get("num_eval", 0)
+        for name, stats in per_input.items():
+            rule = per_rule.setdefault(name, {"samples": [], "num_eval": 0})
+            rule["samples"].append(stats["ns"])
+            rule["num_eval"] += stats["num_eval"]
+
+    rules = sorted((
+        {
+            "name": name,
+            "total_ns": sum(rule["samples"]),
+            "mean_ns": round(sum(rule["samples"]) / len(inputs), 1),
+            "p99_ns": _percentile(rule["samples"], 0.99),
+            "num_eval": rule["num_eval"],
+        }
+        for name, rule in per_rule.items()
+    ), key=lambda rule: rule["total_ns"], reverse=True)
+
+    ns_per_op = round(sum(bench["ns_per_op"] for bench in benches) / len(benches), 1)
+    return {
+        "query": path,
+        "inputs": len(inputs),
+        "ns_per_op": ns_per_op,
+        "allocs_per_op": round(sum(bench["allocs_per_op"] for bench in benches) / len(benches), 1),
+        "bytes_per_op": round(sum(bench["bytes_per_op"] for bench in benches) / len(benches), 1),
+        "rules": rules,
+        "budget_ns": budget_ns,
+        "within_budget": None if budget_ns is None else ns_per_op <= budget_ns,
+    }
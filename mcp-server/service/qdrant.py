@@ -1,13 +1,31 @@
 from qdrant_client import QdrantClient as QC
+from qdrant_client import models
 
 class QdrantService:
-    def __init__(self, url):
-        self.client = QC(url=url)
+    def __init__(self, url=None, location=None):
+        # location=":memory:" 이면 Qdrant 서버 없이 프로세스 내 메모리 모드로 동작
+        self.client = QC(location=location) if location else QC(url=url)
 
-    def search(self, collection_name, query_vector, limit=5):
+    def ensure_collection(self, collection_name, vector_size, payload_indexes=None):
+        """컬렉션이 없으면 cosine 거리로 생성하고 payload index 추가"""
+        if self.client.collection_exists(collection_name):
+            return
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE)
+        )
+        for field_name, schema in (payload_indexes or {}).items():
+            self.client.create_payload_index(collection_name, field_name=field_name, field_schema=schema)
+
+    def upsert(self, collection_name, points):
+        self.client.upsert(collection_name=collection_name, points=points)
+
+    def search(self, collection_name, query_vector, limit=5, query_filter=None, score_threshold=None):
         result = self.client.search(
             collection_name=collection_name,
             query_vector=query_vector,
+            query_filter=query_filter,
+            score_threshold=score_threshold,
             limit=limit
         )
         return result
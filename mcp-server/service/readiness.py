@@ -0,0 +1,57 @@
+import time
+import asyncio
+import logging
+
+from service.opa import get_validation_backend, get_opa_version
+
+logger = logging.getLogger(__name__)
+
+# 검증 경로(OPA 서버 커넥션 또는 CLI) 를 미리 한 번 태우기 위한 최소 모듈
+WARMUP_MODULE = "package opa_agent_warmup\n\nallow := true\n"
+
+
+class Warmup:
+    """
+    서버 시작 직후 백그라운드에서 OPA 를 미리 준비하고 그 상태를 /readyz 로 보고.
+
+    - `opa version` 조회 (결과 캐시 키에 쓰이는 값)
+    - 검증 backend 생성 + 최소 모듈 검증 1회 (OPA 서버 keep-alive 커넥션 / CLI 실행 준비)
+
+    실패하면 다음 start() 호출 때 다시 시도한다.
+    """
+
+    def __init__(self):
+        self.task = None
+        self.state = {"ready": False, "opa_version": None, "opa_backend": None,
+                      "opa_server_available": None, "warmup_seconds": None, "error": None}
+
+    def start(self):
+        if self.task is None or (self.task.done() and not self.state["ready"]):
+            self.task = asyncio.create_task(self._run())
+        return self.task
+
+    async def _run(self):
+        started = time.perf_counter()
+        try:
+            opa_version = await get_opa_version()
+            backend = get_validation_backend()
+            is_valid, error_message = await backend.check(WARMUP_MODULE)
+            if not is_valid:
+                raise RuntimeError(error_message)
+            self.state.update(
+                ready=True,
+                opa_version=opa_version,
+                opa_backend=backend.name,
+                # server backend 는 연결 실패 시 CLI 로 검증하므로 ready 여도 서버가 없을 수 있음
+                opa_server_available=getattr(backend, "available", None),
+                error=None
+            )
+        except Exception as e:
+            logger.error("warm-up failed: %s", e)
+            self.state["error"] = str(e)
+        finally:
+            self.state["warmup_seconds"] = round(time.perf_counter() - started, 4)
+            logger.info("warm-up finished: %s", self.state)
+
+
+warmup = Warmup()
@@ -0,0 +1,312 @@
+import os
+from contextlib import asynccontextmanager
+
+import aiomysql
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", 3306)),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASSWORD", "rootpassword"),
+    "database": os.getenv("DB_NAME", "opa_db"),
+}
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+# keyset pagination / bulk insert 1회 처리 행 수
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", 500))
+
+
+class MariaDBRepository:
+    """
+    aiomysql 기반 비동기 데이터 접근 계층.
+
+    - 설정 가능한 커넥션 풀 (DB_POOL_MIN / DB_POOL_MAX), 첫 사용 시 생성
+    - 목록 조회는 PK 기준 keyset pagination 으로 배치 단위 async iterator 제공
+    - 대량 조회용 server-side cursor 스트리밍
+    - executemany 기반 bulk insert / upsert
+
+    aiomysql 풀은 생성된 이벤트 루프에 묶이므로 루프마다 별도 인스턴스를 사용해야 한다.
+    """
+
+    def __init__(self, config: dict = DB_CONFIG, minsize: int = DB_POOL_MIN, maxsize: int = DB_POOL_MAX):
+        self.config = config
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self._pool = None
+
+    async def pool(self):
+        if self._pool is None:
+            self._pool = await aiomysql.create_pool(
+                host=self.config["host"],
+                port=self.config["port"],
+                user=self.config["user"],
+                password=self.config["password"],
+                db=self.config["database"],
+                minsize=self.minsize,
+                maxsize=self.maxsize,
+                charset="utf8mb4",
+                autocommit=False
+            )
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    @asynccontextmanager
+    async def cursor(self, dictionary: bool = False, streaming: bool = False):
+        """커넥션 획득 / commit / rollback / 반납을 처리하는 헬퍼"""
+        if streaming:
+            cursor_class = aiomysql.SSDictCursor if dictionary else aiomysql.SSCursor
+        else:
+            cursor_class = aiomysql.DictCursor if dictionary else aiomysql.Cursor
+
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            cursor = await conn.cursor(cursor_class)
+            try:
+                yield cursor
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+            finally:
+                await cursor.close()
+
+    async def fetchone(self, sql: str, args=None):
+        async with self.cursor(dictionary=True) as cursor:
+            await cursor.execute(sql, args)
+            return await cursor.fetchone()
+
+    async def fetchall(self, sql: str, args=None):
+        async with self.cursor(dictionary=True) as cursor:
+            await cursor.execute(sql, args)
+            return list(await cursor.fetchall())
+
+    async def execute(self, sql: str, args=None) -> int:
+        async with self.cursor() as cursor:
+            await cursor.execute(sql, args)
+            return cursor.lastrowid
+
+    async def executemany(self, sql: str, rows: list, batch_size: int = DB_BATCH_SIZE) -> int:
+        """rows 를 batch_size 씩 나눠서 하나의 트랜잭션으로 실행 (INSERT 는 multi-row VALUES 로 전송됨)"""
+        affected = 0
+        async with self.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                affected += await cursor.executemany(sql, rows[start:start + batch_size])
+        return affected
+
+    async def iter_batches(self, table: str, key: str, where: str = "", args: tuple = (),
+                           batch_size: int = DB_BATCH_SIZE):
+        """PK(key) 기준 keyset pagination. 배치(list[dict]) 단위로 yield"""
+        condition = f"AND {where}" if where else ""
+        last_key = None
+        while True:
+            if last_key is None:
+                sql = f"SELECT * FROM {table} WHERE 1=1 {condition} ORDER BY {key} LIMIT %s"
+                params = (*args, batch_size)
+            else:
+                sql = f"SELECT * FROM {table} WHERE {key} > %s {condition} ORDER BY {key} LIMIT %s"
+                params = (last_key, *args, batch_size)
+
+            rows = await self.fetchall(sql, params)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < batch_size:
+                return
+            last_key = rows[-1][key]
+
+    async def stream(self, sql: str, args=None):
+        """server-side cursor 로 결과를 한 행씩 스트리밍 (전체를 메모리에 올리지 않음)"""
+        async with self.cursor(dictionary=True, streaming=True) as cursor:
+            await cursor.execute(sql, args)
+            while True:
+                row = await cursor.fetchone()
+                if row is None:
+                    return
+                yield row
+
+    # ===================================
+    # USER TABLE
+    # ===================================
+
+    async def get_user_by_id(self, emp_id: str):
+        return await self.fetchone("SELECT * FROM user WHERE emp_id=%s", (emp_id,))
+
+    def iter_users(self, batch_size: int = DB_BATCH_SIZE):
+        return self.iter_batches("user", "emp_id", batch_size=batch_size)
+
+    async def add_user(self, emp_id, name, dept, role):
+        await self.execute(
+            "INSERT INTO user (emp_id, name, dept, role) VALUES (%s, %s, %s, %s)",
+            (emp_id, name, dept, role)
+        )
+
+    async def bulk_upsert_users(self, users: list) -> int:
+        """users: [{"emp_id", "name", "dept", "role"}, ...]"""
+        return await self.executemany(
+            "INSERT INTO user (emp_id, name, dept, role) VALUES (%s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE name=VALUES(name), dept=VALUES(dept), role=VALUES(role)",
+            [(u["emp_id"], u["name"], u.get("dept"), u.get("role")) for u in users]
+        )
+
+    async def delete_user(self, emp_id):
+        await self.execute("DELETE FROM user WHERE emp_id=%s", (emp_id,))
+
+    # ===================================
+    # API TABLE
+    # ===================================
+
+    async def get_api_by_id(self, api_id: int):
+        return await self.fetchone("SELECT * FROM api WHERE api_id=%s", (api_id,))
+
+    def iter_apis(self, batch_size: int = DB_BATCH_SIZE):
+        return self.iter_batches("api", "api_id", batch_size=batch_size)
+
+    async def add_api(self, api_name, endpoint, method, description=None):
+        return await self.execute(
+            "INSERT INTO api (name, endpoint, method, description) VALUES (%s, %s, %s, %s)",
+            (api_name, endpoint, method, description)
+        )
+
+    async def bulk_upsert_apis(self, apis: list) -> int:
+        """apis: [{"api_id"(없으면 신규), "name", "endpoint", "method", "description"}, ...]"""
+        return await self.executemany(
+            "INSERT INTO api (api_id, name, endpoint, method, description) VALUES (%s, %s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE name=VALUES(name), endpoint=VALUES(endpoint), "
+            "method=VALUES(method), description=VALUES(description)",
+            [(a.get("api_id"), a["name"], a["endpoint"], a.get("method", "GET"), a.get("description")) for a in apis]
+        )
+
+    async def delete_api(self, api_id):
+        await self.execute("DELETE FROM api WHERE api_id=%s", (api_id,))
+
+    # ===================================
+    # POLICY TABLE
+    # ===================================
+
+    async def get_policy_by_id(self, policy_id: int):
+        return await self.fetchone("SELECT * FROM policy WHERE policy_id=%s", (policy_id,))
+
+    def iter_policies(self, active_only: bool = False, batch_size: int = DB_BATCH_SIZE):
+        return self.iter_batches("policy", "policy_id", "is_active = TRUE" if active_only else "", batch_size=batch_size)
+
+    async def get_policies_updated_since(self, updated_at=None, policy_id=0, limit=DB_BATCH_SIZE):
+        """
+        (updated_at, policy_id) 기준 keyset pagination 으로 변경된 정책 조회.
+        마지막 행의 (updated_at, policy_id) 를 다음 호출에 넘기면 이어서 조회한다.
+        """
+        if updated_at is None:
+            return await self.fetchall(
+                "SELECT * FROM policy ORDER BY updated_at, policy_id LIMIT %s",
+                (limit,)
+            )
+        return await self.fetchall(
+            "SELECT * FROM policy WHERE updated_at > %s OR (updated_at = %s AND policy_id > %s) "
+            "ORDER BY updated_at, policy_id LIMIT %s",
+            (updated_at, updated_at, policy_id, limit)
+        )
+
+    async def add_policy(self, policy_name, api_id, emp_id, rego_code, is_active=True):
+        return await self.execute(
+            "INSERT INTO policy (policy_name, api_id, created_by, rego_code, is_active) VALUES (%s, %s, %s, %s, %s)",
+            (policy_name, api_id, emp_id, rego_code, is_active)
+        )
+
+    async def bulk_upsert_policies(self, policies: list) -> int:
+        """policies: [{"policy_id"(없으면 신규), "policy_name", "description", "api_id", "created_by", "rego_code", "is_active"}, ...]"""
+        return await self.executemany(
+            "INSERT INTO policy (policy_id, policy_name, description, api_id, created_by, rego_code, is_active) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE policy_name=VALUES(policy_name), description=VALUES(description), "
+            "api_id=VALUES(api_id), created_by=VALUES(created_by), rego_code=VALUES(rego_code), "
+            "is_active=VALUES(is_active)",
+            [
+                (p.get("policy_id"), p["policy_name"], p.get("description"), p.get("api_id"),
+                 p.get("created_by"), p.get("rego_code"), p.get("is_active", True))
+                for p in policies
+            ]
+        )
+
+    async def delete_policy(self, policy_id):
+        await self.execute("DELETE FROM policy WHERE policy_id=%s", (policy_id,))
+
+    # ===================================
+    # POLICY_BENCHMARK TABLES
+    # ===================================
+
+    async def add_benchmark(self, run: dict, corpus: str) -> int:
+        """
+        측정 1회를 corpus / 규칙별 결과와 함께 하나의 트랜잭션으로 저장
+
+        run: {"policy_id", "package", "policy_hash", "corpus_hash", "opa_version", "query", "inputs",
+              "ns_per_op", "allocs_per_op", "bytes_per_op", "rules": [{"name", "total_ns", "mean_ns", "p99_ns", "num_eval"}]}
+        """
+        async with self.cursor() as cursor:
+            await cursor.execute(
+                "INSERT IGNORE INTO policy_benchmark_corpus (corpus_hash, inputs) VALUES (%s, %s)",
+                (run["corpus_hash"], corpus)
+            )
+            await cursor.execute(
+                "INSERT INTO policy_benchmark (policy_id, package, policy_hash, corpus_hash, opa_version, query, "
+                "inputs, ns_per_op, allocs_per_op, bytes_per_op) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                (run.get("policy_id"), run.get("package"), run["policy_hash"], run["corpus_hash"], run["opa_version"],
+                 run.get("query"), run.get("inputs"), run["ns_per_op"], run.get("allocs_per_op"), run.get("bytes_per_op"))
+            )
+            benchmark_id = cursor.lastrowid
+            if run.get("rules"):
+                await cursor.executemany(
+                    "INSERT INTO policy_benchmark_rule (benchmark_id, rule_name, total_ns, mean_ns, p99_ns, num_eval) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                    [(benchmark_id, r["name"], r["total_ns"], r["mean_ns"], r["p99_ns"], r["num_eval"]) for r in run["rules"]]
+                )
+        return benchmark_id
+
+    async def get_benchmarks(self, policy_id: int = None, package: str = None, corpus_hash: str = None,
+                             opa_version: str = None, limit: int = 20) -> list:
+        """
+        정책(policy_id, 없으면 package)의 측정 이력을 최신순으로 조회. 각 행에 "rules" 목록 포함
+        """
+        conditions, args = [], []
+        if policy_id is not None:
+            conditions.append("policy_id = %s")
+            args.append(policy_id)
+        elif package:
+            conditions.append("package = %s")
+            args.append(package)
+        if corpus_hash:
+            conditions.append("corpus_hash = %s")
+            args.append(corpus_hash)
+        if opa_version:
+            conditions.append("opa_version = %s")
+            args.append(opa_version)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        runs = await self.fetchall(
+            f"SELECT * FROM policy_benchmark {where} ORDER BY created_at DESC, benchmark_id DESC LIMIT %s",
+            (*args, limit)
+        )
+        if runs:
+            ids = [run["benchmark_id"] for run in runs]
+            rules = await self.fetchall(
+                f"SELECT * FROM policy_benchmark_rule WHERE benchmark_id IN ({', '.join(['%s'] * len(ids))})",
+                tuple(ids)
+            )
+            by_run = {}
+            for rule in rules:
+                by_run.setdefault(rule["benchmark_id"], []).append(rule)
+            for run in runs:
+                run["rules"] = by_run.get(run["benchmark_id"], [])
+        return runs
+
+    async def get_benchmark_corpus(self, corpus_hash: str):
+        row = await self.fetchone("SELECT inputs FROM policy_benchmark_corpus WHERE corpus_hash=%s", (corpus_hash,))
+        return row["inputs"] if row else None
+
+
+# 비동기 호출부(MCP tool 등)가 사용하는 기본 인스턴스
+repository = MariaDBRepository()
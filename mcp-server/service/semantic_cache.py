@@ -0,0 +1,121 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+from collections import Counter
+
+from qdrant_client import models
+
+# ===================================
+# Semantic cache 설정
+# ===================================
+SEMANTIC_CACHE_COLLECTION = os.getenv("SEMANTIC_CACHE_COLLECTION", "policy_cache")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 7 * 24 * 3600))
+# 프롬프트나 생성 방식이 바뀌면 올려서 이전 항목을 무효화
+SEMANTIC_CACHE_VERSION = os.getenv("SEMANTIC_CACHE_VERSION", "v1")
+# threshold 이상인 후보 중 숫자 / 부정 표현까지 같은 항목을 찾을 때 살펴볼 개수
+SEMANTIC_CACHE_CANDIDATES = int(os.getenv("SEMANTIC_CACHE_CANDIDATES", 5))
+# hashing 같은 표면 유사도 임베딩으로도 캐시를 쓸지 (테스트 / 벤치마크 전용)
+SEMANTIC_CACHE_ALLOW_LEXICAL = os.getenv("SEMANTIC_CACHE_ALLOW_LEXICAL", "false").lower() in ("1", "true", "yes")
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+# 정책의 뜻을 뒤집는 표현. 유사도가 높아도 이 표현들이 다르면 다른 요청으로 본다
+_NEGATION_RE = re.compile(
+    r"\b(?:not|no|never|none|nor|deny|denied|disallow\w*|forbid\w*|prohibit\w*|block\w*|reject\w*"
+    r"|except|excluding|without|unless|\w+n't)\b"
+    r"|불|않|못|없|금지|거부|거절|차단|제외|아니|아닌|말고|외에",
+    re.IGNORECASE
+)
+
+
+def guard_terms(text: str) -> tuple:
+    """요청의 숫자와 부정 표현 (임베딩 유사도와 별개로 정확히 같아야 캐시 hit)"""
+    numbers = sorted(number.replace(",", "") for number in _NUMBER_RE.findall(text))
+    negations = sorted(Counter(match.lower() for match in _NEGATION_RE.findall(text)).items())
+    return tuple(numbers), tuple(negations)
+
+
+class SemanticPolicyCache:
+    """
+    사용자 요청 문장의 임베딩 유사도로 이전에 검증된 Rego 정책을 재사용하는 캐시.
+
+    항목에는 version 과 created_at 이 저장되며, 조회 시 현재 version 이면서
+    TTL 안에 만들어진 항목만 대상으로 한다.
+    유사도가 threshold 이상이어도 숫자와 부정 표현("불가능", "not", ...)이 요청과 정확히 같은 항목만 hit 이다.
+
+    임베딩이 semantic 하지 않으면 (HashingEmbedder) 뜻이 반대인 요청도 유사도가 높게 나오므로
+    SEMANTIC_CACHE_ALLOW_LEXICAL 이 아닌 한 캐시를 쓰지 않는다 (enabled = False).
+    """
+
+    def __init__(self, qdrant, embedder, collection: str = SEMANTIC_CACHE_COLLECTION,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL,
+                 version: str = SEMANTIC_CACHE_VERSION):
+        self.qdrant = qdrant
+        self.embedder = embedder
+        self.collection = collection
+        self.threshold = threshold
+        self.ttl = ttl
+        # 임베딩 종류가 바뀌면 벡터 공간이 달라지므로 version 에 포함
+        self.version = f"{version}:{embedder.name}"
+        self.enabled = getattr(embedder, "semantic", False) or SEMANTIC_CACHE_ALLOW_LEXICAL
+        self._ready = False
+
+    def _ensure_collection(self, vector_size: int):
+        if not self._ready:
+            self.qdrant.ensure_collection(self.collection, vector_size, payload_indexes={
+                "version": models.PayloadSchemaType.KEYWORD,
+                "created_at": models.PayloadSchemaType.FLOAT,
+            })
+            self._ready = True
+
+    def _point_id(self, user_request: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.version}\0{user_request.strip()}"))
+
+    async def lookup(self, user_request: str):
+        """
+        Returns:
+            dict | None: {"rego_code", "request", "score"} (threshold 이상이고 숫자 / 부정 표현이 같은
+                         가장 유사한 항목)
+        """
+        if not self.enabled:
+            return None
+        vector = await self.embedder.aembed(user_request)
+        await asyncio.to_thread(self._ensure_collection, len(vector))
+
+        query_filter = models.Filter(must=[
+            models.FieldCondition(key="version", match=models.MatchValue(value=self.version)),
+            models.FieldCondition(key="created_at", range=models.Range(gte=time.time() - self.ttl)),
+        ])
+        hits = await asyncio.to_thread(
+            self.qdrant.search, self.collection, vector,
+            limit=SEMANTIC_CACHE_CANDIDATES, query_filter=query_filter, score_threshold=self.threshold
+        )
+        guard = guard_terms(user_request)
+        for hit in hits:
+            if guard_terms(hit.payload["request"]) == guard:
+                return {
+                    "rego_code": hit.payload["rego_code"],
+                    "request": hit.payload["request"],
+                    "score": hit.score,
+                }
+        return None
+
+    async def store(self, user_request: str, rego_code: str):
+        if not self.enabled:
+            return
+        vector = await self.embedder.aembed(user_request)
+        await asyncio.to_thread(self._ensure_collection, len(vector))
+
+        point = models.PointStruct(
+            id=self._point_id(user_request),
+            vector=vector,
+            payload={
+                "request": user_request,
+                "rego_code": rego_code,
+                "version": self.version,
+                "created_at": time.time(),
+            }
+        )
+        await asyncio.to_thread(self.qdrant.upsert, self.collection, [point])
@@ -0,0 +1,118 @@
+import os
+import time
+import logging
+import contextvars
+
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# ===================================
+# Trace ID / 로깅
+# ===================================
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# MCP 요청 _meta.trace_id (mcp-client 가 FastAPI 요청마다 발급) 를 요청 처리 동안 보관
+trace_id_var = contextvars.ContextVar("trace_id", default="-")
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record):
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s"
+    )
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceIdFilter())
+
+# ===================================
+# Prometheus metrics
+# ===================================
+TOOL_CALLS = Counter(
+    "mcp_tool_calls_total", "MCP tool calls", ["tool", "status"]
+)
+TOOL_SECONDS = Histogram(
+    "mcp_tool_duration_seconds", "MCP tool execution time", ["tool"]
+)
+OPA_SUBPROCESS_SECONDS = Histogram(
+    "opa_subprocess_duration_seconds", "opa CLI subprocess time", ["command", "status"]
+)
+PRELINT_RESULTS = Counter(
+    "rego_prelint_total", "In-process Rego pre-lint outcomes before invoking OPA", ["result"]
+)
+OPA_HTTP_SECONDS = Histogram(
+    "opa_http_request_duration_seconds", "OPA REST API request time", ["method", "endpoint", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+
+def metrics_response():
+    """/metrics 응답 본문과 content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def _request_trace_id(lowlevel_server, request) -> str:
+    """_meta.trace_id (직접 호출) → X-Trace-Id HTTP 헤더 (agent tool 호출) 순서로 확인"""
+    meta = request.params.meta
+    trace_id = (meta.model_extra or {}).get("trace_id") if meta else None
+    if trace_id:
+        return trace_id
+    try:
+        http_request = lowlevel_server.request_context.request
+    except LookupError:
+        return "-"
+    return http_request.headers.get("x-trace-id", "-") if http_request is not None else "-"
+
+
+def instrument_tools(server):
+    """
+    FastMCP 서버의 tools/call 처리 전체를 감싸서
+    - 요청의 trace id 를 trace_id_var 에 설정하고
+    - tool 별 호출 수 / 처리 시간을 기록한다.
+    """
+    from mcp import types
+
+    logger = logging.getLogger("mcp_server.tools")
+    handlers = server._mcp_server.request_handlers
+    handle_call_tool = handlers[types.CallToolRequest]
+
+    async def traced(request: types.CallToolRequest):
+        token = trace_id_var.set(_request_trace_id(server._mcp_server, request))
+        tool = request.params.name
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await handle_call_tool(request)
+            status = "error" if getattr(result.root, "isError", False) else "ok"
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            TOOL_CALLS.labels(tool, status).inc()
+            TOOL_SECONDS.labels(tool).observe(elapsed)
+            logger.info("tool=%s status=%s duration=%.4fs", tool, status, elapsed)
+            trace_id_var.reset(token)
+
+    handlers[types.CallToolRequest] = traced
+
+
+def _http_endpoint(path: str) -> str:
+    # /v1/policies/<id>, /v1/data/<path> → label cardinality 를 낮추기 위해 앞 2단계만 사용
+    return "/".join(path.split("/")[:3])
+
+
+async def _on_request(request):
+    request.extensions["started"] = time.perf_counter()
+
+
+async def _on_response(response):
+    request = response.request
+    OPA_HTTP_SECONDS.labels(
+        request.method, _http_endpoint(request.url.path), str(response.status_code)
+    ).observe(time.perf_counter() - request.extensions["started"])
+
+
+# OPA REST 용 httpx.AsyncClient(event_hooks=...) 에 넘기는 hook
+OPA_HTTP_HOOKS = {"request": [_on_request], "response": [_on_response]}
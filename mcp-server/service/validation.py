@@ -0,0 +1,152 @@
+import re
+import json
+import time
+
+from service.executor import get_executor
+from service.opa import POLICY_FILENAME, TEST_FILENAME, get_opa_version
+from service.batch import parse_errors, parse_test_case, parse_package, format_file_errors
+from service.lint import prelint_pair, requires_if
+
+_TEST_RULE_RE = re.compile(r"^\s*(test_\w+)\b(?=[^\n]*(?:\bif\b|\{|:?=))", re.MULTILINE)
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+def _expand_lines(ranges: list) -> list:
+    """coverage 리포트의 [{"start": {"row"}, "end": {"row"}}] 범위를 줄 번호 목록으로 변환"""
+    lines = []
+    for span in ranges or []:
+        start = (span.get("start") or {}).get("row")
+        end = (span.get("end") or {}).get("row", start)
+        if start:
+            lines.extend(range(start, (end or start) + 1))
+    return sorted(set(lines))
+
+
+def _passed_tests(test_code: str) -> list:
+    """모든 테스트가 통과했을 때 test_code 에 정의된 테스트 규칙을 parse_test_case 형태로 나열"""
+    package = parse_package(test_code)
+    names = dict.fromkeys(_TEST_RULE_RE.findall(test_code))
+    return [{"name": name, "package": f"data.{package}" if package else None, "passed": True,
+             "duration_ns": None, "error": None} for name in names]
+
+
+def parse_coverage(stdout: str, filename: str = POLICY_FILENAME) -> dict:
+    """
+    `opa test --coverage --format json` 출력에서 filename 의 coverage 추출
+
+    Returns:
+        dict: {"coverage": float (0~100), "uncovered_lines": [int, ...]}
+    """
+    try:
+        report = json.loads(stdout)
+    except ValueError:
+        return {"coverage": 0.0, "uncovered_lines": []}
+
+    files = report.get("files") or {}
+    entry = next((value for path, value in files.items() if path.rsplit("/", 1)[-1] == filename), {})
+    return {
+        "coverage": round(float(entry.get("coverage", 0.0)), 2),
+        "uncovered_lines": _expand_lines(entry.get("not_covered")),
+    }
+
+
+async def validate_and_test(policy_code: str, test_code: str) -> dict:
+    """
+    하나의 워크스페이스에서 fmt → check → test(+coverage) 를 순서대로 실행
+
+    - pre-lint 로 확실한 문법 오류는 opa 실행 없이 거절 (안전한 auto-fix 는 적용)
+    - `opa fmt -w` 로 두 파일을 정리 (파싱이 안 되면 원본 그대로 두고 check 에서 에러 보고)
+    - `opa check` 로 컴파일/타입 검사, 실패하면 테스트는 실행하지 않음
+    - `opa test --coverage` 한 번으로 테스트와 coverage 를 구함. coverage 출력에는 테스트별 결과가 없으므로
+      모두 통과하면 테스트 목록은 test_code 의 테스트 규칙으로 만들고 (duration_ns 없음),
+      실패한 테스트가 있을 때만 실패 내용을 얻기 위해 `opa test --format json` 을 한 번 더 실행
+
+    Returns:
+        dict: {"status", "detail", "is_valid", "error_message", "formatted_policy", "formatted_test",
+               "tests", "passed", "failed", "coverage", "uncovered_lines", "timings_ms"}
+    """
+    report = {
+        "status": "fail",
+        "detail": "",
+        "is_valid": False,
+        "error_message": "",
+        "formatted_policy": policy_code,
+        "formatted_test": test_code,
+        "tests": [],
+        "passed": 0,
+        "failed": 0,
+        "coverage": 0.0,
+        "uncovered_lines": [],
+        "timings_ms": {"fmt": 0.0, "check": 0.0, "test": 0.0, "total": 0.0},
+    }
+    timings = report["timings_ms"]
+    total_started = time.perf_counter()
+
+    # 확실히 잘못된 코드는 opa 를 띄우지 않고 거절
+    policy_code, test_code, error_message = prelint_pair(policy_code, test_code, requires_if(await get_opa_version()))
+    report.update(formatted_policy=policy_code, formatted_test=test_code)
+    if error_message:
+        report.update(detail=error_message, error_message=error_message)
+        timings["total"] = _elapsed_ms(total_started)
+        return report
+
+    files = {POLICY_FILENAME: policy_code, TEST_FILENAME: test_code}
+    async with get_executor().workspace(files) as ws:
+        started = time.perf_counter()
+        fmt = await ws.run(["fmt", "-w", POLICY_FILENAME, TEST_FILENAME])
+        timings["fmt"] = _elapsed_ms(started)
+        if fmt.ok:
+            report["formatted_policy"] = ws.read(POLICY_FILENAME)
+            report["formatted_test"] = ws.read(TEST_FILENAME)
+
+        started = time.perf_counter()
+        check = await ws.run(["check", "--format", "json", "--max-errors=-1", POLICY_FILENAME, TEST_FILENAME])
+        timings["check"] = _elapsed_ms(started)
+        if check.timed_out or check.returncode != 0:
+            timings["total"] = _elapsed_ms(total_started)
+            if check.timed_out:
+                report.update(status="error", detail=check.stderr, error_message=check.stderr)
+            else:
+                error_message = format_file_errors(parse_errors(check))
+                report.update(detail=error_message, error_message=error_message)
+            return report
+        report["is_valid"] = True
+
+        started = time.perf_counter()
+        coverage = await ws.run(["test", "--coverage", "--format", "json", POLICY_FILENAME, TEST_FILENAME])
+        cases = None
+        if not coverage.timed_out and coverage.returncode != 0:
+            cases = await ws.run(["test", "--format", "json", POLICY_FILENAME, TEST_FILENAME])
+        timings["test"] = _elapsed_ms(started)
+
+    timings["total"] = _elapsed_ms(total_started)
+    if coverage.timed_out or (cases is not None and cases.timed_out):
+        report.update(status="error", detail=(cases or coverage).stderr)
+        return report
+
+    report.update(parse_coverage(coverage.stdout))
+    if cases is None:
+        tests = _passed_tests(test_code)
+    else:
+        try:
+            parsed = json.loads(cases.stdout)
+        except ValueError:
+            parsed = None
+        if not isinstance(parsed, list):
+            report["detail"] = format_file_errors(parse_errors(cases)) or "OPA test failed."
+            return report
+        tests = [parse_test_case(case) for case in parsed]
+
+    failed = [test["name"] for test in tests if not test["passed"]]
+    report.update(tests=tests, passed=len(tests) - len(failed), failed=len(failed))
+
+    if not tests:
+        report["detail"] = "no tests found"
+    elif failed:
+        report["detail"] = f"PASS: {report['passed']}/{len(tests)}, FAIL: {', '.join(failed)}"
+    else:
+        report.update(status="success", detail=f"PASS: {report['passed']}/{len(tests)}")
+    return report
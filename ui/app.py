@@ -1,3 +1,4 @@
+import json
 import streamlit as st
 import requests
 
@@ -6,21 +7,66 @@ st.title("User Policy Generator (MCP)")
 user_id = st.text_input("User ID", "E12345")
 query_text = st.text_area("Enter policy request", "")
 
-MCP_CLIENT_API = "http://mcp-client:8000/generate_policy"
+MCP_CLIENT_API = "http://mcp-client:8000/generate_policy/stream"
+
+
+def iter_sse(response):
+    """Server-Sent Events 응답을 (event, data) 단위로 읽기"""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
 
 if st.button("Fetch User Policy via MCP"):
     if query_text:
         st.info("Sending request via MCP...")
+        status = st.empty()
+        draft = st.empty()
+        log = st.container()
         try:
-            response = requests.post(
+            # 연결 timeout 10초, 이후에는 이벤트 사이 간격 기준으로 최대 120초 대기
+            with requests.post(
                 MCP_CLIENT_API,
-                json={"query": query_text, "emp_id": user_id},
-                timeout=10
-            )
-            if response.status_code == 200:
-                st.success("Policy fetched successfully!")
-                st.json(response.json())
-            else:
-                st.error(f"Error: {response.status_code} - {response.text}")
+                json={"request": query_text, "emp_id": user_id},
+                stream=True,
+                timeout=(10, 120)
+            ) as response:
+                if response.status_code != 200:
+                    st.error(f"Error: {response.status_code} - {response.text}")
+                else:
+                    text, attempt = "", None
+                    for event, data in iter_sse(response):
+                        if event == "token":
+                            if data["attempt"] != attempt:
+                                text, attempt = "", data["attempt"]
+                                status.write(f"Generating (attempt {attempt})...")
+                            text += data["text"]
+                            draft.code(text)
+                        elif event == "tool_call":
+                            status.write(f"Calling `{data['name']}`...")
+                        elif event == "validation":
+                            if data["is_valid"]:
+                                log.success(f"Attempt {data['attempt']}: opa check passed")
+                            else:
+                                log.warning(f"Attempt {data['attempt']}: {data['error_message']}")
+                        elif event == "result":
+                            status.empty()
+                            if data["success"]:
+                                st.success("Policy fetched successfully!")
+                                draft.code(data["policy"], language="rego")
+                            else:
+                                st.error("Policy generation failed.")
+                            st.json(data)
+                        elif event == "error":
+                            st.error(f"Request failed: {data['detail']}")
         except Exception as e:
             st.error(f"Request failed: {str(e)}")